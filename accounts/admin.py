@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import CustomUser, Wallet, Transaction
+from .models import CustomUser, Wallet, Transaction, OutboxEmail, LedgerEntry, BalanceCheckpoint, IdempotencyKey, TransactionArchive
 
 class CustomUserAdmin(UserAdmin):
     model = CustomUser
@@ -26,7 +26,7 @@ from .models import Wallet
 
 @admin.register(Wallet)
 class WalletAdmin(admin.ModelAdmin):
-    list_display = ('user', 'wallet_number', 'balance')
+    list_display = ('user', 'wallet_number', 'balance', 'shard_count')
     search_fields = ('user__email', 'wallet_number')
 
 
@@ -38,3 +38,49 @@ class TransactionAdmin(admin.ModelAdmin):
     ordering = ('-timestamp',)
 
 
+@admin.register(OutboxEmail)
+class OutboxEmailAdmin(admin.ModelAdmin):
+    list_display = ('to_email', 'subject', 'status', 'attempts', 'next_attempt_at', 'sent_at')
+    search_fields = ('to_email', 'subject')
+    list_filter = ('status',)
+    ordering = ('-created_at',)
+
+
+@admin.register(LedgerEntry)
+class LedgerEntryAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'entry_type', 'account', 'amount', 'journal_id', 'reference')
+    search_fields = ('account', 'journal_id', 'reference')
+    list_filter = ('entry_type',)
+    ordering = ('-created_at', '-id')
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(BalanceCheckpoint)
+class BalanceCheckpointAdmin(admin.ModelAdmin):
+    list_display = ('wallet', 'as_of', 'balance')
+    search_fields = ('wallet__wallet_number',)
+    ordering = ('-as_of',)
+
+
+@admin.register(IdempotencyKey)
+class IdempotencyKeyAdmin(admin.ModelAdmin):
+    list_display = ('key', 'user', 'status', 'response_status', 'claimed_at', 'expires_at')
+    search_fields = ('key', 'user__email')
+    list_filter = ('status',)
+    ordering = ('-claimed_at',)
+
+
+@admin.register(TransactionArchive)
+class TransactionArchiveAdmin(admin.ModelAdmin):
+    list_display = ('user', 'month', 'row_count', 'updated_at')
+    search_fields = ('user__email',)
+    ordering = ('-month',)
+    exclude = ('payload',)
+
+    def has_change_permission(self, request, obj=None):
+        return False
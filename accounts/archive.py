@@ -0,0 +1,199 @@
+"""
+Cold storage for old transactions.
+
+Transactions older than ``TRANSACTION_ARCHIVE_AFTER_DAYS`` (rounded down to
+the start of a month) are moved out of the Transaction table into
+TransactionArchive rows: one per user per month, holding that month's
+transactions as zlib-compressed JSON in the shape TransactionSerializer
+produces, newest first. A transfer is stored twice, once in the sender's
+month as outgoing and once in the receiver's as incoming, so reading a
+user's month is one row fetch and one decompression. A transfer to
+oneself is stored once, as outgoing, marked with SELF_TRANSFER (never
+returned by ``read()``) so the rollups still count its incoming side.
+
+The hot table only ever holds recent months, which keeps its indexes and
+vacuum cost bounded by traffic rather than by history. Party names are
+captured as they were when the month was archived. Statement exports read
+archived months alongside the hot table (see statements.py); search does
+not: a transaction's SearchDocuments are deleted with it, so archived
+transactions are deliberately left out of search.
+
+Archiving goes one month at a time: the month's transactions are read in
+batches, grouped per party, written with a single archive write per user
+and deleted, all in one transaction, so a transfer is always either hot
+or archived, never both or neither, and a busy user's month is compressed
+once rather than once per batch. Memory is bounded by one month's rows.
+"""
+import json
+import zlib
+from collections import defaultdict
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Value
+from django.utils import timezone
+
+from .models import Transaction, TransactionArchive
+from .serializers import TRANSACTION_ROWS
+
+ARCHIVE_AFTER_DAYS = getattr(settings, 'TRANSACTION_ARCHIVE_AFTER_DAYS', 400)
+BATCH_SIZE = 5000
+COMPRESSION_LEVEL = 6
+SELF_TRANSFER = 'self_transfer'
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def cutoff(older_than_days=None):
+    """Start of the month (in the current timezone) before which transactions are cold."""
+    days = ARCHIVE_AFTER_DAYS if older_than_days is None else older_than_days
+    return local_midnight(month_start(timezone.localdate() - timedelta(days=days)))
+
+
+def compress(rows):
+    return zlib.compress(json.dumps(rows, separators=(',', ':')).encode(), COMPRESSION_LEVEL)
+
+
+def decompress(payload):
+    return json.loads(zlib.decompress(bytes(payload)))
+
+
+def sort_key(row):
+    return datetime.fromisoformat(row['timestamp']), row['transaction_id']
+
+
+def next_month(day):
+    return (month_start(day) + timedelta(days=32)).replace(day=1)
+
+
+def local_midnight(day):
+    return timezone.make_aware(datetime.combine(day, datetime.min.time()))
+
+
+def archive_before(before, batch_size=BATCH_SIZE):
+    """
+    Move every transaction with ``timestamp < before`` into the archive, one
+    month per database transaction, reading ``batch_size`` rows at a time.
+    Returns ``(transactions, chunks)``: rows moved and archive rows written.
+    """
+    moved = written = 0
+    cold = Transaction.objects.filter(timestamp__lt=before)
+    while True:
+        oldest = cold.order_by('timestamp').values_list('timestamp', flat=True).first()
+        if oldest is None:
+            break
+        month = month_start(timezone.localdate(oldest))
+        in_month = cold.filter(timestamp__gte=local_midnight(month), timestamp__lt=local_midnight(next_month(month)))
+        with transaction.atomic():
+            chunks = defaultdict(list)
+            ids = []
+            while True:
+                batch = in_month.filter(id__gt=ids[-1]) if ids else in_month
+                rows = list(TRANSACTION_ROWS.values(
+                    batch.order_by('id').annotate(
+                        sender_full_name=F('sender__full_name'),
+                        receiver_full_name=F('receiver__full_name'),
+                        transaction_direction=Value('outgoing'),
+                    )[:batch_size],
+                    'id', 'sender_id', 'receiver_id',
+                ))
+                if not rows:
+                    break
+                group(rows, month, chunks)
+                ids += [row['id'] for row in rows]
+            written += merge(chunks)
+            for start in range(0, len(ids), batch_size):
+                Transaction.objects.filter(id__in=ids[start:start + batch_size]).delete()
+        moved += len(ids)
+    return moved, written
+
+
+def group(rows, month, chunks):
+    """Add ``.values()`` rows from ``month`` to ``chunks[(user_id, month)]``, once per party."""
+    for row, api in zip(rows, TRANSACTION_ROWS.many(rows)):
+        if row['receiver_id'] == row['sender_id']:
+            api[SELF_TRANSFER] = True
+        else:
+            chunks[(row['receiver_id'], month)].append(dict(api, transaction_direction='incoming'))
+        chunks[(row['sender_id'], month)].append(api)
+
+
+def merge(chunks):
+    """Write ``{(user_id, month): rows}`` into the monthly archives; returns chunks written."""
+    existing = {
+        (chunk.user_id, chunk.month): chunk
+        for chunk in TransactionArchive.objects.select_for_update().filter(
+            user_id__in={user_id for user_id, _ in chunks}, month__in={month for _, month in chunks},
+        )
+    }
+    created = []
+    for key, new_rows in chunks.items():
+        chunk = existing.get(key)
+        if chunk is None:
+            new_rows.sort(key=sort_key, reverse=True)
+            created.append(TransactionArchive(
+                user_id=key[0], month=key[1], row_count=len(new_rows), payload=compress(new_rows),
+            ))
+            continue
+        merged = decompress(chunk.payload) + new_rows
+        merged.sort(key=sort_key, reverse=True)
+        chunk.payload = compress(merged)
+        chunk.row_count = len(merged)
+        chunk.save(update_fields=['payload', 'row_count', 'updated_at'])
+    TransactionArchive.objects.bulk_create(created)
+    return len(chunks)
+
+
+def months(user):
+    """``[(month, row_count)]`` archived for ``user``, newest first."""
+    return list(TransactionArchive.objects.filter(user=user).order_by('-month').values_list('month', 'row_count'))
+
+
+def read(user, month):
+    """``user``'s archived transactions for ``month``, newest first, or None if there are none."""
+    payload = TransactionArchive.objects.filter(user=user, month=month_start(month)).values_list('payload', flat=True).first()
+    if payload is None:
+        return None
+    rows = decompress(payload)
+    for row in rows:
+        row.pop(SELF_TRANSFER, None)
+    return rows
+
+
+def read_between(user, first, last):
+    """``(month, rows)`` for ``user``'s archived months from ``first`` to ``last``, oldest month first."""
+    chunks = (
+        TransactionArchive.objects.filter(user=user, month__gte=month_start(first), month__lte=last)
+        .order_by('month').values_list('month', 'payload')
+    )
+    for month, payload in chunks.iterator():
+        rows = decompress(payload)
+        for row in rows:
+            row.pop(SELF_TRANSFER, None)
+        yield month, rows
+
+
+def archived_movements(since=None, until=None):
+    """
+    ``(user_id, timestamp, direction, amount)`` for archived transfers on
+    days in ``[since, until]``, as rollups.rebuild() needs them.
+    """
+    chunks = TransactionArchive.objects.all()
+    if since:
+        chunks = chunks.filter(month__gte=month_start(since))
+    if until:
+        chunks = chunks.filter(month__lte=until)
+    for user_id, payload in chunks.values_list('user_id', 'payload').iterator():
+        for row in decompress(payload):
+            timestamp = datetime.fromisoformat(row['timestamp'])
+            day = timezone.localdate(timestamp)
+            if (since and day < since) or (until and day > until):
+                continue
+            yield user_id, timestamp, row['transaction_direction'], Decimal(row['amount'])
+            if row.get(SELF_TRANSFER):
+                # The hot path counts a transfer to oneself both ways.
+                yield user_id, timestamp, 'incoming', Decimal(row['amount'])
@@ -0,0 +1,129 @@
+"""
+JWT authentication with the user (and their wallet) cached per token subject.
+
+simplejwt's ``JWTAuthentication`` loads the user on every request, and most
+views then lazy-load ``request.user.wallet`` too. ``CachedJWTAuthentication``
+keeps both in the Django cache for ``AUTH_USER_CACHE_TIMEOUT`` seconds.
+Entries are dropped by signal receivers in models.py when a user or wallet
+is saved, and by the transfer services whenever they change a balance with
+an UPDATE (which sends no signals).
+
+Only a snapshot of USER_FIELDS and WALLET_FIELDS is cached, never the
+password hash or PIN; the user is rebuilt from it with every other field
+deferred, so code reading e.g. ``user.pin`` loads that field on demand.
+
+Dropping an entry only helps if every worker reads the same cache: with a
+per-process backend (locmem, the default) another worker would keep
+authenticating a deactivated user until the entry expired. Caching is
+therefore off unless ``AUTH_USER_CACHE_ALIAS`` names a shared backend, or
+``AUTH_USER_CACHE_SINGLE_PROCESS`` says there is only one process.
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .models import Wallet
+
+CACHE_ALIAS = getattr(settings, 'AUTH_USER_CACHE_ALIAS', 'default')
+CACHE_TIMEOUT = getattr(settings, 'AUTH_USER_CACHE_TIMEOUT', 60)
+
+PER_PROCESS_BACKENDS = {
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+}
+# What authentication, the permission checks and the user/wallet info views read.
+USER_FIELDS = ['id', 'email', 'full_name', 'business_type', 'is_active', 'is_staff', 'is_superuser', 'version']
+WALLET_FIELDS = ['id', 'user_id', 'wallet_number', 'balance', 'shard_count', 'version']
+
+
+def cache_key(user_id):
+    return f'auth-user:{user_id}'
+
+
+def shared_cache():
+    """The cache to keep users in, or None if caching is off (see above)."""
+    if getattr(settings, 'AUTH_USER_CACHE_SINGLE_PROCESS', False):
+        return caches[CACHE_ALIAS]
+    if settings.CACHES[CACHE_ALIAS]['BACKEND'] in PER_PROCESS_BACKENDS:
+        return None
+    return caches[CACHE_ALIAS]
+
+
+def forget_cached_users(*user_ids):
+    """
+    Drop the cached users now and again once the current transaction
+    commits, so a request that re-cached the old row in between doesn't
+    keep it.
+    """
+    keys = [cache_key(user_id) for user_id in set(user_ids)]
+    cache = shared_cache()
+    if not keys or cache is None:
+        return
+    cache.delete_many(keys)
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def snapshot(user):
+    """The cache entry for ``user``, loaded with ``select_related('wallet')``."""
+    wallet = getattr(user, 'wallet', None)
+    return {
+        'user': [getattr(user, field) for field in USER_FIELDS],
+        'wallet': [getattr(wallet, field) for field in WALLET_FIELDS] if wallet else None,
+        # A digest of the hash, as carried in tokens, not the hash itself.
+        'password': get_md5_hash_password(user.password) if api_settings.CHECK_REVOKE_TOKEN else None,
+    }
+
+
+def _from_snapshot(model, field_names, values):
+    # from_db() wants the loaded values in the model's field order.
+    loaded = dict(zip(field_names, values))
+    names = [f.attname for f in model._meta.concrete_fields if f.attname in loaded]
+    return model.from_db('default', names, [loaded[name] for name in names])
+
+
+def restore(user_model, entry):
+    """A user (and wallet) with the snapshot's fields loaded and the rest deferred."""
+    user = _from_snapshot(user_model, USER_FIELDS, entry['user'])
+    if entry['wallet'] is not None:
+        wallet = _from_snapshot(Wallet, WALLET_FIELDS, entry['wallet'])
+        Wallet.user.field.set_cached_value(wallet, user)
+        Wallet.user.field.remote_field.set_cached_value(user, wallet)
+    return user
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        cache = shared_cache()
+        if cache is None:
+            return super().get_user(validated_token)
+
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        entry = cache.get(cache_key(user_id))
+        if entry is None:
+            try:
+                user = self.user_model.objects.select_related('wallet').get(**{api_settings.USER_ID_FIELD: user_id})
+            except self.user_model.DoesNotExist:
+                raise AuthenticationFailed(_("User not found"), code="user_not_found")
+            entry = snapshot(user)
+            cache.set(cache_key(user_id), entry, CACHE_TIMEOUT)
+        else:
+            user = restore(self.user_model, entry)
+
+        # The same checks JWTAuthentication makes, applied to cached users too.
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != entry['password']:
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+
+        return user
@@ -0,0 +1,79 @@
+"""
+Sharded balances for hot wallets.
+
+A wallet that receives a flood of credits would otherwise serialise every
+one of them on its single ``Wallet`` row lock. With sharding enabled
+(``Wallet.shard_count > 0``) each credit instead lands on a randomly chosen
+``WalletBalanceShard`` row, so N shards take roughly N concurrent credits.
+Debits still come out of ``Wallet.balance``; ``fold()`` merges the shards
+back into it, either on demand when a debit needs the money or from the
+periodic ``fold_balance_shards`` command.
+"""
+import random
+
+from django.db import transaction
+from django.db.models import F, Sum
+
+from .authentication import forget_cached_users
+from .models import Wallet, WalletBalanceShard
+
+
+def credit_shard(wallet_pk, amount, shard_count):
+    """
+    Add ``amount`` to a random shard of the wallet. Returns False if the
+    shard has gone away (sharding was just turned off), in which case the
+    caller must credit ``Wallet.balance`` instead.
+    """
+    shard = random.randrange(shard_count)
+    updated = WalletBalanceShard.objects.filter(wallet_id=wallet_pk, shard=shard).update(
+        balance=F('balance') + amount, version=F('version') + 1,
+    )
+    return bool(updated)
+
+
+def shard_total(wallet_pk):
+    return WalletBalanceShard.objects.filter(wallet_id=wallet_pk).aggregate(total=Sum('balance'))['total'] or 0
+
+
+def fold(wallet_pk):
+    """Move everything held in the wallet's shards into ``Wallet.balance``."""
+    with transaction.atomic():
+        balances = list(
+            WalletBalanceShard.objects.select_for_update(no_key=True)
+            .filter(wallet_id=wallet_pk)
+            .order_by('shard')
+            .values_list('balance', flat=True)
+        )
+        total = sum(balances)
+        if total:
+            WalletBalanceShard.objects.filter(wallet_id=wallet_pk).update(balance=0, version=F('version') + 1)
+            Wallet.objects.filter(pk=wallet_pk).update(balance=F('balance') + total, version=F('version') + 1)
+            forget_cached_users(*Wallet.objects.filter(pk=wallet_pk).values_list('user_id', flat=True))
+    return total
+
+
+def enable(wallet, shard_count):
+    """Spread future credits to ``wallet`` over ``shard_count`` shards."""
+    if shard_count < 1:
+        raise ValueError('shard_count must be at least 1; use disable() to turn sharding off.')
+    with transaction.atomic():
+        Wallet.objects.select_for_update(no_key=True).get(pk=wallet.pk)
+        WalletBalanceShard.objects.bulk_create(
+            [WalletBalanceShard(wallet_id=wallet.pk, shard=i) for i in range(shard_count)],
+            ignore_conflicts=True,
+        )
+        Wallet.objects.filter(pk=wallet.pk).update(shard_count=shard_count, version=F('version') + 1)
+        fold(wallet.pk)
+        WalletBalanceShard.objects.filter(wallet_id=wallet.pk, shard__gte=shard_count).delete()
+        forget_cached_users(wallet.user_id)
+    wallet.shard_count = shard_count
+
+
+def disable(wallet):
+    """Send credits back to ``Wallet.balance`` and fold the shards away."""
+    with transaction.atomic():
+        Wallet.objects.filter(pk=wallet.pk).update(shard_count=0, version=F('version') + 1)
+        fold(wallet.pk)
+        WalletBalanceShard.objects.filter(wallet_id=wallet.pk).delete()
+        forget_cached_users(wallet.user_id)
+    wallet.shard_count = 0
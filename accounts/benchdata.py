@@ -0,0 +1,126 @@
+"""
+Synthetic data for benchmarks: users with wallets and a large transaction
+history, written with ``bulk_create`` in batches so that millions of
+transactions can be generated on SQLite or a local Postgres in minutes.
+
+Never point this at a production database.
+"""
+import random
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+
+from . import ledger, rollups, search
+from .models import CustomUser, LedgerEntry, Transaction, Wallet
+from .wallet_numbers import allocate_wallet_numbers
+
+EMAIL_DOMAIN = 'bench.afriflow.test'
+PASSWORD = 'bench-pass-1234'
+PIN = '1234'
+COUNTRIES = ['Ghana', 'Nigeria', 'Kenya', "Côte d'Ivoire", 'Senegal', 'Tanzania']
+
+
+def users_for(tag):
+    return CustomUser.objects.filter(email__startswith=f'{tag}-', email__endswith=f'@{EMAIL_DOMAIN}')
+
+
+def create_users(count, tag=None, opening_balance=Decimal('100000.00'), business_type='individual', batch_size=1000):
+    """
+    Create ``count`` verified users with funded wallets, and return the tag
+    their emails are made from (see ``users_for``). All of them share one
+    password hash, since hashing is deliberately slow.
+    """
+    tag = tag or uuid.uuid4().hex[:8]
+    password = make_password(PASSWORD)
+    with transaction.atomic():
+        for start in range(0, count, batch_size):
+            CustomUser.objects.bulk_create([
+                CustomUser(
+                    email=f'{tag}-{i}@{EMAIL_DOMAIN}',
+                    password=password,
+                    full_name=f'Bench Trader {tag} {i}',
+                    phone_number=f'+233{i:09d}',
+                    country=COUNTRIES[i % len(COUNTRIES)],
+                    state_province='Greater Accra',
+                    preferred_language='English',
+                    business_type=business_type,
+                    language='English',
+                    pin=PIN,
+                    is_email_verified=True,
+                )
+                for i in range(start, min(start + batch_size, count))
+            ])
+
+        user_pks = users_for(tag).order_by('pk').values_list('pk', flat=True)
+        numbers = iter(allocate_wallet_numbers(count))
+        wallets = (
+            Wallet(user_id=pk, wallet_number=next(numbers), balance=opening_balance)
+            for pk in user_pks.iterator()
+        )
+        Wallet.objects.bulk_create(wallets, batch_size=batch_size)
+
+        entries = (
+            entry
+            for wallet in Wallet.objects.filter(user__in=users_for(tag)).values('pk', 'wallet_number').iterator()
+            for entry in ledger.journal('opening', [
+                ledger.wallet_leg(wallet, opening_balance),
+                (None, ledger.OPENING_BALANCES, -opening_balance),
+            ])
+        )
+        LedgerEntry.objects.bulk_create(entries, batch_size=batch_size)
+    return tag
+
+
+def create_transactions(tag, count, days=365, batch_size=5000, seed=None):
+    """
+    Write ``count`` transfers between random pairs of the ``tag`` users, spread over
+    the last ``days`` days. Only Transaction rows (and their search documents)
+    are written; balances and the ledger are left alone, and the daily
+    rollups are rebuilt at the end.
+    """
+    rng = random.Random(seed)
+    parties = list(
+        Wallet.objects.filter(user__in=users_for(tag)).values_list('user_id', 'user__full_name', 'wallet_number')
+    )
+    now = timezone.now()
+    span = days * 24 * 60 * 60
+
+    def rows():
+        for _ in range(count):
+            (sender_id, _, _), (receiver_id, receiver_name, number) = rng.sample(parties, 2)
+            yield Transaction(
+                sender_id=sender_id,
+                receiver_id=receiver_id,
+                amount=Decimal(rng.randint(100, 500000)) / 100,
+                receiver_name=receiver_name,
+                receiver_account_number=number,
+                description='bench',
+                timestamp=now - timedelta(seconds=rng.randrange(span)),
+            )
+
+    def write(batch):
+        search.index_transactions(Transaction.objects.bulk_create(batch))
+        return len(batch)
+
+    written = 0
+    batch = []
+    for row in rows():
+        batch.append(row)
+        if len(batch) == batch_size:
+            written += write(batch)
+            batch = []
+    if batch:
+        written += write(batch)
+
+    rollups.rebuild(since=(now - timedelta(days=days)).date())
+    return written
+
+
+def delete_users(tag):
+    """Remove the ``tag`` users and everything hanging off them, ledger included."""
+    LedgerEntry.objects.filter(wallet__user__in=users_for(tag)).delete()
+    users_for(tag).delete()
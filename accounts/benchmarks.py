@@ -0,0 +1,252 @@
+"""
+Endpoint benchmarks and SQL query budgets.
+
+Each scenario issues one request against a route in accounts/urls.py
+through Django's test client (the async client, i.e. the ASGI handler, for
+async views), as a user from benchdata. ``run()`` times
+every request and counts its queries; ``bench_endpoints`` reports latency
+percentiles and throughput, and the test suite fails if any scenario goes
+over its entry in QUERY_BUDGETS.
+"""
+import time
+import uuid
+from datetime import timedelta
+from contextlib import ExitStack
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.db import connection
+from django.test import AsyncClient, Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import benchdata, search
+from .models import ChatMessage, ChatSession, CustomUser, Transaction
+from .testing import StubLLMServer
+from .tokens import email_verification_token
+from .views import ChatBotView
+
+# Most SQL queries one request of each scenario may issue, counting the
+# user load after the auth cache was invalidated and work run on commit.
+# Raise a budget only together with the change that needs it.
+QUERY_BUDGETS = {
+    'register': 10,
+    'users-bulk-provision': 8,
+    'verify-email': 3,
+    'login': 1,
+    'user-info': 1,
+    'wallet-info': 1,
+    'wallet-deposit': 8,
+    'wallet-transfer-verify': 2,
+    'wallet-transfer': 11,
+    'wallet-transfer-bulk': 12,
+    'wallet-transactions': 2,
+    'wallet-transaction-detail': 2,
+    'wallet-transactions-export': 2,
+    'wallet-transactions-summary': 2,
+    'wallet-transactions-archive': 2,
+    'search': 4,
+    'chatbot': 7,
+    'chatbot-async': 6,
+    'chatbot-sessions': 3,
+    'chatbot-session-messages': 3,
+}
+
+
+class BenchContext:
+    """The users, tokens and stub LLM the scenarios run against."""
+
+    def __init__(self, history=200, tag=None):
+        self.tag = benchdata.create_users(3, tag=tag, business_type='business')
+        self.payer, self.payee, self.other = benchdata.users_for(self.tag).select_related('wallet').order_by('pk')
+        if history:
+            benchdata.create_transactions(self.tag, history, days=30)
+        self.transaction_id = Transaction.objects.filter(sender=self.payer).values_list('transaction_id', flat=True).first()
+        self.session = ChatSession.objects.create(user=self.payer, title='Bench session')
+        search.index_messages(ChatMessage.objects.bulk_create([
+            ChatMessage(chat_session=self.session, role='user' if i % 2 else 'assistant', content=f'Bench message {i}')
+            for i in range(20)
+        ]))
+        token = AccessToken.for_user(self.payer)
+        self.client = Client(HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.async_client = AsyncClient(AUTHORIZATION=f'Bearer {token}')
+        CustomUser.objects.filter(pk=self.other.pk).update(is_staff=True)
+        self.staff_client = Client(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.other)}')
+        self.anonymous = Client()
+        self.stub = StubLLMServer()
+        self._stack = ExitStack()
+
+    def __enter__(self):
+        self._stack.enter_context(self.stub)
+        self._stack.enter_context(mock.patch.object(ChatBotView, 'OPENROUTER_URL', self.stub.url))
+        self._stack.enter_context(mock.patch.object(ChatBotView, 'OPENROUTER_API_KEY', 'bench'))
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stack.close()
+
+    def cleanup(self):
+        benchdata.delete_users(self.tag)
+        CustomUser.objects.filter(email__endswith=f'-reg@{benchdata.EMAIL_DOMAIN}').delete()
+
+
+def register(ctx, i):
+    return ctx.anonymous.post(reverse('register'), {
+        'email': f'{uuid.uuid4().hex[:12]}-reg@{benchdata.EMAIL_DOMAIN}',
+        'password': benchdata.PASSWORD, 'confirm_password': benchdata.PASSWORD,
+        'business_type': 'individual', 'full_name': 'New Trader', 'phone_number': '+233200000000',
+        'country': 'Ghana', 'state_province': 'Ashanti', 'preferred_language': 'English',
+        'language': 'English', 'pin': '1234', 'voice_mode': False, 'enable_biometrics_login': False,
+    }, content_type='application/json')
+
+
+def bulk_provision(ctx, i):
+    return ctx.staff_client.post(reverse('users-bulk-provision'), {'users': [
+        {
+            'email': f'{uuid.uuid4().hex[:12]}-reg@{benchdata.EMAIL_DOMAIN}', 'full_name': f'Member {n}',
+            'phone_number': '+254700000000', 'country': 'Kenya', 'state_province': 'Nakuru',
+            'preferred_language': 'Swahili', 'language': 'Swahili', 'business_type': 'individual',
+            'password': benchdata.PASSWORD,
+        }
+        for n in range(5)
+    ]}, content_type='application/json')
+
+
+def verify_email(ctx, i):
+    uid = urlsafe_base64_encode(force_bytes(ctx.other.pk))
+    token = email_verification_token.make_token(ctx.other)
+    return ctx.anonymous.get(reverse('verify-email', kwargs={'uidb64': uid, 'token': token}))
+
+
+def login(ctx, i):
+    return ctx.anonymous.post(
+        reverse('login'), {'email': ctx.payer.email, 'password': benchdata.PASSWORD}, content_type='application/json',
+    )
+
+
+def get(name, **params):
+    def scenario(ctx, i):
+        return ctx.client.get(reverse(name), params)
+    return scenario
+
+
+def deposit(ctx, i):
+    return ctx.client.post(reverse('wallet-deposit'), {'amount': '1.00'}, content_type='application/json')
+
+
+def transfer_verify(ctx, i):
+    return ctx.client.post(reverse('wallet-transfer'), {
+        'recipient_wallet_number': ctx.payee.wallet.wallet_number, 'amount': '1.00', 'step': 'verify',
+    }, content_type='application/json')
+
+
+def transfer(ctx, i):
+    return ctx.client.post(reverse('wallet-transfer'), {
+        'recipient_wallet_number': ctx.payee.wallet.wallet_number, 'amount': '0.01',
+        'step': 'transfer', 'pin': benchdata.PIN,
+    }, content_type='application/json')
+
+
+def transfer_bulk(ctx, i):
+    return ctx.client.post(reverse('wallet-transfer-bulk'), {
+        'pin': benchdata.PIN,
+        'transfers': [
+            {'recipient_wallet_number': user.wallet.wallet_number, 'amount': '0.01'}
+            for user in (ctx.payee, ctx.other) for _ in range(10)
+        ],
+    }, content_type='application/json')
+
+
+def transaction_detail(ctx, i):
+    return ctx.client.get(reverse('wallet-transaction-detail', kwargs={'transaction_id': ctx.transaction_id}))
+
+
+def export(ctx, i):
+    end = timezone.localdate()
+    response = ctx.client.get(reverse('wallet-transactions-export'), {'start': end - timedelta(days=60), 'end': end})
+    if response.streaming:
+        b''.join(response.streaming_content)
+    return response
+
+
+def chatbot(ctx, i):
+    return ctx.client.post(reverse('chatbot'), {
+        'prompt': 'How do I export cocoa to Nigeria?', 'session_id': str(ctx.session.session_id),
+    }, content_type='application/json')
+
+
+def chatbot_async(ctx, i):
+    return async_to_sync(ctx.async_client.post)(reverse('chatbot-async'), {
+        'prompt': 'How do I export cocoa to Nigeria?', 'session_id': str(ctx.session.session_id),
+    }, content_type='application/json')
+
+
+def session_messages(ctx, i):
+    return ctx.client.get(reverse('chatbot-session-messages', kwargs={'session_id': ctx.session.session_id}))
+
+
+SCENARIOS = {
+    'register': register,
+    'users-bulk-provision': bulk_provision,
+    'verify-email': verify_email,
+    'login': login,
+    'user-info': get('user-info'),
+    'wallet-info': get('wallet-info'),
+    'wallet-deposit': deposit,
+    'wallet-transfer-verify': transfer_verify,
+    'wallet-transfer': transfer,
+    'wallet-transfer-bulk': transfer_bulk,
+    'wallet-transactions': get('wallet-transactions'),
+    'wallet-transaction-detail': transaction_detail,
+    'wallet-transactions-export': export,
+    'wallet-transactions-summary': get('wallet-transactions-summary'),
+    'wallet-transactions-archive': get('wallet-transactions-archive'),
+    'search': get('search', q='bench'),
+    'chatbot': chatbot,
+    'chatbot-async': chatbot_async,
+    'chatbot-sessions': get('chatbot-sessions'),
+    'chatbot-session-messages': session_messages,
+}
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a sorted list."""
+    index = max(0, min(len(samples) - 1, round(pct / 100 * len(samples)) - 1))
+    return samples[index]
+
+
+def run(ctx, name, requests=1):
+    """
+    Issue ``requests`` requests of scenario ``name``. Returns a dict with
+    latency percentiles (ms), throughput and the most queries any one
+    request made.
+    """
+    scenario = SCENARIOS[name]
+    latencies = []
+    max_queries = 0
+    started = time.perf_counter()
+    for i in range(requests):
+        with CaptureQueriesContext(connection) as queries:
+            began = time.perf_counter()
+            response = scenario(ctx, i)
+            latencies.append((time.perf_counter() - began) * 1000)
+        if response.status_code >= 400:
+            raise AssertionError(f'{name} answered {response.status_code}: {getattr(response, "content", b"")[:200]!r}')
+        max_queries = max(max_queries, len(queries))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'name': name,
+        'requests': requests,
+        'p50': percentile(latencies, 50),
+        'p95': percentile(latencies, 95),
+        'p99': percentile(latencies, 99),
+        'throughput': requests / elapsed,
+        'queries': max_queries,
+        'budget': QUERY_BUDGETS[name],
+    }
@@ -0,0 +1,138 @@
+from django.conf import settings
+from django.core.cache import caches
+
+from .models import ChatSession
+
+# Token budget for everything sent to the LLM: system prompt, rolling
+# summary and the verbatim recent turns.
+TOKEN_BUDGET = getattr(settings, 'CHAT_CONTEXT_TOKEN_BUDGET', 6000)
+# Cap on the rolling summary; past it, its oldest lines are dropped.
+SUMMARY_TOKEN_BUDGET = getattr(settings, 'CHAT_CONTEXT_SUMMARY_TOKEN_BUDGET', 800)
+# Always keep at least this many of the latest messages verbatim.
+MIN_RECENT_MESSAGES = getattr(settings, 'CHAT_CONTEXT_MIN_RECENT_MESSAGES', 4)
+# Most messages ever read from the DB to rebuild a cold context.
+MAX_WINDOW_MESSAGES = getattr(settings, 'CHAT_CONTEXT_MAX_WINDOW_MESSAGES', 50)
+CACHE_ALIAS = getattr(settings, 'CHAT_CONTEXT_CACHE_ALIAS', 'default')
+CACHE_TIMEOUT = getattr(settings, 'CHAT_CONTEXT_CACHE_TIMEOUT', 60 * 60)
+
+SUMMARY_LINE_CHARS = 240
+SUMMARY_HEADER = "Summary of the earlier conversation with this user:"
+
+
+def estimate_tokens(text):
+    """Cheap token estimate (~4 characters per token plus message overhead)."""
+    return len(text) // 4 + 4
+
+
+def summarize_message(role, content):
+    text = ' '.join(content.split())
+    if len(text) > SUMMARY_LINE_CHARS:
+        text = text[:SUMMARY_LINE_CHARS - 3].rstrip() + '...'
+    return f"- {role}: {text}"
+
+
+class ConversationContext:
+    """
+    Bounded LLM context for a chat session.
+
+    The latest turns are sent verbatim; once they no longer fit in the token
+    budget the oldest are folded into a rolling summary stored on the
+    ChatSession. The assembled window is cached per session, so a turn only
+    reads the messages added since the previous one.
+    """
+
+    def __init__(self, chat_session, system_prompt='', budget=None):
+        self.chat_session = chat_session
+        self.budget = budget or TOKEN_BUDGET
+        self.system_tokens = estimate_tokens(system_prompt)
+        self.cache = caches[CACHE_ALIAS]
+
+    @property
+    def cache_key(self):
+        return f'chat-context:{self.chat_session.session_id}'
+
+    def load(self):
+        state = self.cache.get(self.cache_key)
+        if state is None:
+            # The window, plus up to as many older unsummarized messages.
+            rows = list(
+                self.chat_session.messages
+                .filter(id__gt=self.chat_session.summary_upto)
+                .order_by('-id')
+                .values('id', 'role', 'content')[:2 * MAX_WINDOW_MESSAGES]
+            )
+            window, overflow = rows[:MAX_WINDOW_MESSAGES], rows[MAX_WINDOW_MESSAGES:]
+            state = {
+                'summary': self.chat_session.summary,
+                'summary_upto': self.chat_session.summary_upto,
+                'recent': [self.entry(row) for row in reversed(window)],
+            }
+            if overflow:
+                # Messages older than the window go straight into the summary,
+                # and summary_upto moves past them. Anything older still would
+                # be trimmed from the capped summary first, so it is skipped.
+                lines = state['summary'].splitlines() if state['summary'] else []
+                lines += [summarize_message(row['role'], row['content']) for row in reversed(overflow)]
+                state.update(summary='\n'.join(lines), summary_upto=overflow[0]['id'], overflowed=True)
+            return state
+
+        last_id = state['recent'][-1]['id'] if state['recent'] else state['summary_upto']
+        new_rows = (
+            self.chat_session.messages
+            .filter(id__gt=last_id)
+            .order_by('id')
+            .values('id', 'role', 'content')
+        )
+        state['recent'].extend(self.entry(row) for row in new_rows)
+        return state
+
+    def entry(self, row):
+        return dict(row, tokens=estimate_tokens(row['content']))
+
+    def fold(self, state):
+        """Move the oldest recent turns into the summary until the window fits."""
+        summary_lines = state['summary'].splitlines() if state['summary'] else []
+        recent = state['recent']
+        summary_reserve = min(SUMMARY_TOKEN_BUDGET, self.budget // 4)
+        recent_budget = self.budget - self.system_tokens - summary_reserve
+        recent_tokens = sum(m['tokens'] for m in recent)
+        folded = state.pop('overflowed', False)
+
+        while recent_tokens > recent_budget and len(recent) > MIN_RECENT_MESSAGES:
+            message = recent.pop(0)
+            summary_lines.append(summarize_message(message['role'], message['content']))
+            recent_tokens -= message['tokens']
+            state['summary_upto'] = message['id']
+            folded = True
+
+        if folded:
+            # Whatever the recent turns leave over (up to the summary's own
+            # cap) is what the summary may use; its oldest lines go first.
+            allowance = min(
+                SUMMARY_TOKEN_BUDGET,
+                self.budget - self.system_tokens - recent_tokens - estimate_tokens(SUMMARY_HEADER),
+            )
+            while summary_lines and estimate_tokens('\n'.join(summary_lines)) > allowance:
+                summary_lines.pop(0)
+            state['summary'] = '\n'.join(summary_lines)
+        return folded
+
+    def history(self):
+        """
+        Return the role/content messages to send after the system prompt:
+        the rolling summary (if any) followed by the recent turns.
+        """
+        state = self.load()
+        if self.fold(state):
+            ChatSession.objects.filter(pk=self.chat_session.pk).update(
+                summary=state['summary'], summary_upto=state['summary_upto'],
+            )
+            self.chat_session.summary = state['summary']
+            self.chat_session.summary_upto = state['summary_upto']
+        self.cache.set(self.cache_key, state, CACHE_TIMEOUT)
+
+        messages = []
+        if state['summary']:
+            messages.append({"role": "system", "content": f"{SUMMARY_HEADER}\n{state['summary']}"})
+        messages.extend({"role": m['role'], "content": m['content']} for m in state['recent'])
+        return messages
@@ -0,0 +1,39 @@
+"""
+ETags for the endpoints the mobile app polls.
+
+Each tag is built from the ``version`` columns bumped on every write to a
+user, wallet or balance shard, so checking ``If-None-Match`` never runs a
+serializer. The user and wallet are the ones authentication loaded: from
+the database, or from the authentication cache, which is only used when
+every worker shares it and is dropped on every write (see
+authentication.py), so a stale tag is never confirmed. With the cache an
+unsharded wallet costs no query at all; a sharded wallet adds one
+aggregate over its shards. A transaction's versions are selected along
+with the row the detail view loads anyway.
+"""
+from django.db.models import Sum
+
+from .models import WalletBalanceShard
+
+
+def user_etag(request, *args, **kwargs):
+    user = request.user
+    return f'user-{user.pk}-{user.version}'
+
+
+def wallet_etag(request, *args, **kwargs):
+    wallet = request.user.wallet
+    tag = f'wallet-{wallet.pk}-{wallet.version}'
+    if wallet.shard_count:
+        shards = WalletBalanceShard.objects.filter(wallet_id=wallet.pk).aggregate(version=Sum('version'))['version']
+        tag += f'-{shards or 0}'
+    return tag
+
+
+def transaction_etag(user, txn):
+    """
+    A transaction never changes, but its detail shows both parties' current
+    names, so the tag follows their versions. ``txn`` comes from
+    ``TransactionDetailView.get_queryset()``, which selects them.
+    """
+    return f'txn-{txn.transaction_id}-{user.pk}-{txn.sender_version}-{txn.receiver_version}'
@@ -0,0 +1,162 @@
+"""
+``Idempotency-Key`` support for endpoints that move money.
+
+A client that retries a request after a timeout sends the same key again.
+The first request to arrive inserts an in-flight IdempotencyKey row; the
+unique constraint on (user, key) means exactly one concurrent duplicate
+wins. The winner runs the view and stores its response in the same
+database transaction as the view's own writes, so either both the money
+movement and the stored response are committed or neither is. Later
+duplicates get the stored response replayed, duplicates that arrive while
+the first is still running get a 409, and reusing a key for a different
+request body is a 422.
+
+Keys expire after ``IDEMPOTENCY_KEY_TTL`` seconds; ``purge_idempotency_keys``
+deletes them.
+"""
+import functools
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+REPLAY_HEADER = 'Idempotent-Replayed'
+TTL_SECONDS = getattr(settings, 'IDEMPOTENCY_KEY_TTL', 24 * 60 * 60)
+# An in-flight key older than this belongs to a request that died before
+# committing anything, and may be taken over by a retry.
+IN_FLIGHT_TIMEOUT_SECONDS = getattr(settings, 'IDEMPOTENCY_IN_FLIGHT_TIMEOUT', 60)
+MAX_KEY_LENGTH = 255
+
+
+def request_fingerprint(request):
+    body = json.dumps(request.data, cls=JSONEncoder, sort_keys=True)
+    return hashlib.sha256(f'{request.method} {request.path}\n{body}'.encode('utf-8')).hexdigest()
+
+
+def claim(user, key, fingerprint):
+    """
+    Try to become the request that runs for ``key``. Returns the
+    IdempotencyKey row and whether this request claimed it.
+    """
+    now = timezone.now()
+    fresh = {
+        'request_hash': fingerprint,
+        'status': 'in_flight',
+        'response_status': None,
+        'response_body': '',
+        'claimed_at': now,
+        'expires_at': now + timedelta(seconds=TTL_SECONDS),
+    }
+    try:
+        with transaction.atomic():
+            return IdempotencyKey.objects.create(user=user, key=key, **fresh), True
+    except IntegrityError:
+        pass
+
+    record = IdempotencyKey.objects.get(user=user, key=key)
+    expired = record.expires_at <= now
+    abandoned = record.status == 'in_flight' and record.claimed_at <= now - timedelta(seconds=IN_FLIGHT_TIMEOUT_SECONDS)
+    if expired or abandoned:
+        # Only one of several racing retries gets to take the key over.
+        taken = IdempotencyKey.objects.filter(pk=record.pk, claimed_at=record.claimed_at).update(**fresh)
+        if taken:
+            for field, value in fresh.items():
+                setattr(record, field, value)
+            return record, True
+        record.refresh_from_db()
+    return record, False
+
+
+def replay(record):
+    response = Response(json.loads(record.response_body), status=record.response_status)
+    response[REPLAY_HEADER] = 'true'
+    return response
+
+
+class _Abort(Exception):
+    """Roll back the view's writes and answer with ``response`` instead."""
+
+    def __init__(self, response):
+        self.response = response
+
+
+def in_progress_response():
+    response = Response(
+        {'error': f'A request with this {HEADER} is still being processed.'},
+        status=status.HTTP_409_CONFLICT,
+    )
+    response['Retry-After'] = '1'
+    return response
+
+
+def idempotent(view_method):
+    """
+    Decorate an APIView handler so requests carrying an ``Idempotency-Key``
+    header run at most once. Requests without the header are unaffected.
+    """
+    @functools.wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return view_method(self, request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return Response({'error': f'{HEADER} must be at most {MAX_KEY_LENGTH} characters.'}, status=status.HTTP_400_BAD_REQUEST)
+
+        fingerprint = request_fingerprint(request)
+        record, claimed = claim(request.user, key, fingerprint)
+        if not claimed:
+            if record.request_hash != fingerprint:
+                return Response(
+                    {'error': f'This {HEADER} was already used for a different request.'},
+                    status=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                )
+            if record.status == 'completed':
+                return replay(record)
+            return in_progress_response()
+
+        ours = IdempotencyKey.objects.filter(pk=record.pk, claimed_at=record.claimed_at)
+        try:
+            with transaction.atomic():
+                response = view_method(self, request, *args, **kwargs)
+                if response.status_code >= 500:
+                    raise _Abort(response)
+                stored = ours.update(
+                    status='completed',
+                    response_status=response.status_code,
+                    response_body=json.dumps(response.data, cls=JSONEncoder),
+                )
+                if not stored:
+                    # We ran past the in-flight timeout and a retry took the
+                    # key over; it owns the outcome, so undo ours.
+                    raise _Abort(in_progress_response())
+        except _Abort as e:
+            # Nothing of ours was committed; let the client retry with the same key.
+            ours.filter(status='in_flight').delete()
+            return e.response
+        except Exception:
+            ours.filter(status='in_flight').delete()
+            raise
+        return response
+
+    return wrapper
+
+
+def purge_expired(batch_size=1000):
+    """Delete expired keys in batches; returns how many were removed."""
+    purged = 0
+    while True:
+        pks = list(
+            IdempotencyKey.objects.filter(expires_at__lte=timezone.now()).values_list('pk', flat=True)[:batch_size]
+        )
+        if not pks:
+            return purged
+        purged += IdempotencyKey.objects.filter(pk__in=pks).delete()[0]
@@ -0,0 +1,121 @@
+"""
+Double-entry ledger.
+
+Every balance change is also posted as a journal: LedgerEntry rows sharing
+a ``journal_id`` whose signed amounts sum to zero. Wallet legs carry the
+wallet; the other side of a deposit is booked to an external account.
+Entries are only ever inserted, so they form an audit trail that
+``Wallet.balance`` on its own can't provide.
+
+BalanceCheckpoint rows snapshot each wallet's ledger balance from time to
+time (``checkpoint_balances``), so ``balance_as_of()`` reads one checkpoint
+and the short tail of entries after it instead of the whole history.
+"""
+import uuid
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+
+from django.db.models import DateTimeField, Exists, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import BalanceCheckpoint, LedgerEntry, Wallet
+
+EXTERNAL_DEPOSITS = 'external:deposits'
+OPENING_BALANCES = 'equity:opening'
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def wallet_account(wallet_number):
+    return f'wallet:{wallet_number}'
+
+
+def wallet_leg(wallet, amount):
+    """A journal leg for a wallet given as a dict with ``pk`` and ``wallet_number``."""
+    return (wallet['pk'], wallet_account(wallet['wallet_number']), amount)
+
+
+def journal(entry_type, legs, reference=None):
+    """
+    Build the unsaved entries of one journal from ``(wallet_pk, account,
+    amount)`` legs. Raises ValueError if the legs don't balance.
+    """
+    if sum(amount for _, _, amount in legs) != 0:
+        raise ValueError('Journal legs must sum to zero.')
+    journal_id = uuid.uuid4()
+    now = timezone.now()
+    return [
+        LedgerEntry(
+            journal_id=journal_id, wallet_id=wallet_pk, account=account, amount=amount,
+            entry_type=entry_type, reference=reference, created_at=now,
+        )
+        for wallet_pk, account, amount in legs
+    ]
+
+
+def record_deposit(wallet, amount):
+    LedgerEntry.objects.bulk_create(
+        journal('deposit', [wallet_leg(wallet, amount), (None, EXTERNAL_DEPOSITS, -amount)])
+    )
+
+
+def record_transfers(postings):
+    """Post ``(sender, recipient, amount, reference)`` transfers in one INSERT batch."""
+    entries = []
+    for sender, recipient, amount, reference in postings:
+        entries.extend(journal('transfer', [wallet_leg(sender, -amount), wallet_leg(recipient, amount)], reference))
+    LedgerEntry.objects.bulk_create(entries, batch_size=1000)
+
+
+def balance_as_of(wallet_pk, at=None):
+    """The wallet's balance according to the ledger at time ``at`` (default now)."""
+    at = at or timezone.now()
+    checkpoint = (
+        BalanceCheckpoint.objects
+        .filter(wallet_id=wallet_pk, as_of__lte=at)
+        .order_by('-as_of')
+        .values('as_of', 'balance')
+        .first()
+    )
+    tail = LedgerEntry.objects.filter(wallet_id=wallet_pk, created_at__lte=at)
+    if checkpoint:
+        tail = tail.filter(created_at__gt=checkpoint['as_of'])
+    opening = checkpoint['balance'] if checkpoint else Decimal('0.00')
+    return opening + (tail.aggregate(total=Sum('amount'))['total'] or 0)
+
+
+def wallets_needing_checkpoint(as_of):
+    """Wallets with ledger entries after their latest checkpoint, up to ``as_of``."""
+    latest = BalanceCheckpoint.objects.filter(wallet=OuterRef('pk')).order_by('-as_of').values('as_of')[:1]
+    newer_entries = LedgerEntry.objects.filter(
+        wallet=OuterRef('pk'),
+        created_at__gt=Coalesce(OuterRef('last_checkpoint'), Value(EPOCH, output_field=DateTimeField())),
+        created_at__lte=as_of,
+    )
+    return (
+        Wallet.objects
+        .annotate(last_checkpoint=Subquery(latest))
+        .filter(Exists(newer_entries))
+    )
+
+
+def take_checkpoints(as_of, batch_size=500):
+    """
+    Snapshot the balance at ``as_of`` of every wallet whose ledger moved since
+    its last checkpoint. ``as_of`` should trail the current time by more than
+    the longest transaction, so no entry stamped before it can still commit.
+    Returns the number of checkpoints written.
+    """
+    written = 0
+    batch = []
+    for wallet_pk in wallets_needing_checkpoint(as_of).values_list('pk', flat=True).iterator():
+        batch.append(BalanceCheckpoint(wallet_id=wallet_pk, as_of=as_of, balance=balance_as_of(wallet_pk, as_of)))
+        if len(batch) >= batch_size:
+            BalanceCheckpoint.objects.bulk_create(batch, ignore_conflicts=True)
+            written += len(batch)
+            batch = []
+    if batch:
+        BalanceCheckpoint.objects.bulk_create(batch, ignore_conflicts=True)
+        written += len(batch)
+    return written
@@ -0,0 +1,180 @@
+import asyncio
+import contextlib
+import json
+import threading
+import weakref
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+from . import metrics
+
+# Upper bounds on the shared connection pools. The sync pool only needs to
+# cover the threads of one worker; the async pool is what lets a single ASGI
+# process keep hundreds of completions in flight over reused connections.
+SYNC_POOL_SIZE = 32
+ASYNC_MAX_CONNECTIONS = 500
+ASYNC_MAX_KEEPALIVE = 100
+
+_session = None
+_session_lock = threading.Lock()
+_async_clients = weakref.WeakKeyDictionary()
+_kept_loops = weakref.WeakSet()
+
+
+def get_session():
+    """A process-wide ``requests.Session`` so sync calls reuse TLS connections."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=SYNC_POOL_SIZE)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _session = session
+    return _session
+
+
+def keep_async_client():
+    """
+    Share one pooled client across every call on the running event loop.
+
+    Only for loops that outlive a request and close the client themselves
+    with ``aclose_async_client()``: the ASGI lifespan in backend/asgi.py, or
+    a management command. An async view served over WSGI runs on a new loop
+    per request (``async_to_sync``), so a client kept there would never be
+    closed; calls on such loops get a client of their own instead.
+    """
+    _kept_loops.add(asyncio.get_running_loop())
+
+
+def get_async_client():
+    """
+    The shared ``httpx.AsyncClient`` for the running event loop.
+
+    httpx clients are bound to the loop they were first used on, so one is
+    kept per loop (in practice: one per ASGI worker process).
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(limits=httpx.Limits(
+            max_connections=ASYNC_MAX_CONNECTIONS,
+            max_keepalive_connections=ASYNC_MAX_KEEPALIVE,
+        ))
+        _async_clients[loop] = client
+    return client
+
+
+@contextlib.asynccontextmanager
+async def async_client():
+    """The shared client if the loop keeps one (see above), else one closed on exit."""
+    if asyncio.get_running_loop() in _kept_loops:
+        yield get_async_client()
+    else:
+        async with httpx.AsyncClient() as client:
+            yield client
+
+
+async def aclose_async_client():
+    """Close the running loop's shared client, e.g. on ASGI lifespan shutdown."""
+    loop = asyncio.get_running_loop()
+    _kept_loops.discard(loop)
+    client = _async_clients.pop(loop, None)
+    if client is not None:
+        await client.aclose()
+
+
+def iter_sse_data(lines):
+    """
+    Yield the ``data:`` payloads of a Server-Sent Events stream.
+
+    OpenRouter interleaves keep-alive comments (``: OPENROUTER PROCESSING``)
+    with the real events and ends the stream with ``data: [DONE]``.
+    """
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        if not line or line.startswith(':'):
+            continue
+        if not line.startswith('data:'):
+            continue
+        data = line[len('data:'):].strip()
+        if data == '[DONE]':
+            return
+        yield data
+
+
+def parse_completion_chunk(data, error_class):
+    """Return the content delta carried by one streamed chunk, if any."""
+    try:
+        chunk = json.loads(data)
+    except ValueError:
+        return ''
+    if 'error' in chunk:
+        raise error_class(chunk['error'].get('message', 'Upstream error'))
+    return ''.join((choice.get('delta') or {}).get('content') or '' for choice in chunk.get('choices', []))
+
+
+def iter_completion_tokens(lines):
+    """Yield the content deltas from a streamed chat completion."""
+    for data in iter_sse_data(lines):
+        token = parse_completion_chunk(data, requests.RequestException)
+        if token:
+            yield token
+
+
+def chat_completion(url, headers, payload, timeout=30):
+    """
+    POST a non-streaming chat completion and return the reply text. Raises
+    ``requests.RequestException`` on transport/HTTP errors.
+    """
+    with metrics.timed('openrouter'):
+        response = get_session().post(url, headers=headers, json=payload, timeout=timeout)
+        response.raise_for_status()
+        return response.json()["choices"][0]["message"]["content"]
+
+
+def stream_chat_completion(url, headers, payload, timeout=30):
+    """
+    POST a chat completion with ``stream`` enabled and yield tokens as they
+    arrive. Raises ``requests.RequestException`` on transport/HTTP errors.
+    """
+    payload = dict(payload, stream=True)
+    with metrics.timed('openrouter'), get_session().post(url, headers=headers, json=payload, timeout=timeout, stream=True) as response:
+        response.raise_for_status()
+        yield from iter_completion_tokens(response.iter_lines())
+
+
+async def achat_completion(url, headers, payload, timeout=30):
+    """Async counterpart of ``chat_completion``; raises ``httpx.HTTPError``."""
+    with metrics.timed('openrouter'):
+        async with async_client() as client:
+            response = await client.post(url, headers=headers, json=payload, timeout=timeout)
+        response.raise_for_status()
+        return response.json()["choices"][0]["message"]["content"]
+
+
+async def astream_chat_completion(url, headers, payload, timeout=30):
+    """Async counterpart of ``stream_chat_completion``; raises ``httpx.HTTPError``."""
+    payload = dict(payload, stream=True)
+    with metrics.timed('openrouter'):
+        async with async_client() as client, \
+                client.stream('POST', url, headers=headers, json=payload, timeout=timeout) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                for data in iter_sse_data([line]):
+                    token = parse_completion_chunk(data, httpx.HTTPError)
+                    if token:
+                        yield token
+
+
+def sse_event(data, event=None):
+    """Encode one Server-Sent Event."""
+    message = ''
+    if event:
+        message += f'event: {event}\n'
+    message += f'data: {json.dumps(data)}\n\n'
+    return message.encode('utf-8')
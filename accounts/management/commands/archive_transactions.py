@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts import archive
+from accounts.models import Transaction
+
+
+class Command(BaseCommand):
+    help = (
+        "Move transactions from months that ended more than --older-than-days ago "
+        "out of the Transaction table into compressed per-user monthly archives, "
+        "readable at /api/wallet/transactions/archive/. Safe to run repeatedly "
+        "and while transfers are happening."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than-days', type=int, default=archive.ARCHIVE_AFTER_DAYS,
+            help='Archive whole months before the month this many days ago '
+                 '(default: TRANSACTION_ARCHIVE_AFTER_DAYS).',
+        )
+        parser.add_argument('--batch-size', type=int, default=archive.BATCH_SIZE, help='Transactions moved per database transaction.')
+        parser.add_argument('--dry-run', action='store_true', help='Only report how many transactions would move.')
+
+    def handle(self, *args, **options):
+        if options['older_than_days'] < 0 or options['batch_size'] < 1:
+            raise CommandError('--older-than-days must be >= 0 and --batch-size >= 1.')
+
+        before = archive.cutoff(options['older_than_days'])
+        if options['dry_run']:
+            count = Transaction.objects.filter(timestamp__lt=before).count()
+            self.stdout.write(f"{count} transactions before {before:%Y-%m-%d} would be archived.")
+            return
+
+        moved, written = archive.archive_before(before, batch_size=options['batch_size'])
+        self.stdout.write(f"Archived {moved} transactions before {before:%Y-%m-%d} into {written} monthly archive writes.")
@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts import benchdata, benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure p50/p95/p99 latency, throughput and SQL queries per request for "
+        "every API route, and fail if any route exceeds its query budget. Runs "
+        "in-process against the configured database (use a throwaway one) with "
+        "the chatbot pointed at a local stub LLM."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Requests per route.')
+        parser.add_argument('--history', type=int, default=10000, help='Transactions to give the benchmark users.')
+        parser.add_argument('--only', nargs='+', choices=sorted(benchmarks.SCENARIOS), help='Routes to run.')
+        parser.add_argument('--keep', action='store_true', help="Don't delete the benchmark users afterwards.")
+        parser.add_argument('--cleanup-tag', help='Just delete the users of an earlier run or seed_bench_data, and exit.')
+
+    def handle(self, *args, **options):
+        if options['cleanup_tag']:
+            benchdata.delete_users(options['cleanup_tag'])
+            self.stdout.write(f"Deleted benchmark users tagged {options['cleanup_tag']!r}.")
+            return
+
+        names = options['only'] or list(benchmarks.SCENARIOS)
+        ctx = benchmarks.BenchContext(history=options['history'])
+        results = []
+        try:
+            with ctx:
+                for name in names:
+                    # Login and registration hash passwords; a few samples say enough.
+                    requests = min(options['requests'], 20) if name in ('login', 'register') else options['requests']
+                    results.append(benchmarks.run(ctx, name, requests))
+        finally:
+            if not options['keep']:
+                ctx.cleanup()
+
+        self.stdout.write(f"{'route':<28} {'n':>5} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'req/s':>8} {'queries':>9}")
+        over = []
+        for r in results:
+            flag = '' if r['queries'] <= r['budget'] else '  OVER BUDGET'
+            self.stdout.write(
+                f"{r['name']:<28} {r['requests']:>5} {r['p50']:>8.2f} {r['p95']:>8.2f} {r['p99']:>8.2f} "
+                f"{r['throughput']:>8.1f} {r['queries']:>4}/{r['budget']:<4}{flag}"
+            )
+            if flag:
+                over.append(r['name'])
+        if over:
+            raise CommandError(f"Query budget exceeded by: {', '.join(over)}")
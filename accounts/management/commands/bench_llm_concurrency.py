@@ -0,0 +1,54 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from accounts.llm import achat_completion, aclose_async_client, chat_completion, keep_async_client
+from accounts.testing import StubLLMServer
+from accounts.views import ChatBotView
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare how many chatbot completions a sync worker pool and a single "
+        "async process can keep in flight, against a local delayed LLM stub."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Total completions to issue.')
+        parser.add_argument('--delay', type=float, default=0.5, help='Seconds the stub waits before answering.')
+        parser.add_argument('--workers', type=int, default=10, help='Sync workers (threads standing in for gunicorn workers).')
+
+    def handle(self, *args, **options):
+        total = options['requests']
+        workers = options['workers']
+        payload = ChatBotView.build_payload([{"role": "user", "content": "How do I export shea butter?"}])
+        headers = dict(ChatBotView.build_headers(), Authorization='Bearer bench')
+
+        with StubLLMServer(delay=options['delay']) as stub:
+            sync_elapsed = self.run_sync(stub.url, headers, payload, total, workers)
+            async_elapsed = asyncio.run(self.run_async(stub.url, headers, payload, total))
+
+        self.stdout.write(f"{total} completions, stub delay {options['delay']}s")
+        self.report(f'sync ({workers} workers)', total, sync_elapsed)
+        self.report('async (1 process)', total, async_elapsed)
+        self.stdout.write(f"speed-up: {sync_elapsed / async_elapsed:.1f}x")
+
+    def report(self, label, total, elapsed):
+        self.stdout.write(f"{label:>20}: {elapsed:7.2f}s  {total / elapsed:8.1f} req/s")
+
+    def run_sync(self, url, headers, payload, total, workers):
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(lambda _: chat_completion(url, headers, payload), range(total)))
+        return time.perf_counter() - started
+
+    async def run_async(self, url, headers, payload, total):
+        keep_async_client()
+        started = time.perf_counter()
+        try:
+            await asyncio.gather(*(achat_completion(url, headers, payload) for _ in range(total)))
+        finally:
+            await aclose_async_client()
+        return time.perf_counter() - started
@@ -0,0 +1,70 @@
+import time
+
+from django.core.management.base import BaseCommand
+from rest_framework.renderers import JSONRenderer
+
+from accounts import benchdata, renderers
+from accounts.models import ChatMessage, ChatSession, Transaction
+from accounts.serializers import CHAT_MESSAGE_ROWS, TRANSACTION_ROWS, ChatMessageSerializer, TransactionSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the DRF model serializers and JSONRenderer with the .values() row "
+        "serializers and FastJSONRenderer on the transaction and chat message "
+        "listings. Creates its own data in the configured database (use a "
+        "throwaway one) and deletes it afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000, help='Transactions and chat messages to serialize.')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per variant; the best is reported.')
+        parser.add_argument('--keep', action='store_true', help="Don't delete the benchmark users afterwards.")
+
+    def handle(self, *args, **options):
+        rows, repeat = options['rows'], options['repeat']
+        tag = benchdata.create_users(2)
+        try:
+            user = benchdata.users_for(tag).order_by('pk').first()
+            benchdata.create_transactions(tag, rows, days=30)
+            session = ChatSession.objects.create(user=user, title='Serializer bench')
+            ChatMessage.objects.bulk_create([
+                ChatMessage(chat_session=session, role='user' if i % 2 else 'assistant', content=f'Bench message {i} ' * 8)
+                for i in range(rows)
+            ], batch_size=5000)
+
+            transactions = Transaction.objects.annotate_for(user).filter(sender__in=benchdata.users_for(tag))
+            messages = ChatMessage.objects.filter(chat_session=session)
+            cases = [
+                ('transactions', TransactionSerializer, TRANSACTION_ROWS, transactions),
+                ('chat messages', ChatMessageSerializer, CHAT_MESSAGE_ROWS, messages),
+            ]
+
+            self.stdout.write(f"{'listing':<14} {'variant':<22} {'fetch ms':>9} {'serialize ms':>13} {'render ms':>10} {'total ms':>9} {'KiB':>7}")
+            for label, model_serializer, row_serializer, queryset in cases:
+                variants = [
+                    ('ModelSerializer+DRF', lambda: list(queryset.all()), lambda objs: model_serializer(objs, many=True).data, JSONRenderer()),
+                    ('rows+FastJSON', lambda: list(row_serializer.values(queryset.all())), row_serializer.many, renderers.FastJSONRenderer()),
+                ]
+                for name, fetch, serialize, renderer in variants:
+                    best = min((self.measure(fetch, serialize, renderer) for _ in range(repeat)), key=lambda t: sum(t[:3]))
+                    fetched, serialized, rendered, size = best
+                    self.stdout.write(
+                        f"{label:<14} {name:<22} {fetched:>9.1f} {serialized:>13.1f} {rendered:>10.1f} "
+                        f"{fetched + serialized + rendered:>9.1f} {size / 1024:>7.0f}"
+                    )
+            if renderers.orjson is None:
+                self.stdout.write('orjson is not installed: FastJSONRenderer used the stdlib fallback.')
+        finally:
+            if not options['keep']:
+                benchdata.delete_users(tag)
+
+    def measure(self, fetch, serialize, renderer):
+        started = time.perf_counter()
+        objects = fetch()
+        fetched = time.perf_counter()
+        data = serialize(objects)
+        serialized = time.perf_counter()
+        body = renderer.render(data)
+        rendered = time.perf_counter()
+        return (fetched - started) * 1000, (serialized - fetched) * 1000, (rendered - serialized) * 1000, len(body)
@@ -0,0 +1,119 @@
+import random
+import threading
+import time
+import uuid
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection
+from django.db.models import Sum
+
+from accounts import balance_shards, transfers
+from accounts.models import CustomUser, LedgerEntry, Transaction, Wallet, WalletBalanceShard
+
+
+class Command(BaseCommand):
+    help = (
+        "Hammer the transfer service from several threads and report "
+        "transfers/sec, checking that the total balance is conserved. "
+        "Creates its own throwaway wallets and deletes them afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--transfers', type=int, default=200, help='Transfers per thread.')
+        parser.add_argument('--wallets', type=int, default=10, help='Size of the wallet pool; fewer means hotter rows.')
+        parser.add_argument('--opening-balance', type=Decimal, default=Decimal('1000.00'))
+        parser.add_argument(
+            '--hot-shards', type=int, default=None,
+            help='Send every transfer to one hot wallet, sharded this many ways (0 = unsharded).',
+        )
+        parser.add_argument('--keep', action='store_true', help="Don't delete the benchmark wallets afterwards.")
+
+    def handle(self, *args, **options):
+        run_id = uuid.uuid4().hex[:8]
+        users = [
+            CustomUser.objects.create_user(email=f'bench-{run_id}-{i}@example.invalid', full_name=f'Bench {i}')
+            for i in range(options['wallets'])
+        ]
+        Wallet.objects.filter(user__in=users).update(balance=options['opening_balance'])
+        wallets = list(Wallet.objects.filter(user__in=users).values_list('user_id', 'wallet_number'))
+        by_user = {user.pk: user for user in users}
+        hot = options['hot_shards'] is not None
+        if hot and options['hot_shards']:
+            balance_shards.enable(users[0].wallet, options['hot_shards'])
+        opening_total = self.total(users)
+
+        counts = {'ok': 0, 'insufficient': 0, 'retried': 0}
+        lock = threading.Lock()
+
+        def worker():
+            rng = random.Random()
+            local = {'ok': 0, 'insufficient': 0, 'retried': 0}
+            try:
+                for _ in range(options['transfers']):
+                    if hot:
+                        sender_id, recipient_number = rng.choice(wallets[1:])[0], wallets[0][1]
+                    else:
+                        (sender_id, _), (_, recipient_number) = rng.sample(wallets, 2)
+                    amount = Decimal(rng.randint(1, 5000)) / 100
+                    while True:
+                        try:
+                            transfers.transfer(by_user[sender_id], recipient_number, amount)
+                            local['ok'] += 1
+                        except transfers.InsufficientFunds:
+                            local['insufficient'] += 1
+                        except OperationalError:
+                            # SQLite reports write contention as "database is
+                            # locked" instead of waiting; just try again.
+                            local['retried'] += 1
+                            continue
+                        break
+            finally:
+                connection.close()
+                with lock:
+                    for key, value in local.items():
+                        counts[key] += value
+
+        threads = [threading.Thread(target=worker) for _ in range(options['threads'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        closing_total = self.total(users)
+        recorded = Transaction.objects.filter(sender__in=users).count()
+        negative = Wallet.objects.filter(user__in=users, balance__lt=0).count()
+
+        attempted = options['threads'] * options['transfers']
+        self.stdout.write(f"{connection.vendor}: {options['threads']} threads x {options['transfers']} transfers over {options['wallets']} wallets")
+        if hot:
+            self.stdout.write(f"  hot recipient  sharded {options['hot_shards']} ways")
+        self.stdout.write(f"  elapsed        {elapsed:.2f}s")
+        self.stdout.write(f"  transfers/sec  {attempted / elapsed:.1f}")
+        self.stdout.write(f"  committed      {counts['ok']}")
+        self.stdout.write(f"  insufficient   {counts['insufficient']}")
+        self.stdout.write(f"  lock retries   {counts['retried']}")
+        self.stdout.write(f"  balance total  {opening_total} -> {closing_total}")
+
+        if not options['keep']:
+            # The ledger outlives deleted wallets; these are throwaway rows.
+            LedgerEntry.objects.filter(wallet__user__in=by_user).delete()
+            CustomUser.objects.filter(pk__in=by_user).delete()
+
+        if closing_total != opening_total:
+            raise CommandError('Total balance was not conserved.')
+        if recorded != counts['ok']:
+            raise CommandError(f'{counts["ok"]} transfers committed but {recorded} Transaction rows written.')
+        if negative:
+            raise CommandError(f'{negative} wallets went negative.')
+        self.stdout.write(self.style.SUCCESS('Balances conserved.'))
+
+    def total(self, users):
+        wallets = Wallet.objects.filter(user__in=users)
+        return (
+            wallets.aggregate(total=Sum('balance'))['total']
+            + (WalletBalanceShard.objects.filter(wallet__in=wallets).aggregate(total=Sum('balance'))['total'] or 0)
+        )
@@ -0,0 +1,41 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from accounts import ledger
+from accounts.models import Wallet
+
+
+class Command(BaseCommand):
+    help = (
+        "Snapshot the ledger balance of every wallet that moved since its last "
+        "checkpoint, so historical balance lookups only read a short tail of entries. "
+        "Meant to run periodically (e.g. hourly from cron)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--settle-seconds', type=int, default=300,
+            help='Checkpoint as of this long ago, so entries from still-open transactions are not missed.',
+        )
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument(
+            '--verify', action='store_true',
+            help='Also compare every wallet\'s ledger balance with its stored balance and report mismatches. '
+                 'Run it while transfers are quiet; in-flight transfers show up as false mismatches.',
+        )
+
+    def handle(self, *args, **options):
+        as_of = timezone.now() - timedelta(seconds=options['settle_seconds'])
+        written = ledger.take_checkpoints(as_of, batch_size=options['batch_size'])
+        self.stdout.write(f"Wrote {written} balance checkpoints as of {as_of.isoformat()}.")
+
+        if options['verify']:
+            mismatched = 0
+            for wallet in Wallet.objects.iterator():
+                expected = ledger.balance_as_of(wallet.pk)
+                if expected != wallet.total_balance:
+                    mismatched += 1
+                    self.stdout.write(f"  wallet {wallet.wallet_number}: stored {wallet.total_balance}, ledger {expected}")
+            self.stdout.write(f"{mismatched} wallets disagree with the ledger.")
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from accounts import balance_shards
+from accounts.models import Wallet
+
+
+class Command(BaseCommand):
+    help = "Merge the sub-balances of every sharded wallet back into Wallet.balance."
+
+    def handle(self, *args, **options):
+        folded = 0
+        for wallet_pk in Wallet.objects.filter(shard_count__gt=0).values_list('pk', flat=True).iterator():
+            if balance_shards.fold(wallet_pk):
+                folded += 1
+        self.stdout.write(f"Folded shards of {folded} wallets.")
@@ -0,0 +1,71 @@
+import csv
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError
+from rest_framework.exceptions import ValidationError
+
+from accounts import provisioning
+from accounts.serializers import BulkProvisionSerializer, ProvisionUserSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        "Create users and wallets in bulk from a CSV file with a header row of "
+        "email, full_name, phone_number, country, state_province, preferred_language, "
+        "language, business_type and optionally pin and password. Prints email,wallet_number "
+        "for every account created."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('csv_file')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--workers', type=int, default=getattr(settings, 'PROVISIONING_WORKERS', None),
+            help='Password hashing processes (default: PROVISIONING_WORKERS, or one per CPU).',
+        )
+        parser.add_argument('--output', help='Write email,wallet_number here instead of stdout.')
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['csv_file'], newline='', encoding='utf-8') as f:
+                rows = list(csv.DictReader(f))
+        except OSError as e:
+            raise CommandError(str(e))
+        if not rows:
+            raise CommandError('The CSV file has no rows.')
+
+        # Same validation as the API, without its per-request size cap.
+        users = ProvisionUserSerializer(data=rows, many=True)
+        if not users.is_valid():
+            raise CommandError(self.describe(users.errors))
+        try:
+            validated = BulkProvisionSerializer().validate_users(users.validated_data)
+        except ValidationError as e:
+            raise CommandError(self.describe(e.detail))
+
+        started = time.perf_counter()
+        try:
+            created = provisioning.provision_users(validated, batch_size=options['batch_size'], workers=options['workers'])
+        except IntegrityError:
+            raise CommandError('A user with one of these emails was created meanwhile; nothing was provisioned.')
+        elapsed = time.perf_counter() - started
+
+        if options['output']:
+            with open(options['output'], 'w', newline='', encoding='utf-8') as out:
+                self.write_csv(out, created)
+        else:
+            self.write_csv(self.stdout, created)
+        self.stderr.write(f"Provisioned {len(created)} accounts in {elapsed:.1f}s.")
+
+    def write_csv(self, out, created):
+        writer = csv.writer(out)
+        writer.writerow(['email', 'wallet_number'])
+        writer.writerows(created)
+
+    def describe(self, errors):
+        if isinstance(errors, list):
+            errors = {index: error for index, error in enumerate(errors) if error}
+        lines = [f"row {int(index) + 2}: {error}" for index, error in list(errors.items())[:20]]
+        return 'Invalid rows (line numbers include the header):\n' + '\n'.join(lines)
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from accounts.idempotency import purge_expired
+
+
+class Command(BaseCommand):
+    help = "Delete Idempotency-Key records whose TTL has passed."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        purged = purge_expired(batch_size=options['batch_size'])
+        self.stdout.write(f"Purged {purged} expired idempotency keys.")
@@ -0,0 +1,29 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts import rollups
+
+
+def parse_day(value):
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f"Invalid date {value!r}; use YYYY-MM-DD.")
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute daily transaction rollups from the transactions and ledger. "
+        "With no dates the whole history is rebuilt. Rebuilding days that are "
+        "still receiving transfers can race with live updates; rebuild closed days, "
+        "or run it while traffic is quiet."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', type=parse_day, help='First day to rebuild (YYYY-MM-DD).')
+        parser.add_argument('--until', type=parse_day, help='Last day to rebuild (YYYY-MM-DD).')
+
+    def handle(self, *args, **options):
+        written = rollups.rebuild(since=options['since'], until=options['until'])
+        self.stdout.write(f"Wrote {written} daily rollup rows.")
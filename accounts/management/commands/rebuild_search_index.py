@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from accounts import search
+
+
+class Command(BaseCommand):
+    help = (
+        "Drop every search document and index all transactions and chat messages "
+        "again. Not needed after deploys: migrations index existing data and the "
+        "index is maintained as rows are written. Use it to repair the index."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=search.BATCH_SIZE, help='Documents written per INSERT.')
+
+    def handle(self, *args, **options):
+        written = search.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(f"Indexed {written} search documents.")
@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from accounts import benchdata
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill the database with synthetic users, wallets and transactions for "
+        "benchmarking (e.g. --users 10000 --transactions 1000000). Never run it "
+        "against production."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--transactions', type=int, default=100000)
+        parser.add_argument('--days', type=int, default=365, help='Spread transactions over this many past days.')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, help='Random seed, for a reproducible history.')
+        parser.add_argument('--tag', help='Email tag for the generated users (random by default).')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        tag = benchdata.create_users(options['users'], tag=options['tag'])
+        self.stdout.write(f"Created {options['users']} users tagged {tag!r} in {time.perf_counter() - started:.1f}s.")
+
+        started = time.perf_counter()
+        written = benchdata.create_transactions(
+            tag, options['transactions'], days=options['days'], batch_size=options['batch_size'], seed=options['seed'],
+        )
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f"Created {written} transactions in {elapsed:.1f}s ({written / max(elapsed, 1e-9):.0f} rows/s).")
+        self.stdout.write(f"Remove them later with: python manage.py bench_endpoints --cleanup-tag {tag}")
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from accounts.outbox import drain
+
+
+class Command(BaseCommand):
+    help = "Deliver queued outbox emails in batches, retrying failures with backoff."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50, help='Emails sent per SMTP connection.')
+        parser.add_argument('--interval', type=float, default=5.0, help='Seconds to sleep when nothing is due.')
+        parser.add_argument('--once', action='store_true', help='Drain what is due now and exit.')
+
+    def handle(self, *args, **options):
+        while True:
+            sent, failed, retrying = drain(batch_size=options['batch_size'])
+            if sent or failed or retrying:
+                self.stdout.write(f"sent={sent} failed={failed} retrying={retrying}")
+            if options['once']:
+                return
+            if not sent:
+                time.sleep(options['interval'])
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts import balance_shards
+from accounts.models import Wallet
+
+
+class Command(BaseCommand):
+    help = "Turn sharded balances on (or off) for a hot wallet."
+
+    def add_arguments(self, parser):
+        parser.add_argument('wallet_number')
+        parser.add_argument('--shards', type=int, default=8, help='Number of sub-balance rows to spread credits over.')
+        parser.add_argument('--disable', action='store_true', help='Fold the shards back and stop sharding.')
+
+    def handle(self, *args, **options):
+        try:
+            wallet = Wallet.objects.get(wallet_number=options['wallet_number'])
+        except Wallet.DoesNotExist:
+            raise CommandError(f"Wallet {options['wallet_number']} not found.")
+
+        if options['disable']:
+            balance_shards.disable(wallet)
+            self.stdout.write(f"Wallet {wallet.wallet_number} is no longer sharded.")
+        else:
+            balance_shards.enable(wallet, options['shards'])
+            self.stdout.write(f"Wallet {wallet.wallet_number} now spreads credits over {options['shards']} shards.")
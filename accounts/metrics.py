@@ -0,0 +1,141 @@
+"""
+In-process metrics in the Prometheus text exposition format.
+
+A deliberately small registry (no client library): counters and
+histograms keyed by label values, each guarded by one lock, so recording
+costs a dict lookup and a bisect. Values are per process; with several
+gunicorn workers, scrape each worker or aggregate in Prometheus.
+
+MetricsMiddleware (middleware.py) fills the request metrics; ``timed()``
+wraps outbound calls.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100)
+SIZE_BUCKETS = (128, 512, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _format_number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            yield self.name, _format_labels(self.labelnames, key), value
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        # label values -> [per-bucket counts..., +Inf count, sum]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * (len(self.buckets) + 2)
+            state[index] += 1
+            state[-1] += value
+
+    def samples(self):
+        with self._lock:
+            items = [(key, list(state)) for key, state in self._values.items()]
+        for key, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), state[:-1]):
+                cumulative += count
+                yield f'{self.name}_bucket', _format_labels(self.labelnames, key, [('le', _format_number(bound))]), cumulative
+            yield f'{self.name}_count', _format_labels(self.labelnames, key), cumulative
+            yield f'{self.name}_sum', _format_labels(self.labelnames, key), state[-1]
+
+
+REGISTRY = []
+
+
+def register(metric):
+    REGISTRY.append(metric)
+    return metric
+
+
+REQUEST_LATENCY = register(Histogram(
+    'afriflow_http_request_duration_seconds', 'Time spent producing a response, by view.',
+    ['view', 'method', 'status'],
+))
+REQUEST_QUERIES = register(Histogram(
+    'afriflow_http_request_db_queries', 'SQL queries issued per request, by view.',
+    ['view'], buckets=QUERY_COUNT_BUCKETS,
+))
+REQUEST_DB_TIME = register(Histogram(
+    'afriflow_http_request_db_duration_seconds', 'Time spent in SQL per request, by view.',
+    ['view'],
+))
+RESPONSE_SIZE = register(Histogram(
+    'afriflow_http_response_size_bytes', 'Response body size, by view (streaming responses excluded).',
+    ['view'], buckets=SIZE_BUCKETS,
+))
+OUTBOUND_LATENCY = register(Histogram(
+    'afriflow_outbound_request_duration_seconds', 'Time spent in calls to external services.',
+    ['service', 'outcome'],
+))
+
+
+@contextmanager
+def timed(service):
+    """Record how long the block takes as an outbound call to ``service``."""
+    started = time.perf_counter()
+    outcome = 'error'
+    try:
+        yield
+        outcome = 'ok'
+    finally:
+        OUTBOUND_LATENCY.observe(time.perf_counter() - started, service=service, outcome=outcome)
+
+
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines.append(f'# HELP {metric.name} {metric.documentation}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        for name, labels, value in metric.samples():
+            lines.append(f'{name}{labels} {_format_number(value)}')
+    return '\n'.join(lines) + '\n'
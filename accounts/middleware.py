@@ -0,0 +1,77 @@
+import time
+from contextlib import ExitStack, contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db import connections
+
+from . import metrics
+
+
+class QueryStats:
+    """A database execute wrapper that counts queries and their total time."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+
+
+@contextmanager
+def count_queries(stats):
+    """Run the block with ``stats`` wrapping every database connection."""
+    with ExitStack() as stack:
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(stats))
+        yield
+
+
+class MetricsMiddleware:
+    """
+    Record latency, SQL query count and time, and response size per resolved
+    URL name. Queries a streaming response runs after the view returns are
+    not included.
+
+    Both sync and async capable, so under ASGI it doesn't force async views
+    such as AsyncChatBotView onto a thread.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        stats = QueryStats()
+        started = time.perf_counter()
+        with count_queries(stats):
+            response = self.get_response(request)
+        self.record(request, response, stats, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        stats = QueryStats()
+        started = time.perf_counter()
+        with count_queries(stats):
+            response = await self.get_response(request)
+        self.record(request, response, stats, time.perf_counter() - started)
+        return response
+
+    def record(self, request, response, stats, elapsed):
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else '<unresolved>'
+        metrics.REQUEST_LATENCY.observe(elapsed, view=view, method=request.method, status=response.status_code)
+        metrics.REQUEST_QUERIES.observe(stats.count, view=view)
+        metrics.REQUEST_DB_TIME.observe(stats.duration, view=view)
+        if not response.streaming:
+            metrics.RESPONSE_SIZE.observe(len(response.content), view=view)
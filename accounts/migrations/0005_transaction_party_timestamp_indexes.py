@@ -0,0 +1,21 @@
+# Generated by Django 5.2.1 on 2026-10-18 04:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_customuser_is_email_verified'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['sender', '-timestamp', '-id'], name='txn_sender_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['receiver', '-timestamp', '-id'], name='txn_receiver_ts_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.1 on 2026-10-18 04:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0006_chatsession_summary'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='chatmessage',
+            index=models.Index(fields=['chat_session', '-timestamp', '-id'], name='chatmsg_session_ts_idx'),
+        ),
+    ]
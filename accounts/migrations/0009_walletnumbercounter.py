@@ -0,0 +1,35 @@
+# Generated by Django 5.2.1 on 2026-10-18 04:49
+
+from django.db import migrations, models
+
+SEQUENCE_NAME = 'accounts_wallet_number_seq'
+
+
+def create_allocator_state(apps, schema_editor):
+    WalletNumberCounter = apps.get_model('accounts', 'WalletNumberCounter')
+    WalletNumberCounter.objects.using(schema_editor.connection.alias).get_or_create(pk=1)
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(f'CREATE SEQUENCE IF NOT EXISTS {SEQUENCE_NAME} MINVALUE 0 START WITH 0')
+
+
+def drop_allocator_state(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(f'DROP SEQUENCE IF EXISTS {SEQUENCE_NAME}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0008_outboxemail'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WalletNumberCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('next_value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(create_allocator_state, drop_allocator_state),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 5.2.1 on 2026-10-18 04:59
+
+import uuid
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import Sum
+from django.utils import timezone
+
+
+def post_opening_balances(apps, schema_editor):
+    """Give every existing wallet an opening journal for its current balance."""
+    Wallet = apps.get_model('accounts', 'Wallet')
+    WalletBalanceShard = apps.get_model('accounts', 'WalletBalanceShard')
+    LedgerEntry = apps.get_model('accounts', 'LedgerEntry')
+    db = schema_editor.connection.alias
+
+    shard_totals = dict(
+        WalletBalanceShard.objects.using(db).values('wallet_id')
+        .annotate(total=Sum('balance')).values_list('wallet_id', 'total')
+    )
+    now = timezone.now()
+    entries = []
+    for pk, wallet_number, balance in Wallet.objects.using(db).values_list('pk', 'wallet_number', 'balance').iterator():
+        total = balance + (shard_totals.get(pk) or 0)
+        if not total:
+            continue
+        journal_id = uuid.uuid4()
+        entries.append(LedgerEntry(journal_id=journal_id, wallet_id=pk, account=f'wallet:{wallet_number}',
+                                   amount=total, entry_type='opening', created_at=now))
+        entries.append(LedgerEntry(journal_id=journal_id, account='equity:opening',
+                                   amount=-total, entry_type='opening', created_at=now))
+    LedgerEntry.objects.using(db).bulk_create(entries, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0010_wallet_balance_shards'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BalanceCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('as_of', models.DateTimeField()),
+                ('balance', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('wallet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='balance_checkpoints', to='accounts.wallet')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('wallet', 'as_of'), name='unique_wallet_checkpoint')],
+            },
+        ),
+        migrations.CreateModel(
+            name='LedgerEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('journal_id', models.UUIDField()),
+                ('account', models.CharField(max_length=50)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=14)),
+                ('entry_type', models.CharField(choices=[('opening', 'Opening balance'), ('deposit', 'Deposit'), ('transfer', 'Transfer')], max_length=10)),
+                ('reference', models.UUIDField(blank=True, db_index=True, null=True)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('wallet', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ledger_entries', to='accounts.wallet')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['wallet', 'created_at'], name='ledger_wallet_time_idx')],
+            },
+        ),
+        migrations.RunPython(post_opening_balances, migrations.RunPython.noop),
+    ]
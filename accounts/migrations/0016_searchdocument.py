@@ -0,0 +1,73 @@
+# Generated by Django 5.2.1 on 2026-10-18 05:35
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+# The full-text index over SearchDocument.body (see accounts/search.py).
+# SQLite rebuilds a table to alter it, which drops its triggers: a later
+# migration that alters accounts_searchdocument must recreate them there.
+FORWARD_SQL = {
+    'postgresql': [
+        "ALTER TABLE accounts_searchdocument ADD COLUMN document tsvector "
+        "GENERATED ALWAYS AS (to_tsvector('simple', body)) STORED",
+        "CREATE INDEX accounts_searchdocument_document_gin ON accounts_searchdocument USING GIN (document)",
+    ],
+    'sqlite': [
+        "CREATE VIRTUAL TABLE accounts_searchdocument_fts USING fts5("
+        "body, user_id, content='accounts_searchdocument', content_rowid='id', "
+        "tokenize='unicode61 remove_diacritics 2')",
+        "CREATE TRIGGER accounts_searchdocument_fts_insert AFTER INSERT ON accounts_searchdocument BEGIN "
+        "INSERT INTO accounts_searchdocument_fts(rowid, body, user_id) VALUES (new.id, new.body, new.user_id); END",
+        "CREATE TRIGGER accounts_searchdocument_fts_delete AFTER DELETE ON accounts_searchdocument BEGIN "
+        "INSERT INTO accounts_searchdocument_fts(accounts_searchdocument_fts, rowid, body, user_id) "
+        "VALUES ('delete', old.id, old.body, old.user_id); END",
+        "CREATE TRIGGER accounts_searchdocument_fts_update AFTER UPDATE ON accounts_searchdocument BEGIN "
+        "INSERT INTO accounts_searchdocument_fts(accounts_searchdocument_fts, rowid, body, user_id) "
+        "VALUES ('delete', old.id, old.body, old.user_id); "
+        "INSERT INTO accounts_searchdocument_fts(rowid, body, user_id) VALUES (new.id, new.body, new.user_id); END",
+    ],
+}
+REVERSE_SQL = {
+    'postgresql': [
+        "DROP INDEX accounts_searchdocument_document_gin",
+        "ALTER TABLE accounts_searchdocument DROP COLUMN document",
+    ],
+    'sqlite': [
+        "DROP TRIGGER accounts_searchdocument_fts_insert",
+        "DROP TRIGGER accounts_searchdocument_fts_delete",
+        "DROP TRIGGER accounts_searchdocument_fts_update",
+        "DROP TABLE accounts_searchdocument_fts",
+    ],
+}
+
+
+def run_vendor_sql(statements):
+    def run(apps, schema_editor):
+        for sql in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(sql)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0015_transactionarchive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('transaction', 'Transaction'), ('chat_message', 'Chat message')], max_length=12)),
+                ('body', models.TextField()),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('message', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='accounts.chatmessage')),
+                ('transaction', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='accounts.transaction')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_documents', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.RunPython(run_vendor_sql(FORWARD_SQL), run_vendor_sql(REVERSE_SQL)),
+    ]
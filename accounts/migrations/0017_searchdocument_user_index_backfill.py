@@ -0,0 +1,77 @@
+from django.db import migrations
+from django.db.models import Exists, OuterRef
+
+# On Postgres, index the owner together with the tsvector (btree_gin), so a
+# query only walks one user's postings, as the SQLite FTS table does.
+FORWARD_SQL = {
+    'postgresql': [
+        "CREATE EXTENSION IF NOT EXISTS btree_gin",
+        "DROP INDEX accounts_searchdocument_document_gin",
+        "CREATE INDEX accounts_searchdocument_user_document_gin ON accounts_searchdocument USING GIN (user_id, document)",
+    ],
+}
+REVERSE_SQL = {
+    'postgresql': [
+        "DROP INDEX accounts_searchdocument_user_document_gin",
+        "CREATE INDEX accounts_searchdocument_document_gin ON accounts_searchdocument USING GIN (document)",
+    ],
+}
+BATCH_SIZE = 2000
+
+
+def run_vendor_sql(statements):
+    def run(apps, schema_editor):
+        for sql in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(sql)
+    return run
+
+
+def backfill(apps, schema_editor):
+    """
+    Index the transactions and chat messages that have no documents yet,
+    i.e. everything written before 0016. Mirrors search.transaction_documents()
+    and search.message_documents(), which can't be used with historical models.
+    """
+    SearchDocument = apps.get_model('accounts', 'SearchDocument')
+    Transaction = apps.get_model('accounts', 'Transaction')
+    ChatMessage = apps.get_model('accounts', 'ChatMessage')
+    db = schema_editor.connection.alias
+
+    def documents():
+        transactions = (
+            Transaction.objects.using(db)
+            .exclude(Exists(SearchDocument.objects.using(db).filter(transaction_id=OuterRef('pk'))))
+            .values_list('pk', 'sender_id', 'receiver_id', 'description', 'receiver_name', 'timestamp')
+        )
+        for pk, sender_id, receiver_id, description, receiver_name, timestamp in transactions.iterator(chunk_size=BATCH_SIZE):
+            body = ' '.join(part for part in (description, receiver_name) if part)
+            for user_id in {sender_id, receiver_id}:
+                yield SearchDocument(user_id=user_id, kind='transaction', transaction_id=pk, body=body, created_at=timestamp)
+
+        messages = (
+            ChatMessage.objects.using(db).exclude(role='system')
+            .exclude(Exists(SearchDocument.objects.using(db).filter(message_id=OuterRef('pk'))))
+            .values_list('pk', 'chat_session__user_id', 'content', 'timestamp')
+        )
+        for pk, user_id, content, timestamp in messages.iterator(chunk_size=BATCH_SIZE):
+            yield SearchDocument(user_id=user_id, kind='chat_message', message_id=pk, body=content, created_at=timestamp)
+
+    batch = []
+    for document in documents():
+        batch.append(document)
+        if len(batch) == BATCH_SIZE:
+            SearchDocument.objects.using(db).bulk_create(batch)
+            batch = []
+    SearchDocument.objects.using(db).bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0016_searchdocument'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_vendor_sql(FORWARD_SQL), run_vendor_sql(REVERSE_SQL)),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
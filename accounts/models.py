@@ -1,10 +1,23 @@
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
-from django.db import models
-import random
+from django.db import connections, models
+from django.db.models import Case, Count, F, OuterRef, Subquery, Value, When
+from django.db.models.functions import Substr
 from django.conf import settings
 import uuid
 from django.utils import timezone
 
+def bump_version(instance, save_kwargs):
+    """
+    Increment ``version`` on an update ``save()``. Balance changes don't go
+    through here: they bump it in the same UPDATE (see transfers.py).
+    """
+    if instance._state.adding:
+        return
+    instance.version += 1
+    if save_kwargs.get('update_fields') is not None:
+        save_kwargs['update_fields'] = {*save_kwargs['update_fields'], 'version'}
+
+
 class CustomUserManager(BaseUserManager):
     def create_user(self, email, password=None, **extra_fields):
         if not email:
@@ -50,12 +63,18 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
 
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
+    # Bumped on every save; the user-info ETag is built from it (see etags.py).
+    version = models.PositiveBigIntegerField(default=1)
 
     objects = CustomUserManager()
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['full_name', 'phone_number', 'country', 'state_province', 'preferred_language', 'business_type', 'language']
 
+    def save(self, *args, **kwargs):
+        bump_version(self, kwargs)
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return self.email
     
@@ -65,24 +84,142 @@ class Wallet(models.Model):
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='wallet')
     wallet_number = models.CharField(max_length=6, unique=True, blank=True)
     balance = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
+    # When > 0, credits are spread over this many WalletBalanceShard rows
+    # instead of all landing on ``balance`` (see balance_shards.py).
+    shard_count = models.PositiveSmallIntegerField(default=0)
+    # Bumped by every save and every balance UPDATE; the wallet ETag is
+    # built from it (see etags.py).
+    version = models.PositiveBigIntegerField(default=1)
+
+    @property
+    def total_balance(self):
+        if not self.shard_count:
+            return self.balance
+        shards = self.shards.aggregate(total=models.Sum('balance'))['total'] or 0
+        return self.balance + shards
 
     def save(self, *args, **kwargs):
         if not self.wallet_number:
             self.wallet_number = self._generate_unique_wallet_number()
+        bump_version(self, kwargs)
         super().save(*args, **kwargs)
 
     def _generate_unique_wallet_number(self):
-        while True:
-            number = f"{random.randint(0, 999999):06d}"
-            if not Wallet.objects.filter(wallet_number=number).exists():
-                return number
+        from .wallet_numbers import allocate_wallet_numbers
+        return allocate_wallet_numbers(1, using=self._state.db or 'default')[0]
 
     def __str__(self):
         return f"{self.user.email} Wallet {self.wallet_number} - Balance: {self.balance}"
 
 
 
-from django.db.models.signals import post_save
+class WalletBalanceShard(models.Model):
+    """One of the sub-balances a hot wallet's credits are spread across."""
+    wallet = models.ForeignKey(Wallet, on_delete=models.CASCADE, related_name='shards')
+    shard = models.PositiveSmallIntegerField()
+    balance = models.DecimalField(max_digits=12, decimal_places=2, default=0.00)
+    # Bumped with every credit, so that the wallet's ETag changes without
+    # the credit having to touch (and contend on) the wallet row.
+    version = models.PositiveBigIntegerField(default=1)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['wallet', 'shard'], name='unique_wallet_shard'),
+        ]
+
+    def __str__(self):
+        return f"Shard {self.shard} of wallet {self.wallet_id}: {self.balance}"
+
+
+class LedgerEntry(models.Model):
+    """
+    One leg of a double-entry journal. The entries sharing a ``journal_id``
+    sum to zero; rows are only ever inserted (see ledger.py).
+    """
+    ENTRY_TYPE_CHOICES = [
+        ('opening', 'Opening balance'),
+        ('deposit', 'Deposit'),
+        ('transfer', 'Transfer'),
+    ]
+
+    journal_id = models.UUIDField()
+    # Null for the non-wallet side of a journal, and if the wallet is later
+    # deleted; ``account`` still names it either way.
+    wallet = models.ForeignKey(Wallet, on_delete=models.SET_NULL, null=True, blank=True, related_name='ledger_entries')
+    account = models.CharField(max_length=50)
+    amount = models.DecimalField(max_digits=14, decimal_places=2)
+    entry_type = models.CharField(max_length=10, choices=ENTRY_TYPE_CHOICES)
+    # transaction_id of the Transaction a transfer entry belongs to.
+    reference = models.UUIDField(null=True, blank=True, db_index=True)
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['wallet', 'created_at'], name='ledger_wallet_time_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError('Ledger entries are append-only.')
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.entry_type} {self.amount} on {self.account}"
+
+
+class BalanceCheckpoint(models.Model):
+    """A wallet's ledger balance including every entry up to ``as_of``."""
+    wallet = models.ForeignKey(Wallet, on_delete=models.CASCADE, related_name='balance_checkpoints')
+    as_of = models.DateTimeField()
+    balance = models.DecimalField(max_digits=14, decimal_places=2)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['wallet', 'as_of'], name='unique_wallet_checkpoint'),
+        ]
+
+    def __str__(self):
+        return f"Wallet {self.wallet_id} balance {self.balance} as of {self.as_of}"
+
+
+class DailyTransactionRollup(models.Model):
+    """
+    A user's money in or out on one day, kept up to date by rollups.py as
+    transfers and deposits commit.
+    """
+    DIRECTION_CHOICES = [
+        ('incoming', 'Incoming'),
+        ('outgoing', 'Outgoing'),
+        ('deposit', 'Deposit'),
+    ]
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='daily_rollups')
+    day = models.DateField()
+    direction = models.CharField(max_length=10, choices=DIRECTION_CHOICES)
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'day', 'direction'], name='unique_user_day_direction'),
+        ]
+
+    def __str__(self):
+        return f"{self.direction} {self.total} ({self.count}) for user {self.user_id} on {self.day}"
+
+
+class WalletNumberCounter(models.Model):
+    """
+    Single-row counter behind wallet number allocation on databases without
+    native sequences (Postgres uses a real sequence, see wallet_numbers.py).
+    """
+    next_value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"Next wallet number index: {self.next_value}"
+
+
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
 
 @receiver(post_save, sender=CustomUser)
@@ -92,6 +229,101 @@ def create_user_wallet(sender, instance, created, **kwargs):
         Wallet.objects.create(user=instance)
 
 
+@receiver(post_save, sender=CustomUser)
+def forget_cached_recipient_name(sender, instance, created, update_fields=None, **kwargs):
+    if created or (update_fields is not None and 'full_name' not in update_fields):
+        return
+    from .recipients import invalidate
+    invalidate(*Wallet.objects.filter(user=instance).values_list('wallet_number', flat=True))
+
+
+@receiver(post_save, sender=CustomUser)
+def forget_cached_auth_user(sender, instance, created, **kwargs):
+    if not created:
+        from .authentication import forget_cached_users
+        forget_cached_users(instance.pk)
+
+
+@receiver(post_save, sender=Wallet)
+@receiver(post_delete, sender=Wallet)
+def forget_cached_wallet_owner(sender, instance, **kwargs):
+    from .authentication import forget_cached_users
+    forget_cached_users(instance.user_id)
+
+
+@receiver(pre_save, sender=Wallet)
+def forget_previous_wallet_number(sender, instance, **kwargs):
+    if instance.pk is None:
+        return
+    from .recipients import invalidate
+    invalidate(*Wallet.objects.filter(pk=instance.pk).exclude(wallet_number=instance.wallet_number).values_list('wallet_number', flat=True))
+
+
+@receiver(post_save, sender=Wallet)
+@receiver(post_delete, sender=Wallet)
+def forget_cached_recipient(sender, instance, **kwargs):
+    from .recipients import invalidate
+    invalidate(instance.wallet_number)
+
+
+
+
+class TransactionQuerySet(models.QuerySet):
+    def annotate_for(self, user):
+        """
+        Annotate the party names and ``user``'s direction in SQL so the
+        serializer never has to load the sender/receiver rows.
+        """
+        return self.annotate(
+            sender_full_name=F('sender__full_name'),
+            receiver_full_name=F('receiver__full_name'),
+            transaction_direction=Case(
+                When(sender=user, then=Value('outgoing')),
+                When(receiver=user, then=Value('incoming')),
+                default=Value('unknown'),
+                output_field=models.CharField(),
+            ),
+        )
+
+    def involving(self, user, direction=None, before=None, limit=None):
+        """
+        Transactions where ``user`` is the sender or the receiver, newest first.
+
+        Rather than ``WHERE sender = u OR receiver = u`` (which can't use
+        either per-party index), this is a UNION of two index-backed branches.
+        ``before``/``limit`` push a keyset window into each branch so only
+        ``limit`` rows per side are ever read.
+        """
+        from .pagination import keyset_before
+
+        ordering = ('-timestamp', '-id')
+        branches = []
+        if direction in (None, 'outgoing'):
+            branches.append(self.filter(sender=user))
+        if direction in (None, 'incoming'):
+            branches.append(self.filter(receiver=user))
+
+        if len(branches) == 1:
+            queryset = branches[0]
+            if before is not None:
+                queryset = queryset.filter(keyset_before(before))
+            queryset = queryset.order_by(*ordering)
+            return queryset[:limit] if limit is not None else queryset
+
+        # SQLite can't LIMIT inside a compound statement; there the branches
+        # are only keyset-filtered and the outer LIMIT does the rest.
+        branch_limit = limit
+        if not connections[self.db].features.supports_slicing_ordering_in_compound:
+            branch_limit = None
+
+        windowed = []
+        for branch in branches:
+            if before is not None:
+                branch = branch.filter(keyset_before(before))
+            if branch_limit is not None:
+                branch = branch.order_by(*ordering)[:branch_limit]
+            windowed.append(branch)
+        return windowed[0].union(windowed[1]).order_by(*ordering)
 
 
 class Transaction(models.Model):
@@ -104,15 +336,65 @@ class Transaction(models.Model):
     description = models.TextField(blank=True, null=True)
     timestamp = models.DateTimeField(default=timezone.now)
 
+    objects = TransactionQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['sender', '-timestamp', '-id'], name='txn_sender_ts_idx'),
+            models.Index(fields=['receiver', '-timestamp', '-id'], name='txn_receiver_ts_idx'),
+        ]
+
     def __str__(self):
         return f"Transaction {self.transaction_id} from {self.sender.email} to {self.receiver.email}"
+
+
+class TransactionArchive(models.Model):
+    """
+    One user's transactions for one calendar month, moved out of the
+    Transaction table by archive.py and stored as zlib-compressed JSON in
+    the shape the transaction API returns.
+    """
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='transaction_archives')
+    month = models.DateField()
+    row_count = models.PositiveIntegerField(default=0)
+    payload = models.BinaryField()
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'month'], name='unique_user_archive_month'),
+        ]
+
+    def __str__(self):
+        return f"{self.row_count} archived transactions of user {self.user_id} for {self.month:%Y-%m}"
     
+class ChatSessionQuerySet(models.QuerySet):
+    def with_overview(self, preview_length=120):
+        """
+        Annotate each session with its message count and a preview of the
+        latest message, all in the listing query itself.
+        """
+        latest = ChatMessage.objects.filter(chat_session=OuterRef('pk')).order_by('-timestamp', '-id')
+        return self.annotate(
+            message_count=Count('messages'),
+            last_message_role=Subquery(latest.values('role')[:1]),
+            last_message_preview=Substr(Subquery(latest.values('content')[:1]), 1, preview_length),
+            last_message_at=Subquery(latest.values('timestamp')[:1]),
+        )
+
+
 class ChatSession(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='chat_sessions')
     session_id = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
     title = models.CharField(max_length=255, blank=True, null=True)  # Optional title for the chat session
     created_at = models.DateTimeField(default=timezone.now)
     updated_at = models.DateTimeField(auto_now=True)
+    # Rolling summary of the turns that no longer fit in the LLM context,
+    # and the id of the last ChatMessage folded into it.
+    summary = models.TextField(blank=True, default='')
+    summary_upto = models.BigIntegerField(default=0)
+
+    objects = ChatSessionQuerySet.as_manager()
 
     def __str__(self):
         return f"ChatSession {self.session_id} for {self.user.email}"
@@ -129,5 +411,106 @@ class ChatMessage(models.Model):
     content = models.TextField()
     timestamp = models.DateTimeField(default=timezone.now)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['chat_session', '-timestamp', '-id'], name='chatmsg_session_ts_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.role} message at {self.timestamp} in session {self.chat_session.session_id}"
+
+
+class OutboxEmail(models.Model):
+    """An email queued by a request and delivered later by ``send_outbox``."""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+
+    to_email = models.EmailField()
+    from_email = models.CharField(max_length=255)
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(default=timezone.now)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.status} email to {self.to_email}: {self.subject}"
+
+
+class IdempotencyKey(models.Model):
+    """
+    A client-supplied ``Idempotency-Key`` and the response it produced, so
+    retries of the same request are answered without running it again.
+    """
+    STATUS_CHOICES = [
+        ('in_flight', 'In flight'),
+        ('completed', 'Completed'),
+    ]
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='idempotency_keys')
+    key = models.CharField(max_length=255)
+    request_hash = models.CharField(max_length=64)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='in_flight')
+    response_status = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.TextField(blank=True, default='')
+    claimed_at = models.DateTimeField(default=timezone.now)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='unique_user_idempotency_key'),
+        ]
+
+    def __str__(self):
+        return f"{self.status} idempotency key {self.key} for user {self.user_id}"
+
+
+class SearchDocument(models.Model):
+    """
+    The searchable text of a transaction or chat message, one row per user
+    who may find it (both parties of a transfer). The full-text index over
+    ``body`` is not a Django field: migration 0016 adds a tsvector column
+    and GIN index on Postgres, or an FTS5 table kept in sync by triggers on
+    SQLite. See search.py.
+    """
+    KIND_CHOICES = [
+        ('transaction', 'Transaction'),
+        ('chat_message', 'Chat message'),
+    ]
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='search_documents')
+    kind = models.CharField(max_length=12, choices=KIND_CHOICES)
+    transaction = models.ForeignKey(Transaction, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    message = models.ForeignKey(ChatMessage, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    body = models.TextField()
+    created_at = models.DateTimeField(default=timezone.now)
+
     def __str__(self):
-        return f"{self.role} message at {self.timestamp} in session {self.chat_session.session_id}"
\ No newline at end of file
+        return f"{self.kind} search document for user {self.user_id}"
+
+
+@receiver(post_save, sender=Transaction)
+def index_transaction(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    from . import search
+    search.index_transactions([instance], replace=not created)
+
+
+@receiver(post_save, sender=ChatMessage)
+def index_chat_message(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    from . import search
+    search.index_messages([instance], replace=not created)
@@ -0,0 +1,127 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from . import metrics
+from .models import OutboxEmail
+
+MAX_ATTEMPTS = getattr(settings, 'EMAIL_OUTBOX_MAX_ATTEMPTS', 8)
+BACKOFF_BASE_SECONDS = getattr(settings, 'EMAIL_OUTBOX_BACKOFF_BASE_SECONDS', 30)
+BACKOFF_MAX_SECONDS = getattr(settings, 'EMAIL_OUTBOX_BACKOFF_MAX_SECONDS', 60 * 60)
+# How long a claimed batch is hidden from other workers; a worker that dies
+# mid-batch just lets its rows come due again after this.
+CLAIM_LEASE_SECONDS = 5 * 60
+
+
+def enqueue_email(subject, message, from_email, recipient_list):
+    """Queue one email per recipient. Cheap enough to call inside a request."""
+    return OutboxEmail.objects.bulk_create([
+        OutboxEmail(to_email=recipient, from_email=from_email, subject=subject, body=message)
+        for recipient in recipient_list
+    ])
+
+
+def backoff(attempts):
+    """Exponential delay before the next try after ``attempts`` failures."""
+    return timedelta(seconds=min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** (attempts - 1)))
+
+
+def claim_batch(batch_size):
+    """
+    Take up to ``batch_size`` due emails and lease them to this worker.
+
+    On Postgres ``SKIP LOCKED`` lets several workers drain in parallel
+    without handing out the same row twice.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        rows = list(
+            OutboxEmail.objects
+            .select_for_update(skip_locked=True)
+            .filter(status='pending', next_attempt_at__lte=now)
+            .order_by('next_attempt_at', 'id')[:batch_size]
+        )
+        if rows:
+            OutboxEmail.objects.filter(pk__in=[row.pk for row in rows]).update(
+                next_attempt_at=now + timedelta(seconds=CLAIM_LEASE_SECONDS),
+            )
+    return rows
+
+
+def deliver(rows, connection):
+    """
+    Send ``rows`` over a single SMTP connection and record the outcome of
+    each. Returns ``(sent, failed)`` counts for this batch.
+    """
+    sent = failed = 0
+    now = timezone.now()
+    try:
+        with metrics.timed('smtp'):
+            connection.open()
+    except Exception as exc:
+        connection_error = exc
+    else:
+        connection_error = None
+
+    try:
+        for row in rows:
+            if connection_error is None:
+                message = EmailMessage(row.subject, row.body, row.from_email, [row.to_email], connection=connection)
+                try:
+                    with metrics.timed('smtp'):
+                        connection.send_messages([message])
+                except Exception as exc:
+                    error = exc
+                    # The session may be unusable after an SMTP error; start a
+                    # fresh one for the rest of the batch.
+                    connection.close()
+                    try:
+                        connection.open()
+                    except Exception as exc:
+                        connection_error = exc
+                else:
+                    error = None
+            else:
+                error = connection_error
+
+            row.attempts += 1
+            if error is None:
+                row.status = 'sent'
+                row.sent_at = timezone.now()
+                row.last_error = ''
+                sent += 1
+            else:
+                row.last_error = str(error)[:1000]
+                if row.attempts >= MAX_ATTEMPTS:
+                    row.status = 'failed'
+                    failed += 1
+                else:
+                    row.next_attempt_at = now + backoff(row.attempts)
+    finally:
+        connection.close()
+
+    OutboxEmail.objects.bulk_update(rows, ['status', 'attempts', 'next_attempt_at', 'last_error', 'sent_at'])
+    return sent, failed
+
+
+def drain(batch_size=50, connection=None):
+    """
+    Deliver everything that is currently due, one batch (and one SMTP
+    connection) at a time. Returns ``(sent, failed, retrying)`` totals.
+    """
+    connection = connection or get_connection()
+    totals = [0, 0, 0]
+    while True:
+        rows = claim_batch(batch_size)
+        if not rows:
+            return tuple(totals)
+        sent, failed = deliver(rows, connection)
+        totals[0] += sent
+        totals[1] += failed
+        totals[2] += len(rows) - sent - failed
+        if sent + failed < len(rows):
+            # Whatever is left is backing off; don't spin on it now.
+            return tuple(totals)
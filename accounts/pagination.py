@@ -0,0 +1,143 @@
+import base64
+from collections import OrderedDict
+from datetime import datetime
+
+from django.db.models import Q
+from rest_framework.exceptions import ParseError
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+# The largest value of a BigAutoField (and of a SQLite INTEGER).
+MAX_ID = 2 ** 63 - 1
+
+
+def keyset_before(position):
+    """Rows strictly after ``position`` in ``(-timestamp, -id)`` order."""
+    timestamp, pk = position
+    return Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=pk)
+
+
+class KeysetPagination(BasePagination):
+    """
+    Keyset pagination over ``(timestamp, id)``, newest first.
+
+    Each page is fetched with ``WHERE (timestamp, id) < cursor ORDER BY
+    timestamp DESC, id DESC LIMIT n`` so the cost of a page does not depend
+    on how deep into the history the client is. When ``opt_in`` is set the
+    paginator only kicks in if the client sends ``cursor`` or ``page_size``,
+    so existing callers keep getting the plain list.
+    """
+    page_size = 50
+    max_page_size = 200
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    ordering = ('-timestamp', '-id')
+    opt_in = False
+    invalid_cursor_message = 'Invalid cursor'
+
+    def is_requested(self, request):
+        if not self.opt_in:
+            return True
+        params = request.query_params
+        return self.cursor_query_param in params or self.page_size_query_param in params
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if size <= 0:
+            return self.page_size
+        return min(size, self.max_page_size)
+
+    def get_position(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            decoded = base64.urlsafe_b64decode(encoded.encode('ascii')).decode('ascii')
+            timestamp, pk = decoded.rsplit('|', 1)
+            timestamp, pk = datetime.fromisoformat(timestamp), int(pk)
+        except (TypeError, ValueError, UnicodeError):
+            raise ParseError(self.invalid_cursor_message)
+        # Cursors we issue carry an aware timestamp and a real id; an edited
+        # one could otherwise compare naive datetimes or overflow the column.
+        if timestamp.tzinfo is None or not 0 < pk <= MAX_ID:
+            raise ParseError(self.invalid_cursor_message)
+        return timestamp, pk
+
+    def get_window(self, request):
+        """
+        Return ``(position, limit)`` for the page being requested, or
+        ``(None, None)`` when pagination is not in use.
+
+        Views whose queryset cannot be filtered after the fact (e.g. a
+        UNION) use this to push the keyset condition into each branch.
+        """
+        if not self.is_requested(request):
+            return None, None
+        return self.get_position(request), self.get_page_size(request) + 1
+
+    def encode_cursor(self, item):
+        # ``item`` is a model instance or a ``.values()`` row including ``id``.
+        timestamp, pk = (item['timestamp'], item['id']) if isinstance(item, dict) else (item.timestamp, item.pk)
+        raw = f"{timestamp.isoformat()}|{pk}"
+        return base64.urlsafe_b64encode(raw.encode('ascii')).decode('ascii')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if not self.is_requested(request):
+            return None
+
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        position = self.get_position(request)
+
+        # Combined (UNION) or sliced querysets can't be filtered any further;
+        # the view has already applied the window via get_window().
+        if not (queryset.query.combinator or queryset.query.is_sliced):
+            if position is not None:
+                queryset = queryset.filter(keyset_before(position))
+            queryset = queryset.order_by(*self.ordering)
+
+        rows = list(queryset[:self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        url = replace_query_param(url, self.page_size_query_param, self.page_size)
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.page[-1]))
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class TransactionCursorPagination(KeysetPagination):
+    opt_in = True
+
+
+class ChatMessageCursorPagination(KeysetPagination):
+    page_size = 30
+
+
+class ChatSessionPagination(PageNumberPagination):
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
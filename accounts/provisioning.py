@@ -0,0 +1,91 @@
+"""
+Bulk account provisioning, e.g. onboarding every member of a cooperative.
+
+``CustomUser.objects.create_user`` hashes one password, saves one row and
+lets the ``post_save`` receiver create one wallet. Here passwords are
+hashed in parallel in a process pool, users and wallets are written with
+``bulk_create`` in batches, and wallet numbers are reserved in one go.
+No signals are sent for the new rows.
+
+Provisioned accounts are created with their email already verified: the
+administrator provisioning them vouches for the addresses.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+
+from .models import CustomUser, Wallet
+from .wallet_numbers import allocate_wallet_numbers
+
+USER_FIELDS = [
+    'email', 'full_name', 'phone_number', 'country', 'state_province',
+    'preferred_language', 'language', 'business_type', 'pin',
+]
+# Below this many passwords per worker, a pool costs more than it saves.
+MIN_PASSWORDS_PER_WORKER = 4
+
+
+def _setup_worker():
+    # Under the "spawn" start method a worker starts without Django set up.
+    import django
+    from django.apps import apps
+    if not apps.ready:
+        django.setup()
+
+
+def hash_passwords(passwords, workers=None):
+    """
+    Return ``make_password()`` of each password, in order, spreading the
+    work over ``workers`` processes (default: one per CPU). A missing
+    password gets an unusable one, which costs nothing to make.
+    """
+    workers = workers or os.cpu_count() or 1
+    to_hash = [(i, password) for i, password in enumerate(passwords) if password]
+    hashed = [make_password(None)] * len(passwords)
+
+    if workers == 1 or len(to_hash) < workers * MIN_PASSWORDS_PER_WORKER:
+        results = [make_password(password) for _, password in to_hash]
+    else:
+        chunksize = max(1, len(to_hash) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers, initializer=_setup_worker) as pool:
+            results = list(pool.map(make_password, [password for _, password in to_hash], chunksize=chunksize))
+
+    for (i, _), value in zip(to_hash, results):
+        hashed[i] = value
+    return hashed
+
+
+def provision_users(rows, batch_size=1000, workers=None):
+    """
+    Create a user and an empty wallet for each row (a dict of USER_FIELDS
+    plus an optional ``password``). All rows are created or none are.
+    Returns ``(email, wallet_number)`` pairs in input order.
+    """
+    passwords = hash_passwords([row.get('password') for row in rows], workers=workers)
+    users = [
+        CustomUser(
+            **{field: row[field] for field in USER_FIELDS if field in row},
+            password=password,
+            is_email_verified=True,
+        )
+        for row, password in zip(rows, passwords)
+    ]
+    for user in users:
+        user.email = CustomUser.objects.normalize_email(user.email)
+
+    with transaction.atomic():
+        CustomUser.objects.bulk_create(users, batch_size=batch_size)
+        if users and users[0].pk is None:
+            # The backend didn't hand back primary keys from the bulk insert.
+            pks = dict(CustomUser.objects.filter(email__in=[u.email for u in users]).values_list('email', 'pk'))
+            for user in users:
+                user.pk = pks[user.email]
+
+        numbers = allocate_wallet_numbers(len(users))
+        Wallet.objects.bulk_create(
+            [Wallet(user_id=user.pk, wallet_number=number) for user, number in zip(users, numbers)],
+            batch_size=batch_size,
+        )
+    return [(user.email, number) for user, number in zip(users, numbers)]
@@ -0,0 +1,48 @@
+"""
+Read-through cache of wallet number -> recipient, for the transfer verify
+step the app calls as the user types a wallet number.
+
+Entries live in the Django cache named by ``RECIPIENT_CACHE_ALIAS``
+(locmem per process by default, a shared backend such as Redis in
+production), and are dropped by the signal receivers in models.py when a
+wallet or its owner's name changes. Unknown numbers are cached too, for a
+shorter time, since most keystrokes produce one.
+"""
+from django.conf import settings
+from django.core.cache import caches
+
+from .models import Wallet
+
+CACHE_ALIAS = getattr(settings, 'RECIPIENT_CACHE_ALIAS', 'default')
+CACHE_TIMEOUT = getattr(settings, 'RECIPIENT_CACHE_TIMEOUT', 10 * 60)
+MISS_CACHE_TIMEOUT = getattr(settings, 'RECIPIENT_MISS_CACHE_TIMEOUT', 30)
+
+
+def cache_key(wallet_number):
+    return f'recipient:{wallet_number}'
+
+
+def resolve(wallet_number):
+    """
+    Return ``{'user_id': ..., 'full_name': ...}`` for the wallet numbered
+    ``wallet_number``, or None if there is no such wallet.
+    """
+    cache = caches[CACHE_ALIAS]
+    key = cache_key(wallet_number)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached or None
+
+    row = Wallet.objects.filter(wallet_number=wallet_number).values('user_id', 'user__full_name').first()
+    if row is None:
+        cache.set(key, {}, MISS_CACHE_TIMEOUT)
+        return None
+    recipient = {'user_id': row['user_id'], 'full_name': row['user__full_name']}
+    cache.set(key, recipient, CACHE_TIMEOUT)
+    return recipient
+
+
+def invalidate(*wallet_numbers):
+    keys = [cache_key(number) for number in wallet_numbers if number]
+    if keys:
+        caches[CACHE_ALIAS].delete_many(keys)
@@ -0,0 +1,100 @@
+"""
+Cache of chatbot replies to context-free questions.
+
+Many conversations open with near-identical questions ("how do I export
+shea butter from Ghana to Nigeria?"), each costing a 10-30 s LLM call. When
+the payload is nothing but the system prompt and one user message, the
+reply depends only on the model, the system prompt and the question, so it
+is cached under a key built from those three, with the question
+normalized: case, whitespace, typographic quotes, trailing punctuation and
+common country-name aliases. Later turns, and sessions carrying a
+summary, are never served from or written to the cache.
+
+Entries live in the Django cache named by ``CHAT_REPLY_CACHE_ALIAS``; its
+backend provides the eviction (LRU with ``MAX_ENTRIES`` for locmem, the
+server's policy for Redis) and ``CHAT_REPLY_CACHE_TIMEOUT`` the TTL.
+"""
+import hashlib
+import re
+import unicodedata
+
+from django.conf import settings
+from django.core.cache import caches
+
+from . import metrics
+
+CACHE_ALIAS = getattr(settings, 'CHAT_REPLY_CACHE_ALIAS', 'default')
+CACHE_TIMEOUT = getattr(settings, 'CHAT_REPLY_CACHE_TIMEOUT', 24 * 60 * 60)
+
+LOOKUPS = metrics.register(metrics.Counter(
+    'afriflow_chat_reply_cache_lookups_total', 'Chatbot reply cache lookups, by outcome (hit, miss or ineligible).',
+    ['outcome'],
+))
+
+# Alternative names -> the name used in the cache key. Only unambiguous
+# aliases: "car" or "sa" would rewrite ordinary words.
+COUNTRY_ALIASES = {
+    "cote d'ivoire": "côte d'ivoire",
+    "ivory coast": "côte d'ivoire",
+    "drc": "democratic republic of the congo",
+    "dr congo": "democratic republic of the congo",
+    "dr. congo": "democratic republic of the congo",
+    "congo-kinshasa": "democratic republic of the congo",
+    "democratic republic of congo": "democratic republic of the congo",
+    "congo-brazzaville": "republic of the congo",
+    "republic of congo": "republic of the congo",
+    "the gambia": "gambia",
+    "swaziland": "eswatini",
+    "cape verde": "cabo verde",
+    "rsa": "south africa",
+    "naija": "nigeria",
+    "united republic of tanzania": "tanzania",
+}
+_ALIAS_PATTERN = re.compile(
+    r"(?<!\w)(" + '|'.join(re.escape(alias) for alias in sorted(COUNTRY_ALIASES, key=len, reverse=True)) + r")(?!\w)"
+)
+_QUOTES = str.maketrans({'‘': "'", '’': "'", '“': '"', '”': '"'})
+
+
+def normalize(prompt):
+    text = unicodedata.normalize('NFC', prompt).translate(_QUOTES).casefold()
+    text = ' '.join(text.split()).rstrip(' ?!.')
+    return _ALIAS_PATTERN.sub(lambda match: COUNTRY_ALIASES[match.group(1)], text)
+
+
+def key_for(payload):
+    """
+    The cache key for an LLM payload, or None if its reply may depend on
+    anything besides the model, the system prompt and one user question.
+    """
+    messages = payload['messages']
+    if len(messages) != 2 or messages[0]['role'] != 'system' or messages[1]['role'] != 'user':
+        return None
+    system_hash = hashlib.sha256(messages[0]['content'].encode()).hexdigest()[:16]
+    prompt_hash = hashlib.sha256(normalize(messages[1]['content']).encode()).hexdigest()
+    return f"chat-reply:{payload['model']}:{system_hash}:{prompt_hash}"
+
+
+def _outcome(key, reply):
+    outcome = 'ineligible' if key is None else 'miss' if reply is None else 'hit'
+    LOOKUPS.inc(outcome=outcome)
+    return reply
+
+
+def lookup(key):
+    """The cached reply for ``key`` (None if missing or ``key`` is None)."""
+    return _outcome(key, caches[CACHE_ALIAS].get(key) if key else None)
+
+
+async def alookup(key):
+    return _outcome(key, await caches[CACHE_ALIAS].aget(key) if key else None)
+
+
+def store(key, reply):
+    if key and reply:
+        caches[CACHE_ALIAS].set(key, reply, CACHE_TIMEOUT)
+
+
+async def astore(key, reply):
+    if key and reply:
+        await caches[CACHE_ALIAS].aset(key, reply, CACHE_TIMEOUT)
@@ -0,0 +1,106 @@
+"""
+Per-user daily inflow/outflow totals.
+
+DailyTransactionRollup holds one row per (user, day, direction). The
+transfer services hand their movements to ``record_on_commit()``, which
+adds them to the rollups with a single ``INSERT ... ON CONFLICT DO UPDATE``
+once the transfer has committed, outside the transfer's own row locks.
+If a process dies between the commit and the upsert the increment is
+lost; ``rebuild_rollups`` recomputes any range of days from the
+transactions themselves.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import connections, router, transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from . import archive
+from .models import DailyTransactionRollup, LedgerEntry, Transaction
+
+UPSERT_BATCH_SIZE = 500
+
+
+def upsert(rows, using=None):
+    """
+    Add ``{(user_id, day, direction): (total, count)}`` to the rollups,
+    creating rows that don't exist yet. Works on Postgres and SQLite.
+    """
+    using = using or router.db_for_write(DailyTransactionRollup)
+    connection = connections[using]
+    ops = connection.ops
+    table = ops.quote_name(DailyTransactionRollup._meta.db_table)
+    total, count = ops.quote_name('total'), ops.quote_name('count')
+    items = list(rows.items())
+
+    with connection.cursor() as cursor:
+        for start in range(0, len(items), UPSERT_BATCH_SIZE):
+            batch = items[start:start + UPSERT_BATCH_SIZE]
+            values = ', '.join(['(%s, %s, %s, %s, %s)'] * len(batch))
+            params = []
+            for (user_id, day, direction), (amount, n) in batch:
+                params += [user_id, ops.adapt_datefield_value(day), direction, ops.adapt_decimalfield_value(amount, 14, 2), n]
+            cursor.execute(
+                f'INSERT INTO {table} (user_id, day, direction, {total}, {count}) VALUES {values} '
+                f'ON CONFLICT (user_id, day, direction) DO UPDATE SET '
+                f'{total} = {table}.{total} + EXCLUDED.{total}, {count} = {table}.{count} + EXCLUDED.{count}',
+                params,
+            )
+
+
+def aggregate(movements):
+    """Sum ``(user_id, timestamp, direction, amount)`` movements per rollup row."""
+    rows = defaultdict(lambda: [Decimal('0.00'), 0])
+    for user_id, timestamp, direction, amount in movements:
+        row = rows[(user_id, timezone.localdate(timestamp), direction)]
+        row[0] += amount
+        row[1] += 1
+    return {key: tuple(value) for key, value in rows.items()}
+
+
+def record_on_commit(movements):
+    """Add the movements to the rollups once the current transaction commits."""
+    rows = aggregate(movements)
+    transaction.on_commit(lambda: upsert(rows))
+
+
+def rebuild(since=None, until=None):
+    """
+    Recompute the rollups for days in ``[since, until]`` (either end may be
+    open) from Transaction rows, archived transactions and the ledger's
+    deposit entries. Returns the number of rollup rows written.
+    """
+    window = {}
+    if since:
+        window['day__gte'] = since
+    if until:
+        window['day__lte'] = until
+
+    transfers = Transaction.objects.annotate(day=TruncDate('timestamp')).filter(**window)
+    deposits = (
+        LedgerEntry.objects.filter(entry_type='deposit', wallet__isnull=False)
+        .annotate(day=TruncDate('created_at')).filter(**window)
+    )
+    sources = [
+        (transfers, 'sender_id', 'outgoing'),
+        (transfers, 'receiver_id', 'incoming'),
+        (deposits, 'wallet__user_id', 'deposit'),
+    ]
+
+    rows = {}
+    for queryset, user_field, direction in sources:
+        totals = queryset.values(user_field, 'day').annotate(total=Sum('amount'), count=Count('id')).order_by()
+        for row in totals.iterator():
+            rows[(row[user_field], row['day'], direction)] = (row['total'], row['count'])
+
+    # A transfer is either still in Transaction or archived, never both.
+    for key, (total, count) in aggregate(archive.archived_movements(since, until)).items():
+        hot_total, hot_count = rows.get(key, (0, 0))
+        rows[key] = (hot_total + total, hot_count + count)
+
+    with transaction.atomic():
+        DailyTransactionRollup.objects.filter(**window).delete()
+        upsert(rows)
+    return len(rows)
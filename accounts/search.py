@@ -0,0 +1,194 @@
+"""
+Full-text search over a user's transactions and chat messages.
+
+Each searchable row has a SearchDocument per user allowed to find it. The
+index over ``SearchDocument.body`` depends on the database, and is created
+by migrations 0016 and 0017:
+
+* Postgres: a stored ``tsvector`` column generated from ``body`` with the
+  ``simple`` configuration (no stemming, since users write in several
+  languages), a ``btree_gin`` index on ``(user_id, document)`` so a query
+  only walks that user's postings, and ``ts_rank_cd`` for ranking.
+* SQLite: an external-content FTS5 table (``unicode61``, diacritics
+  folded) kept in sync by triggers, ranked with ``bm25``. The owner's id is
+  indexed as its own column so a query only walks that user's postings.
+
+Other databases fall back to ``icontains`` without ranking.
+
+Documents are written in the same transaction as their source row: by the
+``post_save`` receivers in models.py, and by explicit ``index_*()`` calls
+from code that uses ``bulk_create`` (which sends no signals). Deleting or
+archiving a row deletes its documents through the foreign key.
+Migration 0017 indexes rows written before 0016; ``rebuild_search_index``
+repopulates everything.
+"""
+import re
+
+from django.db import connections, router, transaction
+
+from .models import ChatMessage, SearchDocument, Transaction
+from .serializers import CHAT_MESSAGE_ROWS, TRANSACTION_ROWS
+
+FTS_TABLE = 'accounts_searchdocument_fts'
+MAX_TERMS = 16
+BATCH_SIZE = 2000
+TOKEN = re.compile(r'\w+')
+
+
+def transaction_body(description, receiver_name):
+    return ' '.join(part for part in (description, receiver_name) if part)
+
+
+def transaction_documents(rows):
+    """Documents for ``(id, sender_id, receiver_id, description, receiver_name, timestamp)`` rows."""
+    for pk, sender_id, receiver_id, description, receiver_name, timestamp in rows:
+        body = transaction_body(description, receiver_name)
+        for user_id in {sender_id, receiver_id}:
+            yield SearchDocument(user_id=user_id, kind='transaction', transaction_id=pk, body=body, created_at=timestamp)
+
+
+def message_documents(rows):
+    """Documents for ``(id, user_id, role, content, timestamp)`` rows; system prompts aren't searchable."""
+    for pk, user_id, role, content, timestamp in rows:
+        if role != 'system':
+            yield SearchDocument(user_id=user_id, kind='chat_message', message_id=pk, body=content, created_at=timestamp)
+
+
+def write(documents):
+    documents = list(documents)
+    if len(documents) == 1:
+        # A lone INSERT, without the transaction bulk_create opens in autocommit mode.
+        documents[0].save(force_insert=True)
+    else:
+        SearchDocument.objects.bulk_create(documents, batch_size=BATCH_SIZE)
+
+
+def index_transactions(transactions, replace=False):
+    """Index Transaction instances; ``replace`` drops their existing documents first."""
+    if replace:
+        SearchDocument.objects.filter(transaction__in=transactions).delete()
+    write(transaction_documents(
+        (t.pk, t.sender_id, t.receiver_id, t.description, t.receiver_name, t.timestamp) for t in transactions
+    ))
+
+
+def index_messages(messages, replace=False):
+    """Index ChatMessage instances; ``replace`` drops their existing documents first."""
+    if replace:
+        SearchDocument.objects.filter(message__in=messages).delete()
+    write(message_documents(
+        (m.pk, m.chat_session.user_id, m.role, m.content, m.timestamp) for m in messages
+    ))
+
+
+def rebuild(batch_size=BATCH_SIZE):
+    """Drop every document and index all transactions and chat messages again. Returns the count."""
+    sources = [
+        (transaction_documents, Transaction.objects.values_list(
+            'pk', 'sender_id', 'receiver_id', 'description', 'receiver_name', 'timestamp',
+        )),
+        (message_documents, ChatMessage.objects.values_list(
+            'pk', 'chat_session__user_id', 'role', 'content', 'timestamp',
+        )),
+    ]
+    written = 0
+    with transaction.atomic():
+        SearchDocument.objects.all().delete()
+        for documents, rows in sources:
+            batch = []
+            for document in documents(rows.iterator(chunk_size=batch_size)):
+                batch.append(document)
+                if len(batch) == batch_size:
+                    written += len(SearchDocument.objects.bulk_create(batch))
+                    batch = []
+            written += len(SearchDocument.objects.bulk_create(batch))
+    return written
+
+
+def terms(query):
+    """The words of a user's query, lowercased; anything else is dropped."""
+    return TOKEN.findall(query.lower())[:MAX_TERMS]
+
+
+def _postgres(user, words, kind, limit, offset):
+    tsquery = ' & '.join(words[:-1] + [f'{words[-1]}:*'])
+    sql = (
+        "SELECT d.kind, d.transaction_id, d.message_id, ts_rank_cd(d.document, q) AS rank "
+        "FROM accounts_searchdocument d, to_tsquery('simple', %s) q "
+        "WHERE d.user_id = %s AND d.document @@ q" + (" AND d.kind = %s" if kind else "") +
+        " ORDER BY rank DESC, d.created_at DESC, d.id DESC LIMIT %s OFFSET %s"
+    )
+    return sql, [tsquery, user.pk] + ([kind] if kind else []) + [limit, offset]
+
+
+def _sqlite(user, words, kind, limit, offset):
+    phrase = ' '.join(f'"{word}"' for word in words) + '*'
+    match = f'user_id : "{user.pk}" AND body : ({phrase})'
+    sql = (
+        f"SELECT d.kind, d.transaction_id, d.message_id, -bm25({FTS_TABLE}, 1.0, 0.0) AS rank "
+        f"FROM {FTS_TABLE} JOIN accounts_searchdocument d ON d.id = {FTS_TABLE}.rowid "
+        f"WHERE {FTS_TABLE} MATCH %s" + (" AND d.kind = %s" if kind else "") +
+        " ORDER BY rank DESC, d.created_at DESC, d.id DESC LIMIT %s OFFSET %s"
+    )
+    return sql, [match] + ([kind] if kind else []) + [limit, offset]
+
+
+def _fallback(user, words, kind, limit, offset):
+    documents = SearchDocument.objects.filter(user=user)
+    if kind:
+        documents = documents.filter(kind=kind)
+    for word in words:
+        documents = documents.filter(body__icontains=word)
+    rows = documents.order_by('-created_at', '-id').values_list('kind', 'transaction_id', 'message_id')[offset:offset + limit]
+    return [(*row, 0.0) for row in rows]
+
+
+QUERIES = {'postgresql': _postgres, 'sqlite': _sqlite}
+
+
+def find(user, query, kind=None, limit=20, offset=0):
+    """
+    ``(kind, transaction_id, message_id, rank)`` for ``user``'s documents
+    matching every word of ``query`` (the last as a prefix), best first.
+    """
+    words = terms(query)
+    if not words:
+        return []
+    connection = connections[router.db_for_read(SearchDocument)]
+    build = QUERIES.get(connection.vendor)
+    if build is None:
+        return _fallback(user, words, kind, limit, offset)
+    sql, params = build(user, words, kind, limit, offset)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def search(user, query, kind=None, limit=20, offset=0):
+    """
+    Ranked hits with the matching transactions and messages in the shape
+    their list endpoints use: ``[{'type', 'score', 'transaction' | 'message'}]``.
+    """
+    hits = find(user, query, kind=kind, limit=limit, offset=offset)
+    transaction_ids = [hit[1] for hit in hits if hit[0] == 'transaction']
+    message_ids = [hit[2] for hit in hits if hit[0] == 'chat_message']
+
+    transactions = {}
+    if transaction_ids:
+        rows = list(TRANSACTION_ROWS.values(Transaction.objects.annotate_for(user).filter(id__in=transaction_ids), 'id'))
+        transactions = {row['id']: item for row, item in zip(rows, TRANSACTION_ROWS.many(rows))}
+    messages = {}
+    if message_ids:
+        rows = list(CHAT_MESSAGE_ROWS.values(ChatMessage.objects.filter(id__in=message_ids), 'chat_session__session_id'))
+        messages = {
+            row['id']: dict(item, session_id=str(row['chat_session__session_id']))
+            for row, item in zip(rows, CHAT_MESSAGE_ROWS.many(rows))
+        }
+
+    results = []
+    for kind, transaction_id, message_id, rank in hits:
+        if kind == 'transaction' and transaction_id in transactions:
+            results.append({'type': kind, 'score': rank, 'transaction': transactions[transaction_id]})
+        elif kind == 'chat_message' and message_id in messages:
+            results.append({'type': kind, 'score': rank, 'message': messages[message_id]})
+    return results
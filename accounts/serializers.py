@@ -1,5 +1,8 @@
-from rest_framework import serializers
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
+from django.conf import settings
 from django.contrib.auth import authenticate
+from django.utils import timezone
 from .models import CustomUser, Wallet, Transaction, ChatSession, ChatMessage
 import re
 
@@ -31,6 +34,46 @@ class RegistrationSerializer(serializers.ModelSerializer):
         user.save()
         return user
 
+class ProvisionUserSerializer(serializers.Serializer):
+    email = serializers.EmailField()
+    full_name = serializers.CharField(max_length=255)
+    phone_number = serializers.CharField(max_length=20)
+    country = serializers.CharField(max_length=100)
+    state_province = serializers.CharField(max_length=100)
+    preferred_language = serializers.CharField(max_length=50)
+    language = serializers.CharField(max_length=50)
+    business_type = serializers.ChoiceField(choices=CustomUser.BUSINESS_TYPE_CHOICES)
+    pin = serializers.RegexField(r'^\d{4}$', default='0000', error_messages={'invalid': 'Pin must be exactly 4 digits.'})
+    password = serializers.CharField(required=False, allow_blank=True, write_only=True)
+
+
+class BulkProvisionSerializer(serializers.Serializer):
+    # Passwords are hashed serially inside the request (a few tenths of a
+    # second each with PBKDF2), so this many must fit well within gunicorn's
+    # 30 s worker timeout. Bigger imports use the provision_users command.
+    MAX_USERS = 20
+
+    users = ProvisionUserSerializer(many=True, allow_empty=False, max_length=MAX_USERS)
+
+    def validate_users(self, users):
+        emails = [CustomUser.objects.normalize_email(user['email']) for user in users]
+        existing = set()
+        for start in range(0, len(emails), 1000):
+            existing.update(CustomUser.objects.filter(email__in=emails[start:start + 1000]).values_list('email', flat=True))
+
+        errors = {}
+        seen = set()
+        for index, email in enumerate(emails):
+            if email in existing:
+                errors[index] = {"email": "A user with this email already exists."}
+            elif email in seen:
+                errors[index] = {"email": "This email appears more than once."}
+            seen.add(email)
+        if errors:
+            raise serializers.ValidationError(errors)
+        return users
+
+
 class LoginSerializer(serializers.Serializer):
     email = serializers.EmailField()
     password = serializers.CharField(write_only=True, style={'input_type': 'password'})
@@ -55,6 +98,8 @@ class UserInfoSerializer(serializers.ModelSerializer):
 
 
 class WalletSerializer(serializers.ModelSerializer):
+    balance = serializers.DecimalField(source='total_balance', max_digits=12, decimal_places=2, read_only=True)
+
     class Meta:
         model = Wallet
         fields = ['wallet_number', 'balance']
@@ -71,11 +116,75 @@ class TransferSerializer(serializers.Serializer):
     pin = serializers.CharField(max_length=4, required=False, allow_blank=True)
     step = serializers.ChoiceField(choices=['verify', 'transfer'], default='verify')
 
+
+class BulkTransferItemSerializer(serializers.Serializer):
+    recipient_wallet_number = serializers.CharField(max_length=6)
+    amount = serializers.DecimalField(max_digits=12, decimal_places=2)
+    description = serializers.CharField(max_length=255, required=False, allow_blank=True)
+
+
+class BulkTransferSerializer(serializers.Serializer):
+    MAX_ITEMS = 5000
+
+    pin = serializers.CharField(max_length=4)
+    transfers = BulkTransferItemSerializer(many=True, allow_empty=False, max_length=MAX_ITEMS)
+
     
+class StatementExportSerializer(serializers.Serializer):
+    MAX_DAYS = 366
+
+    start = serializers.DateField()
+    end = serializers.DateField()
+    # Not ``format``: DRF reserves that query parameter for content negotiation.
+    export_format = serializers.ChoiceField(choices=['csv', 'ndjson'], default='csv')
+    type = serializers.ChoiceField(choices=['incoming', 'outgoing'], required=False)
+
+    def validate(self, attrs):
+        if attrs['end'] < attrs['start']:
+            raise serializers.ValidationError({"end": "End date must not be before start date."})
+        if (attrs['end'] - attrs['start']).days >= self.MAX_DAYS:
+            raise serializers.ValidationError({"end": f"Statements can cover at most {self.MAX_DAYS} days."})
+        return attrs
+
+
+class TransactionSummarySerializer(serializers.Serializer):
+    start = serializers.DateField(required=False)
+    end = serializers.DateField(required=False)
+    group_by = serializers.ChoiceField(choices=['day', 'month'], default='month')
+
+    def validate(self, attrs):
+        if 'start' in attrs and 'end' in attrs and attrs['end'] < attrs['start']:
+            raise serializers.ValidationError({"end": "End date must not be before start date."})
+        return attrs
+
+
+class TransactionArchiveSerializer(serializers.Serializer):
+    month = serializers.DateField(input_formats=['%Y-%m'], required=False)
+    type = serializers.ChoiceField(choices=['incoming', 'outgoing'], required=False)
+    offset = serializers.IntegerField(min_value=0, default=0)
+    limit = serializers.IntegerField(min_value=1, max_value=500, default=100)
+
+
+class SearchSerializer(serializers.Serializer):
+    q = serializers.CharField(max_length=200)
+    type = serializers.ChoiceField(choices=['transaction', 'chat_message'], required=False)
+    page = serializers.IntegerField(min_value=1, max_value=50, default=1)
+    page_size = serializers.IntegerField(min_value=1, max_value=50, default=20)
+
+    def validate_q(self, value):
+        if not re.search(r'\w', value):
+            raise serializers.ValidationError("Enter at least one word to search for.")
+        return value
+
+
 class TransactionSerializer(serializers.ModelSerializer):
-    transaction_direction = serializers.SerializerMethodField()
-    sender_name = serializers.CharField(source='sender.full_name', read_only=True)
-    receiver_name_display = serializers.CharField(source='receiver.full_name', read_only=True)
+    """
+    Expects a queryset built with ``Transaction.objects.annotate_for(user)``,
+    which supplies the party names and direction as plain columns.
+    """
+    transaction_direction = serializers.CharField(read_only=True)
+    sender_name = serializers.CharField(source='sender_full_name', read_only=True)
+    receiver_name_display = serializers.CharField(source='receiver_full_name', read_only=True)
 
     class Meta:
         model = Transaction
@@ -91,16 +200,6 @@ class TransactionSerializer(serializers.ModelSerializer):
             'transaction_direction',
         ]
         read_only_fields = ['transaction_id', 'timestamp']
-
-    def get_transaction_direction(self, obj):
-        request = self.context.get('request', None)
-        if request and hasattr(request, 'user'):
-            user = request.user
-            if obj.sender == user:
-                return 'outgoing'
-            elif obj.receiver == user:
-                return 'incoming'
-        return 'unknown'
     
 class ChatMessageSerializer(serializers.ModelSerializer):
     class Meta:
@@ -115,7 +214,104 @@ class ChatSessionSerializer(serializers.ModelSerializer):
         fields = ['session_id', 'title', 'created_at', 'updated_at', 'messages']
         read_only_fields = ['session_id', 'created_at', 'updated_at', 'messages']
 
+class ChatSessionOverviewSerializer(serializers.ModelSerializer):
+    """Listing shape: no nested messages, just counts and a preview."""
+    message_count = serializers.IntegerField(read_only=True)
+    last_message_role = serializers.CharField(read_only=True, allow_null=True)
+    last_message_preview = serializers.CharField(read_only=True, allow_null=True)
+    last_message_at = serializers.DateTimeField(read_only=True, allow_null=True)
+
+    class Meta:
+        model = ChatSession
+        fields = ['session_id', 'title', 'created_at', 'updated_at', 'message_count',
+                  'last_message_role', 'last_message_preview', 'last_message_at']
+        read_only_fields = fields
+
 class ChatPromptSerializer(serializers.Serializer):
     prompt = serializers.CharField(max_length=2000)
     session_id = serializers.UUIDField(required=False)
+    stream = serializers.BooleanField(required=False, default=False)
+
+
+
+def iso_datetime(field, tz):
+    """
+    ``DateTimeField.to_representation`` for ISO 8601 output with the
+    current timezone looked up once rather than per value.
+    """
+    def convert(value):
+        if tz is None or not timezone.is_aware(value):
+            return field.to_representation(value)
+        value = value.astimezone(tz).isoformat()
+        return value[:-6] + 'Z' if value.endswith('+00:00') else value
+    return convert
+
+
+class RowSerializer:
+    """
+    Serializes ``.values()`` rows exactly as ``model_serializer`` would
+    serialize model instances, without instantiating models or running a
+    serializer per row.
+
+    The model serializer's fields are inspected once; each row is then a
+    loop over precomputed ``(name, column, convert)`` triples. Fields whose
+    representation is the value itself (strings, integers) skip the call.
+    Only flat, read-only shapes are supported: every field must read a
+    column or annotation of the queryset.
+    """
+    PASSTHROUGH = (serializers.CharField, serializers.IntegerField)
+
+    def __init__(self, model_serializer):
+        self.model_serializer = model_serializer
+        self._plan = None
+
+    @property
+    def plan(self):
+        if self._plan is None:
+            plan = []
+            for name, field in self.model_serializer().fields.items():
+                if field.write_only:
+                    continue
+                if field.source == '*' or '.' in field.source:
+                    raise ValueError(f'{self.model_serializer.__name__}.{name} does not read a plain column.')
+                plan.append((name, field.source, field))
+            self._plan = tuple(plan)
+        return self._plan
+
+    def converters(self):
+        tz = timezone.get_current_timezone() if settings.USE_TZ else None
+        converters = []
+        for name, column, field in self.plan:
+            if type(field) in self.PASSTHROUGH:
+                convert = None
+            elif (
+                type(field) is serializers.DateTimeField and not hasattr(field, 'timezone')
+                and getattr(field, 'format', api_settings.DATETIME_FORMAT).lower() == ISO_8601
+            ):
+                convert = iso_datetime(field, tz)
+            else:
+                convert = field.to_representation
+            converters.append((name, column, convert))
+        return converters
+
+    def values(self, queryset, *extra):
+        """``queryset.values()`` with the columns the fields need, plus ``extra``."""
+        return queryset.values(*dict.fromkeys([column for _, column, _ in self.plan] + list(extra)))
+
+    def to_representation(self, row):
+        return self.many([row])[0]
+
+    def many(self, rows):
+        converters = self.converters()
+        return [
+            {
+                name: row[column] if convert is None or row[column] is None else convert(row[column])
+                for name, column, convert in converters
+            }
+            for row in rows
+        ]
+
 
+TRANSACTION_ROWS = RowSerializer(TransactionSerializer)
+CHAT_MESSAGE_ROWS = RowSerializer(ChatMessageSerializer)
+CHAT_SESSION_OVERVIEW_ROWS = RowSerializer(ChatSessionOverviewSerializer)
@@ -0,0 +1,122 @@
+"""
+Account statements streamed straight from the database.
+
+Rows come from ``QuerySet.iterator()``, which on Postgres reads through a
+server-side cursor ``chunk_size`` rows at a time, and each row is encoded
+as soon as it is read, so an export of a million transactions uses no more
+memory than one of a hundred.
+
+Ranges reaching back past the archive cutoff also read the user's archived
+months (see archive.py), one month at a time, merged with the hot rows in
+timestamp order; a transfer is only ever in one of the two.
+"""
+import csv
+import heapq
+import json
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.utils import timezone
+
+from . import archive
+from .models import Transaction
+
+CHUNK_SIZE = getattr(settings, 'STATEMENT_EXPORT_CHUNK_SIZE', 2000)
+
+COLUMNS = [
+    'transaction_id',
+    'timestamp',
+    'direction',
+    'sender_name',
+    'receiver_name',
+    'receiver_account_number',
+    'amount',
+    'description',
+]
+
+
+def statement_rows(user, start, end, direction=None):
+    """Yield ``user``'s transactions in ``[start, end)`` oldest first, as dicts keyed by COLUMNS."""
+    return heapq.merge(
+        archived_rows(user, start, end, direction),
+        hot_rows(user, start, end, direction),
+        key=lambda row: row['timestamp'],
+    )
+
+
+def archived_rows(user, start, end, direction=None):
+    """Like ``hot_rows()``, from the archived months overlapping ``[start, end)``."""
+    for _, rows in archive.read_between(user, timezone.localdate(start), timezone.localdate(end)):
+        for row in reversed(rows):
+            timestamp = datetime.fromisoformat(row['timestamp']).astimezone(dt_timezone.utc)
+            if not start <= timestamp < end or (direction and row['transaction_direction'] != direction):
+                continue
+            yield {
+                'transaction_id': row['transaction_id'],
+                'timestamp': timestamp,
+                'direction': row['transaction_direction'],
+                'sender_name': row['sender_name'],
+                'receiver_name': row['receiver_name'],
+                'receiver_account_number': row['receiver_account_number'],
+                'amount': Decimal(row['amount']),
+                'description': row['description'],
+            }
+
+
+def hot_rows(user, start, end, direction=None):
+    """``user``'s transactions still in the Transaction table, oldest first."""
+    if direction == 'outgoing':
+        parties = Q(sender=user)
+    elif direction == 'incoming':
+        parties = Q(receiver=user)
+    else:
+        parties = Q(sender=user) | Q(receiver=user)
+
+    rows = (
+        Transaction.objects.annotate_for(user)
+        .filter(parties, timestamp__gte=start, timestamp__lt=end)
+        .order_by('timestamp', 'id')
+        .values_list(
+            'transaction_id', 'timestamp', 'transaction_direction', 'sender_full_name',
+            'receiver_name', 'receiver_account_number', 'amount', 'description',
+        )
+    )
+    for row in rows.iterator(chunk_size=CHUNK_SIZE):
+        yield dict(zip(COLUMNS, row))
+
+
+class _Echo:
+    """A file-like object whose write() just hands the line back to csv.writer's caller."""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(COLUMNS)
+    for row in rows:
+        yield writer.writerow([
+            row['transaction_id'],
+            row['timestamp'].isoformat(),
+            row['direction'],
+            row['sender_name'],
+            row['receiver_name'],
+            row['receiver_account_number'],
+            row['amount'],
+            row['description'] or '',
+        ])
+
+
+def iter_ndjson(rows):
+    for row in rows:
+        yield json.dumps(row, cls=DjangoJSONEncoder) + '\n'
+
+
+FORMATS = {
+    'csv': ('text/csv', iter_csv),
+    'ndjson': ('application/x-ndjson', iter_ndjson),
+}
@@ -0,0 +1,197 @@
+"""
+Local stand-ins for the external services the accounts app talks to.
+
+These are used by the test suite and by the benchmark management commands,
+so that nothing in either needs network access.
+"""
+import json
+import socketserver
+import threading
+import time
+from email import message_from_bytes
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _StubHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Benchmarks open hundreds of connections at once; the default backlog
+    # of 5 would reset most of them.
+    request_queue_size = 1024
+
+
+class StubLLMServer:
+    """
+    A tiny OpenAI/OpenRouter-compatible chat completions endpoint.
+
+    Non-streaming requests get a single JSON completion. Streaming requests
+    get one chunked SSE event per token. ``delay`` is slept before answering
+    (to stand in for model latency), and if ``gate`` is a
+    ``threading.Event`` the stream pauses after the first token until it is
+    set.
+    """
+
+    def __init__(self, tokens=('Hello', ' there', ', trader!'), delay=0.0, gate=None):
+        self.tokens = list(tokens)
+        self.delay = delay
+        self.gate = gate
+        self.requests = []
+        self._server = None
+        self._thread = None
+
+    @property
+    def reply(self):
+        return ''.join(self.tokens)
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}/api/v1/chat/completions'
+
+    def start(self):
+        self._server = _StubHTTPServer(('127.0.0.1', 0), self._make_handler())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _make_handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                payload = json.loads(self.rfile.read(length) or b'{}')
+                stub.requests.append(payload)
+                if stub.delay:
+                    time.sleep(stub.delay)
+                if payload.get('stream'):
+                    self._stream()
+                else:
+                    self._complete()
+
+            def _complete(self):
+                body = json.dumps({
+                    'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': stub.reply}}],
+                }).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _write_chunk(self, data):
+                self.wfile.write(f'{len(data):x}\r\n'.encode('ascii') + data + b'\r\n')
+                self.wfile.flush()
+
+            def _stream(self):
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+                self._write_chunk(b': OPENROUTER PROCESSING\n\n')
+                for i, token in enumerate(stub.tokens):
+                    event = {'choices': [{'index': 0, 'delta': {'content': token}}]}
+                    self._write_chunk(f'data: {json.dumps(event)}\n\n'.encode('utf-8'))
+                    if i == 0 and stub.gate is not None:
+                        stub.gate.wait(timeout=10)
+                self._write_chunk(b'data: [DONE]\n\n')
+                self.wfile.write(b'0\r\n\r\n')
+                self.wfile.flush()
+
+        return Handler
+
+
+class StubSMTPServer:
+    """
+    Just enough of an SMTP server to accept mail from Django's SMTP backend.
+
+    Received messages are parsed into ``email.message.Message`` objects in
+    ``messages``; ``connections`` counts the SMTP sessions opened.
+    """
+
+    def __init__(self):
+        self.messages = []
+        self.connections = 0
+        self._server = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def start(self):
+        self._server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _make_handler(self):
+        stub = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def reply(self, line):
+                self.wfile.write(line.encode('ascii') + b'\r\n')
+
+            def handle(self):
+                with stub._lock:
+                    stub.connections += 1
+                self.reply('220 localhost stub ESMTP')
+                while True:
+                    line = self.rfile.readline()
+                    if not line:
+                        return
+                    command = line.decode('ascii', 'replace').strip().upper()
+                    if command.startswith(('EHLO', 'HELO')):
+                        self.reply('250 localhost')
+                    elif command.startswith('DATA'):
+                        self.reply('354 End data with <CR><LF>.<CR><LF>')
+                        self.read_data()
+                        self.reply('250 OK: queued')
+                    elif command.startswith('QUIT'):
+                        self.reply('221 Bye')
+                        return
+                    else:
+                        # MAIL, RCPT, RSET, NOOP
+                        self.reply('250 OK')
+
+            def read_data(self):
+                lines = []
+                while True:
+                    line = self.rfile.readline()
+                    if line in (b'.\r\n', b'.\n', b''):
+                        break
+                    lines.append(line[1:] if line.startswith(b'..') else line)
+                with stub._lock:
+                    stub.messages.append(message_from_bytes(b''.join(lines)))
+
+        return Handler
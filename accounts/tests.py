@@ -1,3 +1,1552 @@
-from django.test import TestCase
+import base64
+import importlib
+import json
+import threading
+import time
+from datetime import datetime, timedelta
+from functools import partial
+from io import StringIO
+from decimal import Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.apps import apps as django_apps
+from django.conf import global_settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.core import mail
+from django.core.cache import cache, caches
+from django.core.mail import get_connection
+from django.core.management import call_command
+from django.http import HttpResponse
+from django.test import AsyncClient, Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from backend import urls as backend_urls
+
+from .chat_context import ConversationContext, estimate_tokens
+from .models import BalanceCheckpoint, ChatMessage, ChatSession, CustomUser, DailyTransactionRollup, IdempotencyKey, LedgerEntry, OutboxEmail, Transaction, TransactionArchive, Wallet, WalletBalanceShard, WalletNumberCounter
+from .middleware import MetricsMiddleware
+from .outbox import drain, enqueue_email
+from .serializers import BulkProvisionSerializer, TransactionSerializer
+from . import archive, authentication, balance_shards, benchmarks, chat_context, ledger, llm, metrics, provisioning, reply_cache, rollups, statements, transfers, urls as accounts_urls
+from .testing import StubLLMServer, StubSMTPServer
+from .wallet_numbers import WALLET_NUMBER_SPACE, allocate_wallet_numbers, permute
+from .views import ChatBotView
+
+
+def make_user(email, full_name='Test User', **extra):
+    return CustomUser.objects.create_user(email=email, password='pass1234', full_name=full_name, **extra)
+
+
+def make_transactions(sender, receiver, count):
+    Transaction.objects.bulk_create([
+        Transaction(
+            sender=sender if i % 2 else receiver,
+            receiver=receiver if i % 2 else sender,
+            amount=Decimal('1.00'),
+            receiver_name='Someone',
+            receiver_account_number='000000',
+        )
+        for i in range(count)
+    ], batch_size=1000)
+
+
+class TransactionListQueryCountTests(TestCase):
+    def setUp(self):
+        self.user = make_user('ama@example.com', 'Ama Mensah')
+        self.other = make_user('kofi@example.com', 'Kofi Boateng')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def count_list_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('wallet-transactions'))
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries), response.json()
+
+    def test_query_count_is_independent_of_row_count(self):
+        make_transactions(self.user, self.other, 10)
+        small_count, small = self.count_list_queries()
+        self.assertEqual(len(small), 10)
+
+        make_transactions(self.user, self.other, 10000 - 10)
+        large_count, large = self.count_list_queries()
+        self.assertEqual(len(large), 10000)
+
+        self.assertEqual(small_count, large_count)
+
+    def test_direction_and_names_come_from_annotations(self):
+        make_transactions(self.user, self.other, 2)
+        _, rows = self.count_list_queries()
+        by_direction = {row['transaction_direction']: row for row in rows}
+        self.assertEqual(by_direction['outgoing']['sender_name'], 'Ama Mensah')
+        self.assertEqual(by_direction['outgoing']['receiver_name_display'], 'Kofi Boateng')
+        self.assertEqual(by_direction['incoming']['sender_name'], 'Kofi Boateng')
+
+    def test_detail_view(self):
+        make_transactions(self.user, self.other, 1)
+        txn = Transaction.objects.get()
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('wallet-transaction-detail', args=[txn.transaction_id]))
+        self.assertEqual(response.json()['transaction_direction'], 'incoming')
+
+
+class TransactionPaginationTests(TestCase):
+    def setUp(self):
+        self.user = make_user('ama@example.com', 'Ama Mensah')
+        self.other = make_user('kofi@example.com', 'Kofi Boateng')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def walk(self, **params):
+        """The transaction ids of every page, following ``next`` links."""
+        ids = []
+        response = self.client.get(reverse('wallet-transactions'), params)
+        while True:
+            self.assertEqual(response.status_code, 200)
+            body = response.json()
+            self.assertLessEqual(len(body['results']), params['page_size'])
+            ids += [row['transaction_id'] for row in body['results']]
+            if body['next'] is None:
+                return ids
+            response = self.client.get(body['next'])
+
+    def newest_first(self, queryset):
+        return [str(pk) for pk in queryset.order_by('-timestamp', '-id').values_list('transaction_id', flat=True)]
+
+    def test_walking_every_page_when_timestamps_tie(self):
+        make_transactions(self.user, self.other, 23)
+        # Runs of rows sharing a timestamp, straddling page boundaries.
+        now = timezone.now()
+        for i, pk in enumerate(Transaction.objects.order_by('id').values_list('pk', flat=True)):
+            Transaction.objects.filter(pk=pk).update(timestamp=now - timedelta(seconds=i // 7))
+
+        ids = self.walk(page_size=5)
+        self.assertEqual(len(ids), len(set(ids)))
+        self.assertEqual(ids, self.newest_first(Transaction.objects.all()))
+
+    def test_malformed_or_tampered_cursor_is_rejected(self):
+        make_transactions(self.user, self.other, 3)
+        encode = lambda raw: base64.urlsafe_b64encode(raw.encode()).decode()
+        for cursor in [
+            'not base64!',
+            encode('no separator'),
+            encode('yesterday|12'),
+            encode(f'{timezone.now().isoformat()}|twelve'),
+            encode(f'{timezone.now().isoformat()}|{2 ** 64}'),
+            encode(f'{timezone.now().replace(tzinfo=None).isoformat()}|12'),
+        ]:
+            with self.subTest(cursor=cursor):
+                response = self.client.get(reverse('wallet-transactions'), {'cursor': cursor})
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json(), {'detail': 'Invalid cursor'})
+
+    def test_type_filter_with_cursor(self):
+        make_transactions(self.user, self.other, 15)
+        self.assertEqual(self.walk(page_size=3, type='outgoing'), self.newest_first(Transaction.objects.filter(sender=self.user)))
+        self.assertEqual(self.walk(page_size=3, type='incoming'), self.newest_first(Transaction.objects.filter(receiver=self.user)))
+
+    def test_page_is_right_when_one_branch_is_much_larger(self):
+        # Nearly everything is outgoing; the few incoming rows are old, so a
+        # page only gets them once the outgoing branch runs dry.
+        make_transactions(self.other, self.user, 2)
+        Transaction.objects.update(timestamp=timezone.now() - timedelta(days=1))
+        Transaction.objects.bulk_create([
+            Transaction(sender=self.user, receiver=self.other, amount=Decimal('1.00'), receiver_name='Someone', receiver_account_number='000000')
+            for _ in range(40)
+        ])
+
+        ids = self.walk(page_size=6)
+        self.assertEqual(ids, self.newest_first(Transaction.objects.all()))
+        # The same window straight from the UNION, past the last outgoing row.
+        last = Transaction.objects.get(transaction_id=ids[38])
+        window = Transaction.objects.involving(self.user, before=(last.timestamp, last.pk), limit=4)
+        self.assertEqual([str(t.transaction_id) for t in window[:4]], ids[39:])
+
+
+def parse_sse(raw):
+    events = []
+    for block in raw.decode('utf-8').split('\n\n'):
+        if not block.strip():
+            continue
+        event = {'event': 'message'}
+        for line in block.splitlines():
+            field, _, value = line.partition(': ')
+            event[field] = json.loads(value) if field == 'data' else value
+        events.append(event)
+    return events
+
+
+class ChatBotStreamingTests(TestCase):
+    def setUp(self):
+        caches[reply_cache.CACHE_ALIAS].clear()
+        self.user = make_user('trader@example.com')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def post_prompt(self, **data):
+        return self.client.post(reverse('chatbot'), {'prompt': 'How do I export cocoa?', **data}, format='json')
+
+    def test_stream_relays_tokens_then_saves_reply_once(self):
+        gate = threading.Event()
+        with StubLLMServer(tokens=['Start', ' with', ' GEPA.'], gate=gate) as stub, \
+                mock.patch.object(ChatBotView, 'OPENROUTER_URL', stub.url):
+            response = self.post_prompt(stream=True)
+            self.assertEqual(response['Content-Type'], 'text/event-stream')
+            chunks = iter(response.streaming_content)
+
+            session_event = parse_sse(next(chunks))[0]
+            first_token = parse_sse(next(chunks))[0]
+            # The first token reaches the client while the upstream stream is
+            # still open, and nothing has been saved yet.
+            self.assertEqual(first_token['data'], {'token': 'Start'})
+            self.assertFalse(ChatMessage.objects.filter(role='assistant').exists())
+
+            gate.set()
+            rest = parse_sse(b''.join(chunks))
+
+        self.assertTrue(stub.requests[0]['stream'])
+        self.assertEqual([e['data']['token'] for e in rest if e['event'] == 'message'], [' with', ' GEPA.'])
+        self.assertEqual(rest[-1]['event'], 'done')
+
+        session = ChatSession.objects.get(session_id=session_event['data']['session_id'])
+        replies = list(session.messages.filter(role='assistant').values_list('content', flat=True))
+        self.assertEqual(replies, ['Start with GEPA.'])
+
+    def test_non_streaming_reply(self):
+        with StubLLMServer() as stub, mock.patch.object(ChatBotView, 'OPENROUTER_URL', stub.url):
+            response = self.post_prompt()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['reply'], stub.reply)
+        self.assertFalse(stub.requests[0]['stream'])
+
+
+class AsyncChatBotTests(TestCase):
+    def setUp(self):
+        caches[reply_cache.CACHE_ALIAS].clear()
+        self.user = make_user('async@example.com')
+        self.client = AsyncClient(AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+        patcher = mock.patch.object(ChatBotView, 'OPENROUTER_API_KEY', 'test-key')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_requires_authentication(self):
+        response = await AsyncClient().post(reverse('chatbot-async'), {'prompt': 'Hi'}, content_type='application/json')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response.json(), {'detail': 'Authentication credentials were not provided.'})
+        self.assertEqual(response['WWW-Authenticate'], 'Bearer realm="api"')
+
+    async def test_reports_why_credentials_were_rejected(self):
+        response = await AsyncClient(AUTHORIZATION='Bearer not-a-token').post(
+            reverse('chatbot-async'), {'prompt': 'Hi'}, content_type='application/json',
+        )
+        self.assertEqual((response.status_code, response.json()['code']), (401, 'token_not_valid'))
+
+        await CustomUser.objects.filter(pk=self.user.pk).aupdate(is_active=False)
+        response = await self.client.post(reverse('chatbot-async'), {'prompt': 'Hi'}, content_type='application/json')
+        self.assertEqual((response.status_code, response.json()['code']), (401, 'user_inactive'))
+
+    async def test_reply_through_pooled_client(self):
+        with StubLLMServer() as stub, mock.patch.object(ChatBotView, 'OPENROUTER_URL', stub.url):
+            response = await self.client.post(reverse('chatbot-async'), {'prompt': 'Hi'}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body['reply'], stub.reply)
+        self.assertEqual(stub.requests[0]['messages'][-1], {'role': 'user', 'content': 'Hi'})
+        self.assertEqual(await ChatMessage.objects.filter(role='assistant', content=stub.reply).acount(), 1)
+
+    async def test_streaming_reply(self):
+        with StubLLMServer(tokens=['A', 'B']) as stub, mock.patch.object(ChatBotView, 'OPENROUTER_URL', stub.url):
+            response = await self.client.post(
+                reverse('chatbot-async'), {'prompt': 'Hi', 'stream': True}, content_type='application/json',
+            )
+            raw = b''.join([chunk async for chunk in response.streaming_content])
+        events = parse_sse(raw)
+        self.assertEqual([e['data']['token'] for e in events if e['event'] == 'message'], ['A', 'B'])
+        self.assertEqual(events[-1]['event'], 'done')
+        self.assertEqual(await ChatMessage.objects.filter(role='assistant', content='AB').acount(), 1)
+
+
+class AsyncClientLifetimeTests(TestCase):
+    def test_a_request_loop_gets_a_client_closed_after_each_call(self):
+        # Under WSGI, async_to_sync runs each async view on a loop of its
+        # own that nothing would ever close a shared client on.
+        async def call_twice():
+            clients = []
+            for _ in range(2):
+                async with llm.async_client() as client:
+                    clients.append(client)
+            return clients
+
+        first, second = async_to_sync(call_twice)()
+        self.assertIsNot(first, second)
+        self.assertTrue(first.is_closed and second.is_closed)
+
+    def test_a_kept_loop_shares_one_client_until_it_is_closed(self):
+        async def call_twice():
+            llm.keep_async_client()
+            async with llm.async_client() as first:
+                pass
+            async with llm.async_client() as second:
+                pass
+            self.assertFalse(first.is_closed)
+            await llm.aclose_async_client()
+            return first, second
+
+        first, second = async_to_sync(call_twice)()
+        self.assertIs(first, second)
+        self.assertTrue(first.is_closed)
+
+
+class ConversationContextTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.session = ChatSession.objects.create(user=make_user('long@example.com'))
+
+    def add_turns(self, count):
+        for i in range(count):
+            role = 'user' if i % 2 == 0 else 'assistant'
+            ChatMessage.objects.create(chat_session=self.session, role=role, content=f'turn {i} ' + 'x' * 400)
+
+    def test_long_session_is_bounded_by_budget(self):
+        self.add_turns(60)
+        history = ConversationContext(self.session, 'system', budget=1000).history()
+
+        self.assertLessEqual(sum(estimate_tokens(m['content']) for m in history), 1000)
+        self.assertEqual(history[0]['role'], 'system')
+        self.assertTrue(history[-1]['content'].startswith('turn 59 '))
+
+        # The turn just before the verbatim window lives on in the summary.
+        first_recent = int(history[1]['content'].split()[1])
+        self.session.refresh_from_db()
+        self.assertIn(f'turn {first_recent - 1} ', self.session.summary)
+        self.assertGreater(self.session.summary_upto, 0)
+
+    def test_warm_turn_reads_only_new_messages(self):
+        self.add_turns(40)
+        ConversationContext(self.session, 'system', budget=1000).history()
+        self.add_turns(1)
+        # One query for the new message, one to persist the updated summary.
+        with self.assertNumQueries(2):
+            history = ConversationContext(self.session, 'system', budget=1000).history()
+        self.assertTrue(history[-1]['content'].startswith('turn 0 '))
+
+    def test_messages_older_than_the_cold_window_are_summarized(self):
+        self.add_turns(12)
+        with mock.patch.object(chat_context, 'MAX_WINDOW_MESSAGES', 4):
+            history = ConversationContext(self.session, 'system', budget=100000).history()
+        self.assertEqual(len(history), 5)
+        self.assertTrue(history[1]['content'].startswith('turn 8 '))
+        self.session.refresh_from_db()
+        self.assertIn('turn 7 ', self.session.summary)
+        self.assertNotIn('turn 3 ', self.session.summary)
+        self.assertEqual(self.session.summary_upto, ChatMessage.objects.get(content__startswith='turn 7 ').id)
+
+    def test_short_session_is_sent_verbatim(self):
+        self.add_turns(3)
+        history = ConversationContext(self.session, 'system').history()
+        self.assertEqual([m['role'] for m in history], ['user', 'assistant', 'user'])
+        self.assertEqual(ChatSession.objects.get().summary, '')
+
+
+class ChatSessionListingTests(TestCase):
+    def setUp(self):
+        self.user = make_user('chatty@example.com')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def make_session(self, messages):
+        session = ChatSession.objects.create(user=self.user)
+        ChatMessage.objects.bulk_create([
+            ChatMessage(chat_session=session, role='user' if i % 2 == 0 else 'assistant', content=f'message {i}')
+            for i in range(messages)
+        ])
+        return session
+
+    def test_listing_is_one_annotated_query_per_page(self):
+        for _ in range(5):
+            self.make_session(3)
+        self.make_session(0)
+        # COUNT for the paginator plus the annotated page query.
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('chatbot-sessions'))
+        body = response.json()
+        self.assertEqual(body['count'], 6)
+        rows = sorted(body['results'], key=lambda row: row['message_count'])
+        self.assertEqual(rows[0]['message_count'], 0)
+        self.assertIsNone(rows[0]['last_message_preview'])
+        self.assertEqual(rows[-1]['message_count'], 3)
+        self.assertEqual(rows[-1]['last_message_preview'], 'message 2')
+        self.assertNotIn('messages', rows[-1])
+
+    def test_messages_are_cursor_paginated(self):
+        session = self.make_session(7)
+        url = reverse('chatbot-session-messages', args=[session.session_id]) + '?page_size=3'
+        contents = []
+        while url:
+            body = self.client.get(url).json()
+            contents += [m['content'] for m in body['results']]
+            url = body['next']
+        self.assertEqual(contents, [f'message {i}' for i in reversed(range(7))])
+
+    def test_other_users_session_is_not_found(self):
+        session = ChatSession.objects.create(user=make_user('someone@example.com'))
+        response = self.client.get(reverse('chatbot-session-messages', args=[session.session_id]))
+        self.assertEqual(response.status_code, 404)
+
+
+class EmailOutboxTests(TestCase):
+    def smtp_connection(self, port):
+        return get_connection(
+            'django.core.mail.backends.smtp.EmailBackend',
+            host='127.0.0.1', port=port, username='', password='', use_tls=False, timeout=5,
+        )
+
+    def test_registration_queues_instead_of_sending(self):
+        response = APIClient().post(reverse('register'), {
+            'email': 'new@example.com', 'password': 'Str0ng-pass!', 'confirm_password': 'Str0ng-pass!',
+            'business_type': 'individual', 'full_name': 'New Trader', 'phone_number': '0240000000',
+            'country': 'Ghana', 'state_province': 'Ashanti', 'preferred_language': 'en', 'language': 'en',
+            'pin': '1234', 'voice_mode': False, 'enable_biometrics_login': False,
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(mail.outbox), 0)
+        queued = OutboxEmail.objects.get()
+        self.assertEqual((queued.to_email, queued.status), ('new@example.com', 'pending'))
+        self.assertIn('/verify-email/', queued.body)
+
+    def test_drain_sends_batch_over_one_connection(self):
+        for i in range(3):
+            enqueue_email('Verify your email', f'link {i}', 'noreply@example.com', [f'user{i}@example.com'])
+
+        with StubSMTPServer() as smtp:
+            sent, failed, retrying = drain(batch_size=10, connection=self.smtp_connection(smtp.port))
+
+        self.assertEqual((sent, failed, retrying), (3, 0, 0))
+        self.assertEqual(smtp.connections, 1)
+        self.assertEqual(sorted(m['To'] for m in smtp.messages), [f'user{i}@example.com' for i in range(3)])
+        self.assertFalse(OutboxEmail.objects.exclude(status='sent').exists())
+
+    def test_unreachable_server_backs_off(self):
+        enqueue_email('Verify your email', 'link', 'noreply@example.com', ['user@example.com'])
+        with StubSMTPServer() as smtp:
+            port = smtp.port
+        # Nothing listens on the port any more.
+        sent, failed, retrying = drain(connection=self.smtp_connection(port))
+        self.assertEqual((sent, failed, retrying), (0, 0, 1))
+
+        queued = OutboxEmail.objects.get()
+        self.assertEqual((queued.status, queued.attempts), ('pending', 1))
+        self.assertNotEqual(queued.last_error, '')
+        # Not due again yet, so a second drain leaves it alone.
+        self.assertEqual(drain(connection=self.smtp_connection(port)), (0, 0, 0))
+
+
+class WalletNumberAllocatorTests(TestCase):
+    def test_permutation_is_collision_free(self):
+        numbers = [permute(i) for i in range(50000)]
+        self.assertEqual(len(set(numbers)), len(numbers))
+        self.assertTrue(all(0 <= n < WALLET_NUMBER_SPACE for n in numbers))
+        # Consecutive indexes shouldn't give consecutive numbers.
+        self.assertNotEqual(numbers[:3], [numbers[0], numbers[0] + 1, numbers[0] + 2])
+
+    def test_bulk_allocation_is_constant_round_trips(self):
+        # One reservation plus one batched check against legacy numbers.
+        with self.assertNumQueries(2):
+            numbers = allocate_wallet_numbers(500)
+        self.assertEqual(len(set(numbers)), 500)
+        self.assertTrue(all(len(n) == 6 and n.isdigit() for n in numbers))
+
+    def test_skips_legacy_random_numbers(self):
+        user = make_user('legacy@example.com')
+        next_index = WalletNumberCounter.objects.get().next_value
+        legacy = f'{permute(next_index):06d}'
+        Wallet.objects.filter(user=user).update(wallet_number=legacy)
+
+        numbers = allocate_wallet_numbers(3)
+        self.assertNotIn(legacy, numbers)
+        self.assertEqual(len(set(numbers)), 3)
+
+    def test_new_users_get_distinct_wallet_numbers(self):
+        wallets = [make_user(f'u{i}@example.com').wallet.wallet_number for i in range(5)]
+        self.assertEqual(len(set(wallets)), 5)
+
+
+class TransferServiceTests(TestCase):
+    def setUp(self):
+        self.sender = make_user('payer@example.com', 'Payer', pin='1234')
+        self.recipient = make_user('payee@example.com', 'Payee')
+        Wallet.objects.filter(user=self.sender).update(balance=Decimal('100.00'))
+
+    def balances(self):
+        return (
+            Wallet.objects.get(user=self.sender).balance,
+            Wallet.objects.get(user=self.recipient).balance,
+        )
+
+    def test_transfer_moves_money_and_records_transaction(self):
+        record, balance = transfers.transfer(self.sender, self.recipient.wallet.wallet_number, Decimal('40.00'), 'cocoa')
+        self.assertEqual(balance, Decimal('60.00'))
+        self.assertEqual(self.balances(), (Decimal('60.00'), Decimal('40.00')))
+        self.assertEqual((record.receiver_id, record.receiver_name, record.description), (self.recipient.pk, 'Payee', 'cocoa'))
+
+    def test_overdraft_is_refused_without_side_effects(self):
+        with self.assertRaises(transfers.InsufficientFunds):
+            transfers.transfer(self.sender, self.recipient.wallet.wallet_number, Decimal('100.01'))
+        self.assertEqual(self.balances(), (Decimal('100.00'), Decimal('0.00')))
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_non_positive_amounts_are_refused(self):
+        with self.assertRaises(transfers.InvalidAmount):
+            transfers.transfer(self.sender, self.recipient.wallet.wallet_number, Decimal('-5.00'))
+
+    def test_view_maps_errors(self):
+        client = APIClient()
+        client.force_authenticate(self.sender)
+        url = reverse('wallet-transfer')
+        data = {'recipient_wallet_number': self.recipient.wallet.wallet_number, 'step': 'transfer', 'pin': '1234'}
+
+        response = client.post(url, dict(data, amount='500.00'), format='json')
+        self.assertEqual((response.status_code, response.json()), (400, {'error': 'Insufficient balance.'}))
+
+        response = client.post(url, dict(data, amount='25.00', recipient_wallet_number='999999'), format='json')
+        self.assertEqual(response.status_code, 404)
+
+        response = client.post(url, dict(data, amount='25.00'), format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Decimal(str(response.json()['balance'])), Decimal('75.00'))
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Row lock modes only matter on Postgres.')
+class ShardedCreditLockTests(TransactionTestCase):
+    def test_credit_does_not_deadlock_with_a_folding_debit(self):
+        owner = make_user('hot@example.com', 'Hot', pin='1234')
+        payee = make_user('cold@example.com', 'Cold')
+        balance_shards.enable(owner.wallet, 1)
+        transfers.deposit(owner, Decimal('100.00'))
+        wallet = Wallet.objects.values('pk', 'wallet_number').get(user=owner)
+        credited, debiting = threading.Event(), threading.Event()
+        errors = []
+
+        def credit():
+            try:
+                with transaction.atomic():
+                    # Holds the shard row, then needs KEY SHARE on the wallet row.
+                    transfers.credit(wallet['pk'], Decimal('1.00'), 1)
+                    credited.set()
+                    debiting.wait(5)
+                    time.sleep(0.5)
+                    ledger.record_deposit(wallet, Decimal('1.00'))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        def debit():
+            credited.wait(5)
+            debiting.set()
+            try:
+                # Locks the wallet row, then waits for the shard row to fold it.
+                transfers.transfer(owner, payee.wallet.wallet_number, Decimal('50.00'))
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=credit), threading.Thread(target=debit)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(30)
+        self.assertEqual(errors, [])
+        self.assertEqual(transfers.current_balance(wallet['pk'], 1), Decimal('51.00'))
+
+
+class ShardedBalanceTests(TestCase):
+    def setUp(self):
+        self.merchant = make_user('merchant@example.com', 'Big Merchant')
+        self.payer = make_user('buyer@example.com', 'Buyer')
+        Wallet.objects.filter(user=self.payer).update(balance=Decimal('1000.00'))
+        balance_shards.enable(self.merchant.wallet, 4)
+
+    def test_credits_land_on_shards_and_reads_sum_them(self):
+        for _ in range(20):
+            transfers.transfer(self.payer, self.merchant.wallet.wallet_number, Decimal('5.00'))
+        wallet = Wallet.objects.get(user=self.merchant)
+        self.assertEqual(wallet.balance, Decimal('0.00'))
+        self.assertEqual(wallet.total_balance, Decimal('100.00'))
+
+        client = APIClient()
+        client.force_authenticate(CustomUser.objects.get(pk=self.merchant.pk))
+        self.assertEqual(client.get(reverse('wallet-info')).json()['balance'], '100.00')
+
+        self.assertEqual(balance_shards.fold(wallet.pk), Decimal('100.00'))
+        wallet.refresh_from_db()
+        self.assertEqual((wallet.balance, wallet.total_balance), (Decimal('100.00'), Decimal('100.00')))
+
+    def test_debit_folds_shards_when_main_balance_is_short(self):
+        transfers.deposit(self.merchant, Decimal('30.00'))
+        self.assertEqual(Wallet.objects.get(user=self.merchant).balance, Decimal('0.00'))
+
+        _, balance = transfers.transfer(self.merchant, self.payer.wallet.wallet_number, Decimal('20.00'))
+        self.assertEqual(balance, Decimal('10.00'))
+        with self.assertRaises(transfers.InsufficientFunds):
+            transfers.transfer(self.merchant, self.payer.wallet.wallet_number, Decimal('20.00'))
+
+    def test_disable_folds_everything_back(self):
+        transfers.deposit(self.merchant, Decimal('12.50'))
+        balance_shards.disable(self.merchant.wallet)
+        wallet = Wallet.objects.get(user=self.merchant)
+        self.assertEqual((wallet.shard_count, wallet.balance), (0, Decimal('12.50')))
+        self.assertFalse(WalletBalanceShard.objects.exists())
+
+
+class BulkTransferTests(TestCase):
+    def setUp(self):
+        self.business = make_user('payroll@example.com', 'Payroll Ltd', pin='4321', business_type='business')
+        Wallet.objects.filter(user=self.business).update(balance=Decimal('1000.00'))
+        self.suppliers = [make_user(f'supplier{i}@example.com', f'Supplier {i}') for i in range(5)]
+        self.client = APIClient()
+        self.client.force_authenticate(self.business)
+        self.url = reverse('wallet-transfer-bulk')
+
+    def payload(self, amounts, pin='4321'):
+        return {
+            'pin': pin,
+            'transfers': [
+                {'recipient_wallet_number': user.wallet.wallet_number, 'amount': amount, 'description': 'invoice'}
+                for user, amount in zip(self.suppliers, amounts)
+            ],
+        }
+
+    def test_pays_every_recipient_in_constant_queries(self):
+        balance_shards.enable(self.suppliers[4].wallet, 2)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url, self.payload(['10.00', '20.00', '30.00', '40.00', '50.00']), format='json')
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual((Decimal(str(body['balance'])), body['count']), (Decimal('850.00'), 5))
+        self.assertEqual([item['status'] for item in body['results']], ['ok'] * 5)
+        self.assertEqual(body['results'][2]['recipient_name'], 'Supplier 2')
+        self.assertLessEqual(len(queries), 12)
+
+        totals = [Wallet.objects.get(user=user).total_balance for user in self.suppliers]
+        self.assertEqual(totals, [Decimal('10.00'), Decimal('20.00'), Decimal('30.00'), Decimal('40.00'), Decimal('50.00')])
+        self.assertEqual(Transaction.objects.filter(sender=self.business).count(), 5)
+
+    def test_sharded_recipients_are_credited_in_wallet_order(self):
+        for user in self.suppliers[2:]:
+            balance_shards.enable(user.wallet, 2)
+        self.suppliers.reverse()
+        with mock.patch.object(transfers, 'credit', wraps=transfers.credit) as credit:
+            response = self.client.post(self.url, self.payload(['1.00', '2.00', '3.00']), format='json')
+        self.assertEqual(response.status_code, 200)
+        pks = [call.args[0] for call in credit.call_args_list]
+        self.assertEqual(pks, sorted(user.wallet.pk for user in self.suppliers[:3]))
+
+    def test_one_bad_item_rejects_the_whole_batch(self):
+        data = self.payload(['10.00', '20.00'])
+        data['transfers'].append({'recipient_wallet_number': '999999', 'amount': '5.00'})
+        response = self.client.post(self.url, data, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([item['status'] for item in response.json()['results']], ['ok', 'ok', 'error'])
+        self.assertEqual(Wallet.objects.get(user=self.business).balance, Decimal('1000.00'))
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_insufficient_balance_for_total_sends_nothing(self):
+        response = self.client.post(self.url, self.payload(['600.00', '600.00']), format='json')
+        self.assertEqual((response.status_code, response.json()), (400, {'error': 'Insufficient balance.'}))
+        self.assertEqual(Wallet.objects.get(user=self.suppliers[0]).balance, Decimal('0.00'))
+
+    def test_only_business_accounts_with_correct_pin(self):
+        self.assertEqual(self.client.post(self.url, self.payload(['1.00'], pin='0000'), format='json').status_code, 403)
+        individual = APIClient()
+        individual.force_authenticate(self.suppliers[0])
+        self.assertEqual(individual.post(self.url, self.payload(['1.00']), format='json').status_code, 403)
+
+
+class LedgerTests(TestCase):
+    def setUp(self):
+        self.alice = make_user('alice@example.com', 'Alice', business_type='business')
+        self.bob = make_user('bob@example.com', 'Bob')
+
+    def test_every_movement_posts_a_balanced_journal(self):
+        transfers.deposit(self.alice, Decimal('100.00'))
+        record, _ = transfers.transfer(self.alice, self.bob.wallet.wallet_number, Decimal('30.00'))
+        transfers.bulk_transfer(self.alice, [{'recipient_wallet_number': self.bob.wallet.wallet_number, 'amount': Decimal('5.00')}] * 2)
+
+        self.assertEqual(LedgerEntry.objects.values('journal_id').distinct().count(), 4)
+        for journal_id in LedgerEntry.objects.values_list('journal_id', flat=True).distinct():
+            self.assertEqual(sum(LedgerEntry.objects.filter(journal_id=journal_id).values_list('amount', flat=True)), 0)
+        self.assertEqual(LedgerEntry.objects.filter(reference=record.transaction_id).count(), 2)
+
+        for user in (self.alice, self.bob):
+            wallet = Wallet.objects.get(user=user)
+            self.assertEqual(ledger.balance_as_of(wallet.pk), wallet.total_balance)
+
+    def test_balance_as_of_reads_checkpoint_plus_tail(self):
+        wallet = self.alice.wallet
+        now = timezone.now()
+        for days_ago, amount in [(10, '50.00'), (6, '20.00'), (2, '5.00')]:
+            transfers.deposit(self.alice, Decimal(amount))
+            LedgerEntry.objects.filter(created_at__gt=now).update(created_at=now - timedelta(days=days_ago))
+
+        self.assertEqual(ledger.take_checkpoints(now - timedelta(days=5)), 1)
+        self.assertEqual(ledger.take_checkpoints(now - timedelta(days=5)), 0)
+        self.assertEqual(BalanceCheckpoint.objects.get().balance, Decimal('70.00'))
+
+        self.assertEqual(ledger.balance_as_of(wallet.pk, now - timedelta(days=8)), Decimal('50.00'))
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(ledger.balance_as_of(wallet.pk, now - timedelta(days=1)), Decimal('75.00'))
+        self.assertEqual(len(queries), 2)
+        self.assertEqual(ledger.balance_as_of(wallet.pk), Wallet.objects.get(pk=wallet.pk).balance)
+
+    def test_entries_are_append_only(self):
+        transfers.deposit(self.bob, Decimal('1.00'))
+        entry = LedgerEntry.objects.first()
+        entry.amount = Decimal('1000.00')
+        with self.assertRaises(ValueError):
+            entry.save()
+
+
+class IdempotencyKeyTests(TestCase):
+    def setUp(self):
+        self.sender = make_user('retry@example.com', 'Retrier', pin='1234')
+        self.recipient = make_user('dest@example.com', 'Destination')
+        Wallet.objects.filter(user=self.sender).update(balance=Decimal('100.00'))
+        self.client = APIClient()
+        self.client.force_authenticate(self.sender)
+        self.url = reverse('wallet-transfer')
+        self.data = {
+            'recipient_wallet_number': self.recipient.wallet.wallet_number,
+            'amount': '10.00', 'step': 'transfer', 'pin': '1234',
+        }
+
+    def post(self, data=None, key='key-1'):
+        return self.client.post(self.url, data or self.data, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_replays_first_response_without_moving_money_again(self):
+        first = self.post()
+        second = self.post()
+        self.assertEqual((first.status_code, second.status_code), (200, 200))
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertFalse(first.has_header('Idempotent-Replayed'))
+        self.assertEqual(Transaction.objects.count(), 1)
+        self.assertEqual(Wallet.objects.get(user=self.sender).balance, Decimal('90.00'))
+
+        self.assertEqual(self.post(key='key-2').status_code, 200)
+        self.assertEqual(Transaction.objects.count(), 2)
+
+    def test_key_reused_for_different_request_is_rejected(self):
+        self.post()
+        response = self.post(dict(self.data, amount='20.00'))
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Transaction.objects.count(), 1)
+
+    def test_duplicate_while_in_flight_gets_conflict(self):
+        IdempotencyKey.objects.create(
+            user=self.sender, key='key-1', request_hash='x' * 64, expires_at=timezone.now() + timedelta(hours=1),
+        )
+        with mock.patch('accounts.idempotency.request_fingerprint', return_value='x' * 64):
+            response = self.post()
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(Transaction.objects.exists())
+
+    def test_expired_and_abandoned_keys_are_taken_over(self):
+        self.post()
+        IdempotencyKey.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertFalse(self.post().has_header('Idempotent-Replayed'))
+        self.assertEqual(Transaction.objects.count(), 2)
+
+        IdempotencyKey.objects.update(status='in_flight', claimed_at=timezone.now() - timedelta(minutes=5))
+        self.assertEqual(self.post().status_code, 200)
+        self.assertEqual(Transaction.objects.count(), 3)
+
+    def test_failed_requests_release_the_key(self):
+        with mock.patch('accounts.transfers.transfer', side_effect=RuntimeError('db went away')):
+            with self.assertRaises(RuntimeError):
+                self.post()
+        self.assertFalse(IdempotencyKey.objects.exists())
+        self.assertEqual(self.post().status_code, 200)
+
+    def test_purge_removes_only_expired_keys(self):
+        self.post()
+        self.post(key='old')
+        IdempotencyKey.objects.filter(key='old').update(expires_at=timezone.now() - timedelta(seconds=1))
+        call_command('purge_idempotency_keys', stdout=mock.MagicMock())
+        self.assertEqual(list(IdempotencyKey.objects.values_list('key', flat=True)), ['key-1'])
+
+
+class RecipientCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.sender = make_user('lookup@example.com', 'Looker')
+        self.recipient = make_user('named@example.com', 'Ama Mensah')
+        self.client = APIClient()
+        self.client.force_authenticate(self.sender)
+        self.number = self.recipient.wallet.wallet_number
+
+    def verify(self, number=None):
+        return self.client.post(
+            reverse('wallet-transfer'),
+            {'recipient_wallet_number': number or self.number, 'amount': '1.00', 'step': 'verify'},
+            format='json',
+        )
+
+    def test_repeat_lookups_are_served_from_cache(self):
+        self.assertEqual(self.verify().json(), {'recipient_name': 'Ama Mensah'})
+        with self.assertNumQueries(0):
+            self.assertEqual(self.verify().json(), {'recipient_name': 'Ama Mensah'})
+
+    def test_renaming_the_owner_invalidates(self):
+        self.verify()
+        self.recipient.full_name = 'Ama Owusu'
+        self.recipient.save()
+        self.assertEqual(self.verify().json(), {'recipient_name': 'Ama Owusu'})
+
+    def test_unknown_numbers_are_cached_until_a_wallet_appears(self):
+        wallet = self.recipient.wallet
+        wallet.delete()
+        self.assertEqual(self.verify().status_code, 404)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.verify().status_code, 404)
+
+        Wallet.objects.create(user=self.recipient, wallet_number=self.number)
+        self.assertEqual(self.verify().status_code, 200)
+
+    def test_renumbered_wallet_drops_old_number(self):
+        self.verify()
+        wallet = self.recipient.wallet
+        wallet.wallet_number = '000001'
+        wallet.save()
+        self.assertEqual(self.verify().status_code, 404)
+        self.assertEqual(self.verify('000001').json(), {'recipient_name': 'Ama Mensah'})
+
+
+@override_settings(AUTH_USER_CACHE_SINGLE_PROCESS=True)
+class CachedAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user('cached@example.com', 'Cached User', pin='1234')
+        self.other = make_user('other@example.com', 'Other')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def test_warm_requests_skip_user_and_wallet_queries(self):
+        self.assertEqual(self.client.get(reverse('wallet-info')).status_code, 200)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(reverse('wallet-info')).json()['balance'], '0.00')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(reverse('user-info')).status_code, 200)
+
+    def test_balance_changes_are_visible_immediately(self):
+        self.client.get(reverse('wallet-info'))
+        self.client.post(reverse('wallet-deposit'), {'amount': '50.00'}, format='json')
+        self.assertEqual(self.client.get(reverse('wallet-info')).json()['balance'], '50.00')
+
+        Wallet.objects.filter(user=self.other).update(balance=Decimal('5.00'))
+        transfers.transfer(self.other, self.user.wallet.wallet_number, Decimal('5.00'))
+        self.assertEqual(self.client.get(reverse('wallet-info')).json()['balance'], '55.00')
+
+    def test_saving_the_user_invalidates(self):
+        self.client.get(reverse('user-info'))
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get(reverse('user-info')).status_code, 401)
+
+    def test_only_a_snapshot_without_secrets_is_cached(self):
+        self.client.get(reverse('wallet-info'))
+        entry = cache.get(authentication.cache_key(self.user.pk))
+        self.assertNotIn(self.user.password, str(entry))
+        self.assertEqual(len(entry['user']), len(authentication.USER_FIELDS))
+        # Fields left out of the snapshot are loaded on demand.
+        Wallet.objects.filter(user=self.user).update(balance=Decimal('2.00'))
+        response = self.client.post(reverse('wallet-transfer'), {
+            'recipient_wallet_number': self.other.wallet.wallet_number, 'amount': '1.00', 'step': 'transfer', 'pin': '1234',
+        }, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+
+    @override_settings(AUTH_USER_CACHE_SINGLE_PROCESS=False)
+    def test_per_process_cache_is_not_used(self):
+        self.client.get(reverse('user-info'))
+        self.assertIsNone(cache.get(authentication.cache_key(self.user.pk)))
+        # Even a change no signal reports is seen at once.
+        CustomUser.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertEqual(self.client.get(reverse('user-info')).status_code, 401)
+
+
+class StatementExportTests(TestCase):
+    def setUp(self):
+        self.user = make_user('exporter@example.com', 'Exporter')
+        self.other = make_user('partner@example.com', 'Partner')
+        make_transactions(self.user, self.other, 6)
+        base = timezone.make_aware(datetime(2025, 3, 1, 12, 0))
+        for i, pk in enumerate(Transaction.objects.order_by('id').values_list('pk', flat=True)):
+            Transaction.objects.filter(pk=pk).update(timestamp=base + timedelta(days=i))
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = reverse('wallet-transactions-export')
+
+    def export(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content).decode('utf-8')
+
+    def test_csv_covers_inclusive_date_range_oldest_first(self):
+        response, body = self.export(start='2025-03-02', end='2025-03-04')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertIn('statement-2025-03-02-2025-03-04.csv', response['Content-Disposition'])
+        lines = body.splitlines()
+        self.assertEqual(lines[0].split(','), statements.COLUMNS)
+        self.assertEqual([line.split(',')[1][:10] for line in lines[1:]], ['2025-03-02', '2025-03-03', '2025-03-04'])
+
+    def test_ndjson_with_direction_filter(self):
+        response, body = self.export(start='2025-03-01', end='2025-03-31', export_format='ndjson', type='outgoing')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        rows = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual(len(rows), 3)
+        self.assertEqual({row['direction'] for row in rows}, {'outgoing'})
+        self.assertEqual(rows[0]['amount'], '1.00')
+
+    def test_export_spans_the_archive_cutoff(self):
+        Transaction.objects.filter(timestamp__gte=timezone.make_aware(datetime(2025, 3, 4))).update(
+            timestamp=F('timestamp') + timedelta(days=31),
+        )
+        hot_before = self.export(start='2025-03-01', end='2025-04-30', export_format='ndjson')[1]
+        moved, _ = archive.archive_before(timezone.make_aware(datetime(2025, 4, 1)))
+        self.assertEqual((moved, Transaction.objects.count()), (3, 3))
+
+        _, body = self.export(start='2025-03-01', end='2025-04-30', export_format='ndjson')
+        self.assertEqual(body, hot_before)
+        rows = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual([row['timestamp'][:10] for row in rows],
+                         ['2025-03-01', '2025-03-02', '2025-03-03', '2025-04-04', '2025-04-05', '2025-04-06'])
+        _, body = self.export(start='2025-03-02', end='2025-04-04', type='incoming')
+        incoming = [row['timestamp'][:10] for row in rows[1:4] if row['direction'] == 'incoming']
+        self.assertTrue(incoming)
+        self.assertEqual([line.split(',')[1][:10] for line in body.splitlines()[1:]], incoming)
+
+    def test_rejects_inverted_or_oversized_ranges(self):
+        self.assertEqual(self.client.get(self.url, {'start': '2025-03-05', 'end': '2025-03-01'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'start': '2024-01-01', 'end': '2025-03-01'}).status_code, 400)
+
+
+class DailyRollupTests(TestCase):
+    def setUp(self):
+        self.shop = make_user('shop@example.com', 'Shop', business_type='business')
+        self.buyer = make_user('customer@example.com', 'Customer')
+        self.client = APIClient()
+        self.client.force_authenticate(self.shop)
+
+    def rollups(self):
+        return {
+            (row.user_id, row.direction): (row.total, row.count)
+            for row in DailyTransactionRollup.objects.all()
+        }
+
+    def test_rollups_follow_committed_movements(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            transfers.deposit(self.buyer, Decimal('100.00'))
+        with self.captureOnCommitCallbacks(execute=True):
+            transfers.transfer(self.buyer, self.shop.wallet.wallet_number, Decimal('30.00'))
+        with self.captureOnCommitCallbacks(execute=True):
+            transfers.transfer(self.buyer, self.shop.wallet.wallet_number, Decimal('20.00'))
+        with self.captureOnCommitCallbacks(execute=True):
+            transfers.bulk_transfer(self.shop, [{'recipient_wallet_number': self.buyer.wallet.wallet_number, 'amount': Decimal('5.00')}] * 2)
+
+        expected = {
+            (self.buyer.pk, 'deposit'): (Decimal('100.00'), 1),
+            (self.buyer.pk, 'outgoing'): (Decimal('50.00'), 2),
+            (self.shop.pk, 'incoming'): (Decimal('50.00'), 2),
+            (self.shop.pk, 'outgoing'): (Decimal('10.00'), 2),
+            (self.buyer.pk, 'incoming'): (Decimal('10.00'), 2),
+        }
+        self.assertEqual(self.rollups(), expected)
+
+        self.assertEqual(rollups.rebuild(), 5)
+        self.assertEqual(self.rollups(), expected)
+
+    def test_refused_transfer_leaves_rollups_alone(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(transfers.InsufficientFunds):
+                transfers.transfer(self.buyer, self.shop.wallet.wallet_number, Decimal('1.00'))
+        self.assertFalse(DailyTransactionRollup.objects.exists())
+
+    def test_summary_groups_rollups_by_month(self):
+        rollups.upsert({
+            (self.shop.pk, datetime(2025, 1, 5).date(), 'incoming'): (Decimal('10.00'), 1),
+            (self.shop.pk, datetime(2025, 1, 20).date(), 'incoming'): (Decimal('15.00'), 2),
+            (self.shop.pk, datetime(2025, 2, 1).date(), 'outgoing'): (Decimal('7.50'), 1),
+            (self.buyer.pk, datetime(2025, 1, 5).date(), 'incoming'): (Decimal('99.00'), 1),
+        })
+        url = reverse('wallet-transactions-summary')
+        with self.assertNumQueries(1):
+            body = self.client.get(url, {'start': '2025-01-01', 'end': '2025-02-28'}).json()
+        self.assertEqual([period['period'] for period in body['periods']], ['2025-01', '2025-02'])
+        self.assertEqual(body['periods'][0]['incoming'], {'total': 25.0, 'count': 3})
+        self.assertEqual(body['totals']['outgoing'], {'total': 7.5, 'count': 1})
+
+        days = self.client.get(url, {'start': '2025-01-01', 'end': '2025-01-31', 'group_by': 'day'}).json()
+        self.assertEqual([period['period'] for period in days['periods']], ['2025-01-05', '2025-01-20'])
+
+
+class ChatReplyCacheTests(TestCase):
+    def setUp(self):
+        caches[reply_cache.CACHE_ALIAS].clear()
+        self.user = make_user('cache@example.com')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def ask(self, prompt, **data):
+        return self.client.post(reverse('chatbot'), {'prompt': prompt, **data}, format='json')
+
+    def lookups(self, outcome):
+        return reply_cache.LOOKUPS._values.get((outcome,), 0)
+
+    def test_normalize(self):
+        self.assertEqual(
+            reply_cache.normalize('  How do I export  Cocoa to Ivory Coast?? '),
+            "how do i export cocoa to côte d'ivoire",
+        )
+        self.assertEqual(reply_cache.normalize('Trade with the DRC!'), 'trade with the democratic republic of the congo')
+        self.assertEqual(reply_cache.normalize('Is the card fee high'), 'is the card fee high')
+
+    def test_repeated_first_question_is_answered_from_the_cache(self):
+        hits, misses = self.lookups('hit'), self.lookups('miss')
+        with StubLLMServer() as stub, mock.patch.object(ChatBotView, 'OPENROUTER_URL', stub.url):
+            first = self.ask('How do I export cocoa to Ivory Coast?')
+            second = self.ask("how do i export cocoa to Côte d’Ivoire")
+            streamed = self.ask('HOW DO I EXPORT COCOA TO IVORY COAST', stream=True)
+            events = parse_sse(b''.join(streamed.streaming_content))
+
+        self.assertEqual(len(stub.requests), 1)
+        self.assertEqual(second.json()['reply'], first.json()['reply'])
+        self.assertNotEqual(second.json()['session_id'], first.json()['session_id'])
+        self.assertEqual([e['data']['token'] for e in events if e['event'] == 'message'], [stub.reply])
+        self.assertEqual(events[-1]['event'], 'done')
+        self.assertEqual(ChatMessage.objects.filter(role='assistant', content=stub.reply).count(), 3)
+        self.assertEqual((self.lookups('hit') - hits, self.lookups('miss') - misses), (2, 1))
+
+    def test_follow_up_turns_are_not_cached(self):
+        with StubLLMServer() as stub, mock.patch.object(ChatBotView, 'OPENROUTER_URL', stub.url):
+            session_id = self.ask('How do I export cocoa?').json()['session_id']
+            ineligible = self.lookups('ineligible')
+            self.ask('How do I export cocoa?', session_id=session_id)
+            self.ask('How do I export cocoa?', session_id=session_id)
+        self.assertEqual(len(stub.requests), 3)
+        self.assertEqual(self.lookups('ineligible') - ineligible, 2)
+
+    def test_streamed_reply_is_cached_for_the_async_view(self):
+        with StubLLMServer(tokens=['Use', ' GEPA.']) as stub, mock.patch.object(ChatBotView, 'OPENROUTER_URL', stub.url):
+            b''.join(self.ask('Export rules for Naija?', stream=True).streaming_content)
+            response = async_to_sync(AsyncClient(AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}').post)(
+                reverse('chatbot-async'), {'prompt': 'export rules for Nigeria'}, content_type='application/json',
+            )
+        self.assertEqual(len(stub.requests), 1)
+        self.assertEqual(response.json()['reply'], 'Use GEPA.')
+
+
+@override_settings(METRICS_TOKEN='scrape-me')
+class MetricsTests(TestCase):
+    client_class = partial(Client, HTTP_AUTHORIZATION='Bearer scrape-me')
+
+    def sample(self, text, prefix):
+        for line in text.splitlines():
+            if line.startswith(prefix):
+                return float(line.rsplit(' ', 1)[1])
+        return 0.0
+
+    def test_requests_and_outbound_calls_are_exposed(self):
+        caches[reply_cache.CACHE_ALIAS].clear()
+        user = make_user('metrics@example.com', 'Metrics')
+        client = APIClient()
+        client.force_authenticate(user)
+        before = self.client.get('/metrics').content.decode()
+
+        client.get(reverse('wallet-info'))
+        with StubLLMServer() as stub, mock.patch.object(ChatBotView, 'OPENROUTER_URL', stub.url):
+            client.post(reverse('chatbot'), {'prompt': 'Hi'}, format='json')
+
+        response = self.client.get('/metrics')
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        text = response.content.decode()
+        self.assertIn('# TYPE afriflow_http_request_duration_seconds histogram', text)
+        for prefix in [
+            'afriflow_http_request_duration_seconds_count{view="wallet-info",method="GET",status="200"}',
+            'afriflow_http_request_db_queries_count{view="wallet-info"}',
+            'afriflow_http_response_size_bytes_count{view="wallet-info"}',
+            'afriflow_outbound_request_duration_seconds_count{service="openrouter",outcome="ok"}',
+        ]:
+            self.assertEqual(self.sample(text, prefix) - self.sample(before, prefix), 1, prefix)
+        self.assertGreater(self.sample(text, 'afriflow_http_request_db_queries_sum{view="chatbot"}'), 0)
+
+    async def test_async_views_stay_on_the_event_loop(self):
+        async def view(request):
+            return HttpResponse('ok')
+        middleware = MetricsMiddleware(view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        self.assertFalse(iscoroutinefunction(MetricsMiddleware(lambda request: HttpResponse('ok'))))
+
+        await caches[reply_cache.CACHE_ALIAS].aclear()
+        user = await CustomUser.objects.acreate(email='async-metrics@example.com')
+        client = AsyncClient(AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+        prefix = 'afriflow_http_request_db_queries_count{view="chatbot-async"}'
+        before = self.sample(metrics.render(), prefix)
+        with StubLLMServer() as stub, mock.patch.object(ChatBotView, 'OPENROUTER_URL', stub.url), \
+                mock.patch.object(ChatBotView, 'OPENROUTER_API_KEY', 'test-key'):
+            response = await client.post(reverse('chatbot-async'), {'prompt': 'Hi there'}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.sample(metrics.render(), prefix) - before, 1)
+        self.assertGreater(self.sample(metrics.render(), 'afriflow_http_request_db_queries_sum{view="chatbot-async"}'), 0)
+
+    def test_token_or_staff_required(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 200)
+        anonymous = Client()
+        self.assertEqual(anonymous.get('/metrics').status_code, 401)
+        self.assertEqual(anonymous.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 401)
+        with override_settings(METRICS_TOKEN=''):
+            self.assertEqual(anonymous.get('/metrics').status_code, 401)
+            self.assertEqual(anonymous.get('/metrics', HTTP_AUTHORIZATION='Bearer ').status_code, 401)
+            staff = make_user('staff@example.com', 'Staff')
+            staff.is_staff = True
+            staff.save()
+            anonymous.force_login(staff)
+            self.assertEqual(anonymous.get('/metrics').status_code, 200)
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = metrics.Histogram('h', 'test', ['kind'], buckets=(1, 5))
+        for value in (0.5, 1, 3, 10):
+            histogram.observe(value, kind='x')
+        lines = [f'{name}{labels} {value}' for name, labels, value in histogram.samples()]
+        self.assertEqual(lines, [
+            'h_bucket{kind="x",le="1"} 2',
+            'h_bucket{kind="x",le="5"} 3',
+            'h_bucket{kind="x",le="+Inf"} 4',
+            'h_count{kind="x"} 4',
+            'h_sum{kind="x"} 14.5',
+        ])
+
+
+@override_settings(AUTH_USER_CACHE_SINGLE_PROCESS=True)
+class EndpointQueryBudgetTests(TransactionTestCase):
+    """
+    Every route must stay within its SQL query budget. A real (not test-case
+    wrapped) transaction is used so that work deferred to on_commit counts.
+    """
+
+    # Routes not benchmarked on purpose: the Prometheus scrape endpoint.
+    UNBENCHMARKED_ROUTES = {'metrics'}
+
+    def test_every_route_stays_within_its_query_budget(self):
+        routes = {
+            pattern.name
+            for pattern in accounts_urls.urlpatterns + backend_urls.urlpatterns
+            if getattr(pattern, 'name', None)
+        } - self.UNBENCHMARKED_ROUTES
+        # Scenarios are named after their route; a route may have more than one.
+        self.assertEqual(routes - set(benchmarks.SCENARIOS), set())
+        self.assertEqual(set(benchmarks.SCENARIOS), set(benchmarks.QUERY_BUDGETS))
+        cache.clear()
+        with benchmarks.BenchContext(history=50) as ctx:
+            for name in benchmarks.SCENARIOS:
+                with self.subTest(route=name):
+                    result = benchmarks.run(ctx, name, requests=2)
+                    self.assertLessEqual(result['queries'], result['budget'])
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class BulkProvisioningTests(TestCase):
+    def member(self, i, **extra):
+        return dict({
+            'email': f'member{i}@coop.example.com', 'full_name': f'Member {i}', 'phone_number': '+254700000000',
+            'country': 'Kenya', 'state_province': 'Nakuru', 'preferred_language': 'Swahili',
+            'language': 'Swahili', 'business_type': 'individual', 'password': f'secret-{i}',
+        }, **extra)
+
+    def setUp(self):
+        self.admin = make_user('admin@example.com', 'Admin', is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        self.url = reverse('users-bulk-provision')
+
+    def test_creates_users_and_wallets_in_batches(self):
+        members = [self.member(i) for i in range(20)]
+        members[3].pop('password')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url, {'users': members}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertLess(len(queries), 15)
+
+        body = response.json()
+        self.assertEqual(body['created'], 20)
+        numbers = [user['wallet_number'] for user in body['users']]
+        self.assertEqual(len(set(numbers)), 20)
+        user = CustomUser.objects.get(email='member7@coop.example.com')
+        self.assertEqual((user.wallet.wallet_number, user.is_email_verified), (numbers[7], True))
+        self.assertTrue(user.check_password('secret-7'))
+        self.assertFalse(CustomUser.objects.get(email='member3@coop.example.com').has_usable_password())
+
+    def test_process_pool_hashes_match_serial_ones(self):
+        from .provisioning import hash_passwords
+        hashed = hash_passwords([f'pw-{i}' for i in range(16)] + [None], workers=2)
+        self.assertEqual(len(hashed), 17)
+        from django.contrib.auth.hashers import check_password
+        self.assertTrue(all(check_password(f'pw-{i}', hashed[i]) for i in range(16)))
+        self.assertFalse(check_password('', hashed[16]))
+
+    def test_rejects_duplicates_and_existing_emails_atomically(self):
+        members = [self.member(0), self.member(1), self.member(0), self.member(2, email='admin@example.com')]
+        response = self.client.post(self.url, {'users': members}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()['users']), {'2', '3'})
+        self.assertFalse(CustomUser.objects.filter(email__endswith='@coop.example.com').exists())
+
+    def test_api_hashes_in_process_and_reports_races(self):
+        with mock.patch.object(provisioning, 'ProcessPoolExecutor') as pool:
+            response = self.client.post(self.url, {'users': [self.member(i) for i in range(20)]}, format='json')
+        self.assertEqual(response.status_code, 201)
+        pool.assert_not_called()
+
+        # An account created between validation and the insert.
+        members = [self.member(100), self.member(101)]
+        with mock.patch.object(BulkProvisionSerializer, 'validate_users', side_effect=lambda users: users):
+            make_user('member101@coop.example.com')
+            response = self.client.post(self.url, {'users': members}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('error', response.json())
+        self.assertFalse(CustomUser.objects.filter(email='member100@coop.example.com').exists())
+
+        too_many = [self.member(i) for i in range(200, 200 + BulkProvisionSerializer.MAX_USERS + 1)]
+        self.assertEqual(self.client.post(self.url, {'users': too_many}, format='json').status_code, 400)
+
+    @override_settings(PASSWORD_HASHERS=global_settings.PASSWORD_HASHERS)
+    def test_a_full_request_fits_the_worker_timeout_with_the_real_hasher(self):
+        started = time.perf_counter()
+        response = self.client.post(self.url, {'users': [self.member(0)]}, format='json')
+        elapsed = time.perf_counter() - started
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(CustomUser.objects.get(email='member0@coop.example.com').check_password('secret-0'))
+        # gunicorn kills a worker after 30 s; leave room for a slower machine.
+        self.assertLess(elapsed * BulkProvisionSerializer.MAX_USERS, 15)
+
+    def test_staff_only(self):
+        client = APIClient()
+        client.force_authenticate(make_user('plain@example.com'))
+        self.assertEqual(client.post(self.url, {'users': [self.member(0)]}, format='json').status_code, 403)
+
+
+@override_settings(AUTH_USER_CACHE_SINGLE_PROCESS=True)
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = make_user('poller@example.com', 'Poller', pin='1234')
+        self.other = make_user('payee@example.com', 'Payee')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def revalidate(self, url):
+        etag = self.client.get(url)['ETag']
+        return etag, self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    def test_unchanged_wallet_and_user_answer_304_without_queries(self):
+        for name in ('wallet-info', 'user-info'):
+            etag = self.client.get(reverse(name))['ETag']
+            with self.assertNumQueries(0):
+                response = self.client.get(reverse(name), HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.content, b'')
+
+    def test_balance_updates_change_the_wallet_etag(self):
+        url = reverse('wallet-info')
+        etag, _ = self.revalidate(url)
+        Wallet.objects.filter(user=self.other).update(balance=Decimal('5.00'))
+        transfers.transfer(self.other, self.user.wallet.wallet_number, Decimal('5.00'))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['balance'], '5.00')
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_sharded_credits_change_the_wallet_etag(self):
+        balance_shards.enable(self.user.wallet, 4)
+        url = reverse('wallet-info')
+        etag, response = self.revalidate(url)
+        self.assertEqual(response.status_code, 304)
+        transfers.deposit(self.user, Decimal('3.00'))
+        self.assertEqual(WalletBalanceShard.objects.filter(wallet=self.user.wallet, balance=Decimal('3.00')).count(), 1)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((response.status_code, response.json()['balance']), (200, '3.00'))
+
+    @override_settings(AUTH_USER_CACHE_SINGLE_PROCESS=False)
+    def test_per_process_cache_never_confirms_a_stale_tag(self):
+        url = reverse('wallet-info')
+        etag, response = self.revalidate(url)
+        self.assertEqual(response.status_code, 304)
+        # Another worker's write; its invalidation would not reach this one.
+        Wallet.objects.filter(user=self.user).update(balance=Decimal('9.00'), version=F('version') + 1)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((response.status_code, response.json()['balance']), (200, '9.00'))
+
+    def test_saves_bump_versions(self):
+        version = CustomUser.objects.get(pk=self.user.pk).version
+        self.user.full_name = 'Renamed'
+        self.user.save(update_fields=['full_name'])
+        self.assertEqual(self.user.version, version + 1)
+        self.assertEqual(CustomUser.objects.get(pk=self.user.pk).version, version + 1)
+
+    def test_transaction_detail_follows_party_names(self):
+        Wallet.objects.filter(user=self.user).update(balance=Decimal('10.00'))
+        txn = transfers.transfer(self.user, self.other.wallet.wallet_number, Decimal('1.00'))[0]
+        url = reverse('wallet-transaction-detail', kwargs={'transaction_id': txn.transaction_id})
+        etag, response = self.revalidate(url)
+        self.assertEqual(response.status_code, 304)
+
+        self.other.full_name = 'Payee Ltd'
+        self.other.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual((response.status_code, response.json()['receiver_name_display']), (200, 'Payee Ltd'))
+
+        stranger = APIClient()
+        stranger.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(make_user("x@example.com"))}')
+        self.assertEqual(stranger.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 404)
+
+
+class FastSerializationTests(TestCase):
+    def setUp(self):
+        self.user = make_user('fast@example.com', 'Fast User')
+        self.other = make_user('peer@example.com', 'Peer')
+        make_transactions(self.user, self.other, 4)
+        Transaction.objects.filter(pk=Transaction.objects.first().pk).update(description='', amount=Decimal('12.5'))
+        self.session = ChatSession.objects.create(user=self.user, title=None)
+        ChatSession.objects.create(user=self.user, title='Empty')
+        ChatMessage.objects.create(chat_session=self.session, role='user', content='Habari')
+
+    def test_row_serializers_match_model_serializers(self):
+        from .serializers import (
+            CHAT_MESSAGE_ROWS, CHAT_SESSION_OVERVIEW_ROWS, TRANSACTION_ROWS,
+            ChatMessageSerializer, ChatSessionOverviewSerializer, TransactionSerializer,
+        )
+        cases = [
+            (TransactionSerializer, TRANSACTION_ROWS, Transaction.objects.annotate_for(self.user).order_by('pk')),
+            (ChatMessageSerializer, CHAT_MESSAGE_ROWS, ChatMessage.objects.order_by('pk')),
+            (ChatSessionOverviewSerializer, CHAT_SESSION_OVERVIEW_ROWS, ChatSession.objects.with_overview().order_by('pk')),
+        ]
+        for model_serializer, rows, queryset in cases:
+            with self.subTest(model_serializer.__name__):
+                expected = model_serializer(queryset, many=True).data
+                self.assertEqual(rows.many(rows.values(queryset)), [dict(item) for item in expected])
+        with timezone.override('Africa/Nairobi'):
+            row = TRANSACTION_ROWS.values(cases[0][2]).first()
+            self.assertTrue(TRANSACTION_ROWS.to_representation(row)['timestamp'].endswith('+03:00'))
+
+    def test_fast_renderer_matches_drf(self):
+        from django.utils.translation import gettext_lazy
+        from rest_framework.renderers import JSONRenderer
+        from . import renderers
+        data = {
+            'amount': Decimal('10.50'), 'at': timezone.now(), 'id': Transaction.objects.first().transaction_id,
+            'label': gettext_lazy('Balance'), 'note': 'line\u2028break', 'nested': [{'ok': True, 'n': None}],
+        }
+        fast = renderers.FastJSONRenderer().render(data)
+        self.assertEqual(fast, JSONRenderer().render(data))
+        with mock.patch.object(renderers, 'orjson', None):
+            self.assertEqual(renderers.FastJSONRenderer().render(data), fast)
+
+    def test_list_endpoints_and_json_bodies(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        page = client.get(reverse('wallet-transactions'), {'page_size': 3}).json()
+        self.assertEqual(len(page['results']), 3)
+        self.assertEqual(len(client.get(page['next']).json()['results']), 1)
+        self.assertEqual(client.get(reverse('chatbot-sessions')).json()['count'], 2)
+
+        response = client.post(reverse('wallet-deposit'), b'{"amount": "5.00"}', content_type='application/json')
+        self.assertEqual(response.json()['balance'], 5.0)
+        response = client.post(reverse('wallet-deposit'), b'{"amount": NaN', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('JSON parse error', response.json()['detail'])
+
+
+class TransactionArchiveTests(TestCase):
+    def setUp(self):
+        self.user = make_user('archivist@example.com', 'Archivist')
+        self.other = make_user('counterparty@example.com', 'Counterparty')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        make_transactions(self.user, self.other, 9)
+        now = timezone.now()
+        # Three each: about 6 months, 4 months and a week old; always two different archived months.
+        for i, pk in enumerate(Transaction.objects.order_by('pk').values_list('pk', flat=True)):
+            age = [timedelta(days=180), timedelta(days=120), timedelta(days=7)][i // 3]
+            Transaction.objects.filter(pk=pk).update(timestamp=now - age - timedelta(minutes=i), amount=Decimal(i + 1))
+        rollups.rebuild()
+
+    def api_rows(self, user):
+        return [dict(row) for row in TransactionSerializer(
+            Transaction.objects.annotate_for(user).order_by('-timestamp', '-id'), many=True,
+        ).data]
+
+    def test_old_months_move_to_compressed_archives(self):
+        before = {user.pk: self.api_rows(user) for user in (self.user, self.other)}
+        summary = rollup_totals()
+
+        out = StringIO()
+        call_command('archive_transactions', older_than_days=60, batch_size=4, stdout=out)
+        self.assertIn('Archived 6 transactions', out.getvalue())
+        self.assertEqual(Transaction.objects.count(), 3)
+        self.assertEqual(TransactionArchive.objects.filter(user=self.user).count(), 2)
+
+        months = self.client.get(reverse('wallet-transactions-archive')).json()['months']
+        self.assertEqual([m['count'] for m in months], [3, 3])
+        archived = []
+        for month in months:
+            response = self.client.get(reverse('wallet-transactions-archive'), {'month': month['month']})
+            archived += response.json()['results']
+        self.assertEqual(self.api_rows(self.user) + archived, before[self.user.pk])
+
+        other = TransactionArchive.objects.filter(user=self.other).order_by('-month')
+        self.assertEqual(self.api_rows(self.other) + [row for chunk in other for row in archive.decompress(chunk.payload)],
+                         before[self.other.pk])
+
+        rollups.rebuild()
+        self.assertEqual(rollup_totals(), summary)
+
+    def test_late_rows_merge_into_existing_archive(self):
+        call_command('archive_transactions', older_than_days=60, stdout=StringIO())
+        month = TransactionArchive.objects.filter(user=self.user).order_by('month').first().month
+        make_transactions(self.user, self.other, 1)
+        Transaction.objects.filter(timestamp__gt=timezone.now() - timedelta(minutes=1)).update(
+            timestamp=timezone.make_aware(datetime.combine(month.replace(day=28), datetime.max.time())),
+        )
+        call_command('archive_transactions', older_than_days=60, stdout=StringIO())
+
+        rows = archive.read(self.user, month)
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(rows, sorted(rows, key=archive.sort_key, reverse=True))
+        self.assertEqual(TransactionArchive.objects.get(user=self.user, month=month).row_count, 4)
+
+    def test_self_transfers_keep_both_rollup_directions(self):
+        Wallet.objects.filter(user=self.user).update(balance=Decimal('10.00'))
+        txn = transfers.transfer(self.user, self.user.wallet.wallet_number, Decimal('10.00'))[0]
+        Transaction.objects.filter(pk=txn.pk).update(timestamp=timezone.now() - timedelta(days=180))
+        rollups.rebuild()
+        summary = rollup_totals()
+
+        call_command('archive_transactions', older_than_days=60, stdout=StringIO())
+        rollups.rebuild()
+        self.assertEqual(rollup_totals(), summary)
+        rows = archive.read(self.user, timezone.localdate(timezone.now() - timedelta(days=180)))
+        mine = [row for row in rows if row['transaction_id'] == str(txn.transaction_id)]
+        self.assertEqual([row['transaction_direction'] for row in mine], ['outgoing'])
+        self.assertNotIn(archive.SELF_TRANSFER, mine[0])
+
+    def test_month_filters_and_missing_months(self):
+        call_command('archive_transactions', older_than_days=60, stdout=StringIO())
+        month = TransactionArchive.objects.filter(user=self.user).first().month.strftime('%Y-%m')
+        url = reverse('wallet-transactions-archive')
+        outgoing = self.client.get(url, {'month': month, 'type': 'outgoing'}).json()['results']
+        self.assertTrue(outgoing and all(row['transaction_direction'] == 'outgoing' for row in outgoing))
+        self.assertEqual(self.client.get(url, {'month': '2001-01'}).status_code, 404)
+        self.assertEqual(self.client.get(url, {'month': 'January'}).status_code, 400)
+
+        first = self.client.get(url, {'month': month, 'limit': 2}).json()
+        self.assertEqual((first['count'], first['next_offset'], len(first['results'])), (3, 2, 2))
+        rest = self.client.get(url, {'month': month, 'limit': 2, 'offset': 2}).json()
+        self.assertEqual((rest['next_offset'], len(rest['results'])), (None, 1))
+        self.assertEqual(first['results'] + rest['results'], archive.read(self.user, TransactionArchive.objects.filter(user=self.user).first().month))
+
+    def test_a_month_is_written_once_however_many_batches(self):
+        with mock.patch.object(archive, 'compress', wraps=archive.compress) as compress:
+            moved, written = archive.archive_before(archive.cutoff(60), batch_size=1)
+        self.assertEqual((moved, written), (6, 4))
+        self.assertEqual(compress.call_count, 4)
+
+
+def rollup_totals():
+    return sorted(DailyTransactionRollup.objects.values_list('user_id', 'day', 'direction', 'total', 'count'))
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.trader = make_user('trader@example.com', 'Kwame Trader', pin='1234')
+        self.farmer = make_user('farmer@example.com', 'Cocoa Farms Ltd')
+        self.stranger = make_user('stranger@example.com', 'Stranger')
+        Wallet.objects.filter(user=self.trader).update(balance=Decimal('100.00'))
+        transfers.transfer(self.trader, self.farmer.wallet.wallet_number, Decimal('10.00'), description='Payment for cocoa beans')
+        transfers.transfer(self.trader, self.farmer.wallet.wallet_number, Decimal('5.00'), description='Transport')
+        transfers.bulk_transfer(self.trader, [
+            {'recipient_wallet_number': self.farmer.wallet.wallet_number, 'amount': Decimal('1.00'), 'description': 'Cocoa payment, café run'},
+        ])
+        session = ChatSession.objects.create(user=self.trader)
+        ChatMessage.objects.create(chat_session=session, role='system', content='You advise on cocoa exports.')
+        ChatMessage.objects.create(chat_session=session, role='user', content='What documents do I need for a cocoa payment abroad?')
+        self.client = APIClient()
+        self.client.force_authenticate(self.trader)
+
+    def results(self, client=None, **params):
+        response = (client or self.client).get(reverse('search'), params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_ranked_hits_across_transactions_and_messages(self):
+        body = self.results(q='payment cocoa')
+        types = [hit['type'] for hit in body['results']]
+        self.assertEqual(sorted(types), ['chat_message', 'transaction', 'transaction'])
+        self.assertEqual(sorted(s['score'] for s in body['results'])[::-1], [s['score'] for s in body['results']])
+        transaction = next(hit['transaction'] for hit in body['results'] if hit['type'] == 'transaction')
+        self.assertEqual(transaction['transaction_direction'], 'outgoing')
+
+        self.assertEqual(len(self.results(q='Cocoa Farms', type='transaction')['results']), 3)
+        self.assertEqual(self.results(q='cafe')['results'][0]['transaction']['amount'], '1.00')
+        self.assertEqual(len(self.results(q='transp')['results']), 1)
+        self.assertEqual(self.results(q='exports')['results'], [])
+
+    def test_only_the_users_own_documents(self):
+        farmer = APIClient()
+        farmer.force_authenticate(self.farmer)
+        hits = self.results(farmer, q='cocoa payment')['results']
+        self.assertEqual([hit['transaction']['transaction_direction'] for hit in hits], ['incoming', 'incoming'])
+        stranger = APIClient()
+        stranger.force_authenticate(self.stranger)
+        self.assertEqual(self.results(stranger, q='cocoa')['results'], [])
+
+    def test_pagination_and_validation(self):
+        first = self.results(q='cocoa', page_size=2)
+        self.assertEqual((len(first['results']), first['next_page']), (2, 2))
+        second = self.results(q='cocoa', page_size=2, page=2)
+        self.assertEqual((len(second['results']), second['next_page']), (2, None))
+        self.assertEqual(self.client.get(reverse('search'), {'q': '!!!'}).status_code, 400)
+        self.assertEqual(self.results(q='AND OR "NEAR"')['results'], [])
+
+    def test_index_follows_updates_deletes_and_rebuilds(self):
+        txn = Transaction.objects.get(description='Transport')
+        txn.description = 'Shea butter'
+        txn.save()
+        self.assertEqual(self.results(q='transport')['results'], [])
+        self.assertEqual(len(self.results(q='shea')['results']), 1)
+        txn.delete()
+        self.assertEqual(self.results(q='shea')['results'], [])
+
+        from .models import SearchDocument
+        count = SearchDocument.objects.count()
+        SearchDocument.objects.all().delete()
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(SearchDocument.objects.count(), count)
+        self.assertEqual(len(self.results(q='cocoa')['results']), 3)
+
+    def test_migration_indexes_rows_written_before_the_index(self):
+        from .models import SearchDocument
+        migration = importlib.import_module('accounts.migrations.0017_searchdocument_user_index_backfill')
+        count = SearchDocument.objects.count()
+        SearchDocument.objects.filter(kind='chat_message').delete()
+        SearchDocument.objects.filter(transaction__description='Transport').delete()
+        migration.backfill(django_apps, mock.Mock(connection=connection))
+        self.assertEqual(SearchDocument.objects.count(), count)
+        self.assertEqual(len(self.results(q='transport')['results']), 1)
+        migration.backfill(django_apps, mock.Mock(connection=connection))
+        self.assertEqual(SearchDocument.objects.count(), count)
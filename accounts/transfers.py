@@ -0,0 +1,274 @@
+"""
+Money movement between wallets.
+
+Balances are only ever changed with single conditional ``UPDATE``
+statements (``balance = balance - x WHERE balance >= x``), never with a
+read-modify-``save()``, so concurrent transfers can't lose updates. Both
+wallet rows are locked in primary-key order first, which keeps two
+opposite transfers between the same pair of wallets from deadlocking.
+
+Credits to wallets with sharded balances go to a shard row instead, and
+such a recipient's wallet row is not locked at all (see balance_shards.py).
+
+Wallet and shard rows are locked ``FOR NO KEY UPDATE``, never plain
+``FOR UPDATE``. A credit holds its shard row while inserting ledger rows
+whose foreign key takes ``KEY SHARE`` on the wallet row; with ``FOR
+UPDATE`` on that wallet, an outgoing transfer folding the shards would wait
+on the credit while the credit waits on it. ``NO KEY UPDATE`` doesn't
+conflict with ``KEY SHARE``, so credits never queue behind the wallet's
+own transfers. The lock order is: wallet rows by pk, then shard rows.
+
+Every deposit and transfer is also posted to the ledger (see ledger.py)
+in the same database transaction as the balance change. The owners of the
+wallets touched are dropped from the authentication cache, which would
+otherwise keep serving their old balance. Daily rollups are updated after
+the commit (see rollups.py).
+"""
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, Q, Value, When
+from django.utils import timezone
+
+from . import balance_shards, ledger, rollups, search
+from .authentication import forget_cached_users
+from .models import Transaction, Wallet
+
+
+class TransferError(Exception):
+    """Base class for transfers that were refused; ``str()`` is user-facing."""
+
+
+class InvalidAmount(TransferError):
+    pass
+
+
+class RecipientNotFound(TransferError):
+    pass
+
+
+class InsufficientFunds(TransferError):
+    pass
+
+
+class BulkTransferRejected(TransferError):
+    """Some items of a bulk transfer were invalid; ``results`` says which."""
+
+    def __init__(self, message, results):
+        super().__init__(message)
+        self.results = results
+
+
+def lock_wallets(condition):
+    """
+    ``SELECT ... FOR NO KEY UPDATE`` the wallets matching ``condition`` in
+    primary key order and return their ``pk``, ``user_id``, ``wallet_number``,
+    ``balance`` and ``shard_count`` values keyed by pk.
+    """
+    rows = (
+        Wallet.objects.select_for_update(no_key=True)
+        .filter(condition)
+        .order_by('pk')
+        .values('pk', 'user_id', 'wallet_number', 'balance', 'shard_count')
+    )
+    return {row['pk']: row for row in rows}
+
+
+def debit(wallet_pk, amount, shard_count=0):
+    """
+    Atomically take ``amount`` from a wallet, or raise InsufficientFunds.
+
+    For a sharded wallet whose main balance falls short, the shards are
+    folded in first and the debit retried once.
+    """
+    funded = Wallet.objects.filter(pk=wallet_pk, balance__gte=amount)
+    updated = funded.update(balance=F('balance') - amount, version=F('version') + 1)
+    if not updated and shard_count and balance_shards.fold(wallet_pk):
+        updated = funded.update(balance=F('balance') - amount, version=F('version') + 1)
+    if not updated:
+        raise InsufficientFunds('Insufficient balance.')
+
+
+def credit(wallet_pk, amount, shard_count=0):
+    if shard_count and balance_shards.credit_shard(wallet_pk, amount, shard_count):
+        return
+    Wallet.objects.filter(pk=wallet_pk).update(balance=F('balance') + amount, version=F('version') + 1)
+
+
+def current_balance(wallet_pk, shard_count=0):
+    balance = Wallet.objects.values_list('balance', flat=True).get(pk=wallet_pk)
+    if shard_count:
+        balance += balance_shards.shard_total(wallet_pk)
+    return balance
+
+
+def deposit(user, amount):
+    """Credit ``amount`` to ``user``'s wallet and return its new balance."""
+    if amount <= 0:
+        raise InvalidAmount('Amount must be greater than zero.')
+    with transaction.atomic():
+        wallet = Wallet.objects.values('pk', 'wallet_number', 'shard_count').get(user_id=user.pk)
+        credit(wallet['pk'], amount, wallet['shard_count'])
+        ledger.record_deposit(wallet, amount)
+        forget_cached_users(user.pk)
+        rollups.record_on_commit([(user.pk, timezone.now(), 'deposit', amount)])
+        return current_balance(wallet['pk'], wallet['shard_count'])
+
+
+def transfer(sender, recipient_wallet_number, amount, description=''):
+    """
+    Move ``amount`` from ``sender``'s wallet to the wallet numbered
+    ``recipient_wallet_number`` and record the Transaction. Returns the
+    Transaction and the sender's new balance.
+
+    Raises a ``TransferError`` subclass if the transfer is refused; nothing
+    is written in that case.
+    """
+    if amount <= 0:
+        raise InvalidAmount('Amount must be greater than zero.')
+
+    with transaction.atomic():
+        recipient = (
+            Wallet.objects.filter(wallet_number=recipient_wallet_number)
+            .values('pk', 'user_id', 'wallet_number', 'user__full_name', 'shard_count')
+            .first()
+        )
+        if recipient is None:
+            raise RecipientNotFound('Recipient wallet not found.')
+
+        # A sharded recipient is credited through a shard row, so its wallet
+        # row is left unlocked; that's the point of sharding it.
+        condition = Q(user_id=sender.pk)
+        if not recipient['shard_count']:
+            condition |= Q(pk=recipient['pk'])
+        wallets = lock_wallets(condition)
+        sender_wallet = next(row for row in wallets.values() if row['user_id'] == sender.pk)
+
+        debit(sender_wallet['pk'], amount, sender_wallet['shard_count'])
+        credit(recipient['pk'], amount, recipient['shard_count'])
+
+        record = Transaction.objects.create(
+            sender_id=sender.pk,
+            receiver_id=recipient['user_id'],
+            amount=amount,
+            receiver_name=recipient['user__full_name'],
+            receiver_account_number=recipient_wallet_number,
+            description=description,
+        )
+        ledger.record_transfers([(sender_wallet, recipient, amount, record.transaction_id)])
+        forget_cached_users(sender.pk, recipient['user_id'])
+        rollups.record_on_commit([
+            (sender.pk, record.timestamp, 'outgoing', amount),
+            (recipient['user_id'], record.timestamp, 'incoming', amount),
+        ])
+
+        if sender_wallet['shard_count']:
+            sender_balance = current_balance(sender_wallet['pk'], sender_wallet['shard_count'])
+        else:
+            sender_balance = sender_wallet['balance'] - amount
+            if sender_wallet['pk'] == recipient['pk']:
+                sender_balance += amount
+    return record, sender_balance
+
+
+# Rows per CASE-based balance UPDATE when crediting many wallets at once.
+BULK_CREDIT_CHUNK = 500
+
+
+def bulk_credit(amounts):
+    """Credit ``{wallet_pk: amount}`` with one UPDATE per chunk of wallets."""
+    pks = list(amounts)
+    for start in range(0, len(pks), BULK_CREDIT_CHUNK):
+        chunk = pks[start:start + BULK_CREDIT_CHUNK]
+        increment = Case(
+            *[When(pk=pk, then=Value(amounts[pk])) for pk in chunk],
+            output_field=DecimalField(max_digits=12, decimal_places=2),
+        )
+        Wallet.objects.filter(pk__in=chunk).update(balance=F('balance') + increment, version=F('version') + 1)
+
+
+def bulk_transfer(sender, items):
+    """
+    Pay many recipients from ``sender``'s wallet as one atomic unit.
+
+    ``items`` is a list of dicts with ``recipient_wallet_number``,
+    ``amount`` and optionally ``description``. All recipients are resolved
+    in one query, the sender is debited once for the total, recipients are
+    credited with batched UPDATEs and the Transaction rows are written with
+    ``bulk_create``. Either every item is applied or none is: invalid items
+    raise ``BulkTransferRejected`` with a per-item report.
+
+    Returns the per-item results and the sender's new balance.
+    """
+    numbers = {item['recipient_wallet_number'] for item in items}
+
+    with transaction.atomic():
+        recipients = {
+            row['wallet_number']: row
+            for row in Wallet.objects.filter(wallet_number__in=numbers)
+            .values('pk', 'wallet_number', 'user_id', 'user__full_name', 'shard_count')
+        }
+
+        results = []
+        for index, item in enumerate(items):
+            result = {'index': index, 'recipient_wallet_number': item['recipient_wallet_number'], 'amount': item['amount']}
+            if item['amount'] <= 0:
+                result.update(status='error', error='Amount must be greater than zero.')
+            elif item['recipient_wallet_number'] not in recipients:
+                result.update(status='error', error='Recipient wallet not found.')
+            else:
+                result['status'] = 'ok'
+            results.append(result)
+        if any(result['status'] == 'error' for result in results):
+            raise BulkTransferRejected('Some transfers are invalid; nothing was sent.', results)
+
+        plain_credits = {}
+        sharded_credits = {}
+        for item in items:
+            recipient = recipients[item['recipient_wallet_number']]
+            target = sharded_credits if recipient['shard_count'] else plain_credits
+            target[recipient['pk']] = target.get(recipient['pk'], 0) + item['amount']
+
+        wallets = lock_wallets(Q(user_id=sender.pk) | Q(pk__in=list(plain_credits)))
+        sender_wallet = next(row for row in wallets.values() if row['user_id'] == sender.pk)
+
+        total = sum(item['amount'] for item in items)
+        debit(sender_wallet['pk'], total, sender_wallet['shard_count'])
+        bulk_credit(plain_credits)
+        shard_counts = {row['pk']: row['shard_count'] for row in recipients.values()}
+        # In wallet pk order, like lock_wallets(), so concurrent bulk transfers
+        # lock shared sharded recipients in the same order and can't deadlock.
+        for wallet_pk, amount in sorted(sharded_credits.items()):
+            credit(wallet_pk, amount, shard_counts[wallet_pk])
+
+        records = Transaction.objects.bulk_create([
+            Transaction(
+                sender_id=sender.pk,
+                receiver_id=recipients[item['recipient_wallet_number']]['user_id'],
+                amount=item['amount'],
+                receiver_name=recipients[item['recipient_wallet_number']]['user__full_name'],
+                receiver_account_number=item['recipient_wallet_number'],
+                description=item.get('description', ''),
+            )
+            for item in items
+        ])
+        search.index_transactions(records)
+        ledger.record_transfers(
+            (sender_wallet, recipients[item['recipient_wallet_number']], item['amount'], record.transaction_id)
+            for item, record in zip(items, records)
+        )
+        forget_cached_users(sender.pk, *(row['user_id'] for row in recipients.values()))
+        rollups.record_on_commit(
+            movement
+            for record in records
+            for movement in [
+                (sender.pk, record.timestamp, 'outgoing', record.amount),
+                (record.receiver_id, record.timestamp, 'incoming', record.amount),
+            ]
+        )
+        sender_balance = current_balance(sender_wallet['pk'], sender_wallet['shard_count'])
+
+    for result, record in zip(results, records):
+        result.update(
+            recipient_name=record.receiver_name,
+            transaction_id=record.transaction_id,
+        )
+    return results, sender_balance
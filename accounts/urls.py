@@ -1,18 +1,26 @@
 from django.urls import path
-from .views import RegistrationView, LoginView, UserInfoView, WalletInfoView, DepositView, TransferView, TransactionListView, TransactionDetailView, ChatBotView, ChatSessionListView,VerifyEmailView
+from .views import RegistrationView, BulkProvisionView, LoginView, UserInfoView, WalletInfoView, DepositView, TransferView, BulkTransferView, TransactionListView, StatementExportView, TransactionSummaryView, TransactionArchiveView, TransactionDetailView, SearchView, ChatBotView, AsyncChatBotView, ChatSessionListView, ChatMessageListView,VerifyEmailView
 
 urlpatterns = [
     path('register/', RegistrationView.as_view(), name='register'),
      path('verify-email/<uidb64>/<token>/', VerifyEmailView.as_view(), name='verify-email'),
     path('login/', LoginView.as_view(), name='login'),
     path('user-info/', UserInfoView.as_view(), name='user-info'),
+    path('users/bulk/', BulkProvisionView.as_view(), name='users-bulk-provision'),
     path('wallet/', WalletInfoView.as_view(), name='wallet-info'),
     path('wallet/deposit/', DepositView.as_view(), name='wallet-deposit'),
     path('wallet/transfer/', TransferView.as_view(), name='wallet-transfer'),
+    path('wallet/transfer/bulk/', BulkTransferView.as_view(), name='wallet-transfer-bulk'),
     path('wallet/transactions/', TransactionListView.as_view(), name='wallet-transactions'),
+    path('wallet/transactions/export/', StatementExportView.as_view(), name='wallet-transactions-export'),
+    path('wallet/transactions/summary/', TransactionSummaryView.as_view(), name='wallet-transactions-summary'),
+    path('wallet/transactions/archive/', TransactionArchiveView.as_view(), name='wallet-transactions-archive'),
     path('wallet/transactions/<uuid:transaction_id>/', TransactionDetailView.as_view(), name='wallet-transaction-detail'),
+    path('search/', SearchView.as_view(), name='search'),
     path('chatbot/', ChatBotView.as_view(), name='chatbot'),
+    path('chatbot/async/', AsyncChatBotView.as_view(), name='chatbot-async'),
     path('chatbot/sessions/', ChatSessionListView.as_view(), name='chatbot-sessions'),
+    path('chatbot/sessions/<uuid:session_id>/messages/', ChatMessageListView.as_view(), name='chatbot-session-messages'),
 
 
 ]
@@ -1,23 +1,46 @@
 from rest_framework import generics, status
 from rest_framework.response import Response
 from rest_framework_simplejwt.tokens import RefreshToken
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from django.contrib.auth import authenticate
-from .serializers import RegistrationSerializer, LoginSerializer, UserInfoSerializer, WalletSerializer, DepositSerializer, TransferSerializer, TransactionSerializer, ChatPromptSerializer, ChatSessionSerializer, ChatMessageSerializer
+from .serializers import RegistrationSerializer, BulkProvisionSerializer, LoginSerializer, UserInfoSerializer, WalletSerializer, DepositSerializer, TransferSerializer, BulkTransferSerializer, TransactionSerializer, ChatPromptSerializer, ChatSessionOverviewSerializer, ChatMessageSerializer, StatementExportSerializer, TransactionSummarySerializer, TransactionArchiveSerializer, SearchSerializer, TRANSACTION_ROWS, CHAT_MESSAGE_ROWS, CHAT_SESSION_OVERVIEW_ROWS
 from rest_framework.views import APIView
-from .models import Wallet, CustomUser, Transaction, ChatSession, ChatMessage
-from django.db import transaction
+from .models import Wallet, CustomUser, Transaction, ChatSession, ChatMessage, DailyTransactionRollup
+from django.db import IntegrityError, transaction
 from decimal import Decimal
-from django.db.models import Q
+from datetime import datetime, time, timedelta
+from django.utils import timezone
+from django.db.models import F, Q, Sum
+from django.db.models.functions import TruncMonth
 import requests
-from django.core.mail import send_mail
+from .outbox import enqueue_email
 from django.urls import reverse
 from django.utils.http import urlsafe_base64_encode
 from django.utils.encoding import force_bytes
 from .tokens import email_verification_token
 from django.utils.http import urlsafe_base64_decode
 from django.utils.encoding import force_str
-from django.http import HttpResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition
+from django.utils.cache import get_conditional_response
+from django.utils.decorators import method_decorator
+from django.utils.http import quote_etag
+from asgiref.sync import sync_to_async
+from rest_framework.exceptions import AuthenticationFailed
+from .authentication import CachedJWTAuthentication
+import httpx
+import json
+from .llm import achat_completion, astream_chat_completion, chat_completion, sse_event, stream_chat_completion
+from . import archive, provisioning, recipients, reply_cache, search, statements, transfers
+from .etags import transaction_etag, user_etag, wallet_etag
+from .idempotency import idempotent
+from .pagination import ChatMessageCursorPagination, ChatSessionPagination, TransactionCursorPagination
+from .chat_context import ConversationContext
+from . import metrics
+from django.conf import settings
 
 
 def send_verification_email(user, request):
@@ -28,7 +51,9 @@ def send_verification_email(user, request):
     )
     subject = 'Verify your email'
     message = f'Click the link to verify your email: {verify_url}'
-    send_mail(subject, message, 'rehubdevelopers@gmail.com', [user.email])
+    # Queued, not sent: the send_outbox worker delivers it so signup never
+    # waits on (or fails because of) the SMTP server.
+    enqueue_email(subject, message, 'rehubdevelopers@gmail.com', [user.email])
 
 class VerifyEmailView(APIView):
     permission_classes = [AllowAny]
@@ -82,9 +107,36 @@ class LoginView(generics.GenericAPIView):
         }, status=status.HTTP_200_OK)
 
 
+class BulkProvisionView(APIView):
+    """
+    Staff-only: create up to BulkProvisionSerializer.MAX_USERS verified
+    users and their wallets in one request (see provisioning.py). Passwords
+    are hashed in this process; larger imports go through the
+    ``provision_users`` command, which hashes them in a process pool.
+    """
+    permission_classes = [IsAdminUser]
+
+    def post(self, request):
+        serializer = BulkProvisionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            created = provisioning.provision_users(serializer.validated_data['users'], workers=1)
+        except IntegrityError:
+            # An account with one of the emails was created after validation.
+            return Response(
+                {'error': 'A user with one of these emails already exists; nothing was provisioned.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        return Response({
+            'created': len(created),
+            'users': [{'email': email, 'wallet_number': number} for email, number in created],
+        }, status=status.HTTP_201_CREATED)
+
+
 class UserInfoView(APIView):
     permission_classes = [IsAuthenticated]
 
+    @method_decorator(condition(etag_func=user_etag))
     def get(self, request):
         serializer = UserInfoSerializer(request.user)
         return Response(serializer.data, status=status.HTTP_200_OK)
@@ -92,6 +144,7 @@ class UserInfoView(APIView):
 class WalletInfoView(APIView):
     permission_classes = [IsAuthenticated]
 
+    @method_decorator(condition(etag_func=wallet_etag))
     def get(self, request):
         wallet = request.user.wallet
         serializer = WalletSerializer(wallet)
@@ -100,19 +153,21 @@ class WalletInfoView(APIView):
 class DepositView(APIView):
     permission_classes = [IsAuthenticated]
 
+    @idempotent
     def post(self, request):
         serializer = DepositSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         amount = serializer.validated_data['amount']
-        wallet = request.user.wallet
-        wallet.balance += amount
-        wallet.save()
-        return Response({'message': f'Deposited {amount} successfully.', 'balance': wallet.balance}, status=status.HTTP_200_OK)
+        try:
+            balance = transfers.deposit(request.user, amount)
+        except transfers.TransferError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'message': f'Deposited {amount} successfully.', 'balance': balance}, status=status.HTTP_200_OK)
 
 class TransferView(APIView):
     permission_classes = [IsAuthenticated]
 
-    @transaction.atomic
+    @idempotent
     def post(self, request):
         serializer = TransferSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
@@ -123,15 +178,11 @@ class TransferView(APIView):
         description = serializer.validated_data.get('description', '')
         pin = serializer.validated_data.get('pin', None)
 
-        sender_wallet = request.user.wallet
-
         if step == 'verify':
-            try:
-                recipient_wallet = Wallet.objects.get(wallet_number=recipient_wallet_number)
-                recipient_user = recipient_wallet.user
-                return Response({'recipient_name': recipient_user.full_name}, status=status.HTTP_200_OK)
-            except Wallet.DoesNotExist:
+            recipient = recipients.resolve(recipient_wallet_number)
+            if recipient is None:
                 return Response({'error': 'Recipient wallet not found.'}, status=status.HTTP_404_NOT_FOUND)
+            return Response({'recipient_name': recipient['full_name']}, status=status.HTTP_200_OK)
 
         elif step == 'transfer':
             if pin is None:
@@ -140,33 +191,17 @@ class TransferView(APIView):
             if pin != request.user.pin:
                 return Response({'error': 'Invalid PIN.'}, status=status.HTTP_403_FORBIDDEN)
 
-            if sender_wallet.balance < amount:
-                return Response({'error': 'Insufficient balance.'}, status=status.HTTP_400_BAD_REQUEST)
-
             try:
-                recipient_wallet = Wallet.objects.select_for_update().get(wallet_number=recipient_wallet_number)
-                recipient_user = recipient_wallet.user
-            except Wallet.DoesNotExist:
-                return Response({'error': 'Recipient wallet not found.'}, status=status.HTTP_404_NOT_FOUND)
-
-            sender_wallet.balance -= amount
-            recipient_wallet.balance += amount
-            sender_wallet.save()
-            recipient_wallet.save()
-
-            transaction = Transaction.objects.create(
-                sender=request.user,
-                receiver=recipient_user,
-                amount=amount,
-                receiver_name=recipient_user.full_name,
-                receiver_account_number=recipient_wallet.wallet_number,
-                description=description,
-            )
+                transaction, balance = transfers.transfer(request.user, recipient_wallet_number, amount, description)
+            except transfers.RecipientNotFound as e:
+                return Response({'error': str(e)}, status=status.HTTP_404_NOT_FOUND)
+            except transfers.TransferError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
             return Response({
-                'message': f'Transferred {amount} to {recipient_user.full_name} ({recipient_wallet_number}) successfully.',
-                'balance': sender_wallet.balance,
-                'recipient_name': recipient_user.full_name,
+                'message': f'Transferred {amount} to {transaction.receiver_name} ({recipient_wallet_number}) successfully.',
+                'balance': balance,
+                'recipient_name': transaction.receiver_name,
                 'transaction_id': transaction.transaction_id,
                 'amount': amount,
                 'timestamp': transaction.timestamp
@@ -175,34 +210,224 @@ class TransferView(APIView):
         else:
             return Response({'error': 'Invalid step parameter.'}, status=status.HTTP_400_BAD_REQUEST)
 
+class BulkTransferView(APIView):
+    """
+    Pay many recipients in one request. Only business accounts may use it.
+    Nothing is sent unless every item is valid and the balance covers the
+    total; the response reports the outcome of each item.
+    """
+    permission_classes = [IsAuthenticated]
+
+    @idempotent
+    def post(self, request):
+        if request.user.business_type != 'business':
+            return Response({'error': 'Bulk transfers are only available to business accounts.'}, status=status.HTTP_403_FORBIDDEN)
+
+        serializer = BulkTransferSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        if serializer.validated_data['pin'] != request.user.pin:
+            return Response({'error': 'Invalid PIN.'}, status=status.HTTP_403_FORBIDDEN)
+
+        items = serializer.validated_data['transfers']
+        total = sum(item['amount'] for item in items)
+        try:
+            results, balance = transfers.bulk_transfer(request.user, items)
+        except transfers.BulkTransferRejected as e:
+            return Response({'error': str(e), 'results': e.results}, status=status.HTTP_400_BAD_REQUEST)
+        except transfers.TransferError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response({
+            'message': f'Transferred {total} to {len(items)} recipients successfully.',
+            'balance': balance,
+            'count': len(items),
+            'total': total,
+            'results': results,
+        }, status=status.HTTP_200_OK)
+
+
+def rows_response(view, rows, *extra):
+    """
+    ``ListAPIView.list()`` for a view whose ``serializer_class`` has a
+    RowSerializer: the page is fetched as ``.values()`` rows (with the
+    ``extra`` columns its paginator needs) and serialized without model
+    instances.
+    """
+    queryset = rows.values(view.filter_queryset(view.get_queryset()), *extra)
+    page = view.paginate_queryset(queryset)
+    if page is not None:
+        return view.get_paginated_response(rows.many(page))
+    return Response(rows.many(queryset))
+
+
 class TransactionListView(generics.ListAPIView):
     serializer_class = TransactionSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = TransactionCursorPagination
 
     def get_queryset(self):
         user = self.request.user
         transaction_type = self.request.query_params.get('type', None)
+        direction = transaction_type if transaction_type in ['incoming', 'outgoing'] else None
 
-        queryset = Transaction.objects.filter(Q(sender=user) | Q(receiver=user)).order_by('-timestamp')
+        before, limit = self.paginator.get_window(self.request)
+        return Transaction.objects.annotate_for(user).involving(user, direction=direction, before=before, limit=limit)
 
-        if transaction_type in ['incoming', 'outgoing']:
-            queryset = queryset.filter(transaction_type=transaction_type)
+    def list(self, request, *args, **kwargs):
+        return rows_response(self, TRANSACTION_ROWS, 'id', 'timestamp')
+        
 
-        return queryset
+class StatementExportView(APIView):
+    """
+    Stream the user's transactions between two dates (inclusive) as CSV or
+    NDJSON, e.g. ``?start=2025-01-01&end=2025-03-31&export_format=csv``.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        serializer = StatementExportSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        params = serializer.validated_data
+
+        start = timezone.make_aware(datetime.combine(params['start'], time.min))
+        end = timezone.make_aware(datetime.combine(params['end'] + timedelta(days=1), time.min))
+        content_type, encode = statements.FORMATS[params['export_format']]
+        rows = statements.statement_rows(request.user, start, end, direction=params.get('type'))
+
+        response = StreamingHttpResponse(encode(rows), content_type=content_type)
+        filename = f"statement-{params['start']}-{params['end']}.{params['export_format']}"
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+
+class TransactionSummaryView(APIView):
+    """
+    Incoming, outgoing and deposit totals and counts per month (or day),
+    read from the daily rollups rather than the transactions themselves.
+    Defaults to the last year.
+    """
+    permission_classes = [IsAuthenticated]
+    directions = [choice for choice, _ in DailyTransactionRollup.DIRECTION_CHOICES]
+
+    def get(self, request):
+        serializer = TransactionSummarySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        params = serializer.validated_data
+        end = params.get('end') or timezone.localdate()
+        start = params.get('start') or end - timedelta(days=365)
+        by_month = params['group_by'] == 'month'
+
+        rows = (
+            DailyTransactionRollup.objects
+            .filter(user=request.user, day__gte=start, day__lte=end)
+            .annotate(period=TruncMonth('day') if by_month else F('day'))
+            .values('period', 'direction')
+            .annotate(total=Sum('total'), count=Sum('count'))
+            .order_by('period')
+        )
+
+        def empty():
+            return {direction: {'total': Decimal('0.00'), 'count': 0} for direction in self.directions}
+
+        totals = empty()
+        periods = {}
+        for row in rows:
+            label = row['period'].strftime('%Y-%m') if by_month else row['period'].isoformat()
+            bucket = periods.setdefault(label, empty())[row['direction']]
+            bucket['total'] += row['total']
+            bucket['count'] += row['count']
+            totals[row['direction']]['total'] += row['total']
+            totals[row['direction']]['count'] += row['count']
+
+        return Response({
+            'start': start,
+            'end': end,
+            'group_by': params['group_by'],
+            'totals': totals,
+            'periods': [dict(period=label, **values) for label, values in periods.items()],
+        }, status=status.HTTP_200_OK)
+
+
+class TransactionArchiveView(APIView):
+    """
+    Transactions moved to cold storage by ``archive_transactions``. Without
+    ``month`` lists the archived months; with ``month=YYYY-MM`` returns that
+    month's transactions, newest first, in the transaction list's shape,
+    ``limit`` at a time from ``offset``.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        serializer = TransactionArchiveSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        params = serializer.validated_data
+
+        if 'month' not in params:
+            return Response({
+                'months': [{'month': month.strftime('%Y-%m'), 'count': count} for month, count in archive.months(request.user)],
+            }, status=status.HTTP_200_OK)
+
+        rows = archive.read(request.user, params['month'])
+        if rows is None:
+            return Response({'error': 'No archived transactions for that month.'}, status=status.HTTP_404_NOT_FOUND)
+        if 'type' in params:
+            rows = [row for row in rows if row['transaction_direction'] == params['type']]
+        offset, limit = params['offset'], params['limit']
+        return Response({
+            'month': params['month'].strftime('%Y-%m'),
+            'count': len(rows),
+            'next_offset': offset + limit if offset + limit < len(rows) else None,
+            'results': rows[offset:offset + limit],
+        }, status=status.HTTP_200_OK)
+
+
+class SearchView(APIView):
+    """
+    Full-text search over the user's transactions (description and
+    recipient name) and chat messages, best match first (see search.py).
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        serializer = SearchSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        params = serializer.validated_data
+        page, page_size = params['page'], params['page_size']
+
+        results = search.search(
+            request.user, params['q'], kind=params.get('type'),
+            limit=page_size + 1, offset=(page - 1) * page_size,
+        )
+        return Response({
+            'query': params['q'],
+            'page': page,
+            'next_page': page + 1 if len(results) > page_size else None,
+            'results': results[:page_size],
+        }, status=status.HTTP_200_OK)
 
-    def get_serializer(self, *args, **kwargs):
-        kwargs['context'] = self.get_serializer_context()
-        return self.serializer_class(*args, **kwargs)
-        
 
 class TransactionDetailView(generics.RetrieveAPIView):
     serializer_class = TransactionSerializer
     permission_classes = [IsAuthenticated]
     lookup_field = 'transaction_id'
 
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        etag = quote_etag(transaction_etag(request.user, instance))
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = Response(self.get_serializer(instance).data)
+        response.headers['ETag'] = etag
+        return response
+
     def get_queryset(self):
         user = self.request.user
-        return Transaction.objects.filter(Q(sender=user) | Q(receiver=user))
+        return (
+            Transaction.objects.annotate_for(user)
+            .filter(Q(sender=user) | Q(receiver=user))
+            .annotate(sender_version=F('sender__version'), receiver_version=F('receiver__version'))
+        )
 
 class ChatBotView(APIView):
     permission_classes = [IsAuthenticated]
@@ -268,6 +493,25 @@ You are a patient, smart, and kind assistant. Your job is not just to inform—b
 
     OPENROUTER_API_KEY = ""
     OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
+    MODEL = "deepseek/deepseek-r1:free"
+
+    @classmethod
+    def build_payload(cls, history):
+        messages = [{"role": "system", "content": cls.system_prompt}]
+        for msg in history:
+            messages.append({"role": msg["role"], "content": msg["content"]})
+        return {
+            "model": cls.MODEL,
+            "messages": messages,
+            "stream": False
+        }
+
+    @classmethod
+    def build_headers(cls):
+        return {
+            "Authorization": f"Bearer {cls.OPENROUTER_API_KEY}",
+            "Content-Type": "application/json"
+        }
 
     def post(self, request):
         serializer = ChatPromptSerializer(data=request.data)
@@ -290,30 +534,38 @@ You are a patient, smart, and kind assistant. Your job is not just to inform—b
         ChatMessage.objects.create(chat_session=chat_session, role='user', content=prompt)
 
         # Build messages list for API call
-        messages = [{"role": "system", "content": self.system_prompt}]
-        previous_messages = chat_session.messages.order_by('timestamp')
-        for msg in previous_messages:
-            messages.append({"role": msg.role, "content": msg.content})
-
-        payload = {
-            "model": "deepseek/deepseek-r1:free",
-            "messages": messages,
-            "stream": False
-        }
-
-        headers = {
-            "Authorization": f"Bearer {self.OPENROUTER_API_KEY}",
-            "Content-Type": "application/json"
-        }
+        history = ConversationContext(chat_session, self.system_prompt).history()
+        payload = self.build_payload(history)
+        headers = self.build_headers()
+
+        # First turns with no other context can be answered from the reply cache.
+        cache_key = reply_cache.key_for(payload)
+        cached_reply = reply_cache.lookup(cache_key)
+        if cached_reply is not None:
+            ChatMessage.objects.create(chat_session=chat_session, role='assistant', content=cached_reply)
+
+        if serializer.validated_data.get("stream"):
+            if cached_reply is not None:
+                events = replay_reply(chat_session, cached_reply)
+            else:
+                events = self.stream_reply(chat_session, headers, payload, cache_key)
+            response = StreamingHttpResponse(events, content_type='text/event-stream')
+            response['Cache-Control'] = 'no-cache'
+            response['X-Accel-Buffering'] = 'no'
+            return response
+
+        if cached_reply is not None:
+            return Response({
+                "reply": cached_reply,
+                "session_id": str(chat_session.session_id)
+            })
 
         try:
-            response = requests.post(self.OPENROUTER_URL, headers=headers, json=payload, timeout=30)
-            response.raise_for_status()
-            data = response.json()
-            assistant_reply = data["choices"][0]["message"]["content"]
+            assistant_reply = chat_completion(self.OPENROUTER_URL, headers, payload, timeout=30)
 
             # Save assistant reply
             ChatMessage.objects.create(chat_session=chat_session, role='assistant', content=assistant_reply)
+            reply_cache.store(cache_key, assistant_reply)
 
             return Response({
                 "reply": assistant_reply,
@@ -322,13 +574,183 @@ You are a patient, smart, and kind assistant. Your job is not just to inform—b
         except requests.RequestException as e:
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-class ChatSessionListView(APIView):
+    def stream_reply(self, chat_session, headers, payload, cache_key=None):
+        """
+        Relay tokens to the client as Server-Sent Events as they arrive from
+        OpenRouter, then save the assistant message once the stream ends.
+        """
+        session_id = str(chat_session.session_id)
+        yield sse_event({"session_id": session_id}, event="session")
+
+        tokens = []
+        try:
+            for token in stream_chat_completion(self.OPENROUTER_URL, headers, payload, timeout=30):
+                tokens.append(token)
+                yield sse_event({"token": token})
+        except requests.RequestException as e:
+            yield sse_event({"error": str(e)}, event="error")
+            return
+
+        assistant_reply = "".join(tokens)
+        ChatMessage.objects.create(chat_session=chat_session, role='assistant', content=assistant_reply)
+        reply_cache.store(cache_key, assistant_reply)
+        yield sse_event({"session_id": session_id}, event="done")
+
+
+def replay_reply(chat_session, reply):
+    """The Server-Sent Events of a streamed reply, for one that is already known."""
+    session_id = str(chat_session.session_id)
+    yield sse_event({"session_id": session_id}, event="session")
+    yield sse_event({"token": reply})
+    yield sse_event({"session_id": session_id}, event="done")
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class AsyncChatBotView(View):
+    """
+    Async twin of ChatBotView for deployments served through backend/asgi.py.
+
+    The LLM round-trip runs on the event loop over the shared pooled httpx
+    client, so a worker is not tied up while the model is thinking. DRF
+    views are sync-only, so JWT auth and validation are done by hand here
+    with the same classes ChatBotView uses.
+    """
+    authenticator = CachedJWTAuthentication()
+
+    def authenticate(self, request):
+        """The request's user, or None without credentials; raises AuthenticationFailed for bad ones."""
+        result = self.authenticator.authenticate(request)
+        return result[0] if result else None
+
+    def unauthorized(self, request, detail):
+        # The body and header DRF's exception handler would send.
+        response = JsonResponse(detail if isinstance(detail, dict) else {"detail": detail}, status=status.HTTP_401_UNAUTHORIZED)
+        response['WWW-Authenticate'] = self.authenticator.authenticate_header(request)
+        return response
+
+    async def post(self, request):
+        try:
+            user = await sync_to_async(self.authenticate)(request)
+        except AuthenticationFailed as e:
+            return self.unauthorized(request, e.detail)
+        if user is None:
+            return self.unauthorized(request, "Authentication credentials were not provided.")
+
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError:
+            return JsonResponse({"error": "Invalid JSON body."}, status=status.HTTP_400_BAD_REQUEST)
+        serializer = ChatPromptSerializer(data=data)
+        if not serializer.is_valid():
+            return JsonResponse(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        prompt = serializer.validated_data.get("prompt")
+        session_id = serializer.validated_data.get("session_id", None)
+
+        if session_id:
+            try:
+                chat_session = await ChatSession.objects.aget(session_id=session_id, user=user)
+            except ChatSession.DoesNotExist:
+                return JsonResponse({"error": "Chat session not found."}, status=status.HTTP_404_NOT_FOUND)
+        else:
+            chat_session = await ChatSession.objects.acreate(user=user)
+
+        await ChatMessage.objects.acreate(chat_session=chat_session, role='user', content=prompt)
+
+        context = ConversationContext(chat_session, ChatBotView.system_prompt)
+        history = await sync_to_async(context.history)()
+        payload = ChatBotView.build_payload(history)
+        headers = ChatBotView.build_headers()
+
+        cache_key = reply_cache.key_for(payload)
+        cached_reply = await reply_cache.alookup(cache_key)
+        if cached_reply is not None:
+            await ChatMessage.objects.acreate(chat_session=chat_session, role='assistant', content=cached_reply)
+
+        if serializer.validated_data.get("stream"):
+            if cached_reply is not None:
+                events = areplay_reply(chat_session, cached_reply)
+            else:
+                events = self.stream_reply(chat_session, headers, payload, cache_key)
+            response = StreamingHttpResponse(events, content_type='text/event-stream')
+            response['Cache-Control'] = 'no-cache'
+            response['X-Accel-Buffering'] = 'no'
+            return response
+
+        if cached_reply is not None:
+            assistant_reply = cached_reply
+        else:
+            try:
+                assistant_reply = await achat_completion(ChatBotView.OPENROUTER_URL, headers, payload, timeout=30)
+            except httpx.HTTPError as e:
+                return JsonResponse({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+            await ChatMessage.objects.acreate(chat_session=chat_session, role='assistant', content=assistant_reply)
+            await reply_cache.astore(cache_key, assistant_reply)
+        return JsonResponse({
+            "reply": assistant_reply,
+            "session_id": str(chat_session.session_id)
+        })
+
+    async def stream_reply(self, chat_session, headers, payload, cache_key=None):
+        session_id = str(chat_session.session_id)
+        yield sse_event({"session_id": session_id}, event="session")
+
+        tokens = []
+        try:
+            async for token in astream_chat_completion(ChatBotView.OPENROUTER_URL, headers, payload, timeout=30):
+                tokens.append(token)
+                yield sse_event({"token": token})
+        except httpx.HTTPError as e:
+            yield sse_event({"error": str(e)}, event="error")
+            return
+
+        assistant_reply = "".join(tokens)
+        await ChatMessage.objects.acreate(chat_session=chat_session, role='assistant', content=assistant_reply)
+        await reply_cache.astore(cache_key, assistant_reply)
+        yield sse_event({"session_id": session_id}, event="done")
+
+
+async def areplay_reply(chat_session, reply):
+    for event in replay_reply(chat_session, reply):
+        yield event
+
+
+class ChatSessionListView(generics.ListAPIView):
+    serializer_class = ChatSessionOverviewSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = ChatSessionPagination
 
-    def get(self, request):
-        user = request.user
-        chat_sessions = ChatSession.objects.filter(user=user).order_by('-updated_at')
-        serializer = ChatSessionSerializer(chat_sessions, many=True)
-        return Response(serializer.data)
-    
+    def get_queryset(self):
+        user = self.request.user
+        return ChatSession.objects.filter(user=user).with_overview().order_by('-updated_at', '-id')
 
+    def list(self, request, *args, **kwargs):
+        return rows_response(self, CHAT_SESSION_OVERVIEW_ROWS)
+
+class ChatMessageListView(generics.ListAPIView):
+    serializer_class = ChatMessageSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = ChatMessageCursorPagination
+
+    def get_queryset(self):
+        chat_session = get_object_or_404(ChatSession, session_id=self.kwargs['session_id'], user=self.request.user)
+        return ChatMessage.objects.filter(chat_session=chat_session)
+
+    def list(self, request, *args, **kwargs):
+        return rows_response(self, CHAT_MESSAGE_ROWS, 'id', 'timestamp')
+
+
+class MetricsView(View):
+    """
+    Prometheus scrape endpoint for this process's metrics (see metrics.py).
+    Open to requests carrying ``METRICS_TOKEN`` and to signed-in staff; with
+    no token configured, only to staff.
+    """
+
+    def get(self, request):
+        token = getattr(settings, 'METRICS_TOKEN', '')
+        has_token = bool(token) and request.headers.get('Authorization') == f'Bearer {token}'
+        if not (has_token or request.user.is_staff):
+            return HttpResponse(status=status.HTTP_401_UNAUTHORIZED)
+        return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
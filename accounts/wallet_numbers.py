@@ -0,0 +1,97 @@
+"""
+Wallet number allocation without probing.
+
+Numbers come from a monotonically increasing index (a Postgres sequence, or
+a counter row elsewhere) pushed through a keyed Feistel permutation of
+0..999999. A permutation never maps two indexes to the same number, so no
+``exists()`` check is needed, yet consecutive wallets still get numbers
+that look random. Reserving ``n`` numbers is a single round-trip.
+
+The permutation is keyed by ``WALLET_NUMBER_KEY``, which must never change
+once wallets exist: under a new key the next indexes can map onto numbers
+already issued.
+"""
+import hashlib
+
+from django.conf import settings
+from django.db import connections
+
+from .models import Wallet, WalletNumberCounter
+
+WALLET_NUMBER_DIGITS = 6
+WALLET_NUMBER_SPACE = 10 ** WALLET_NUMBER_DIGITS
+SEQUENCE_NAME = 'accounts_wallet_number_seq'
+
+_HALF = 1000  # 10**6 == 1000 * 1000, so the Feistel halves are 0..999
+_ROUNDS = 4
+
+
+class WalletNumbersExhausted(Exception):
+    pass
+
+
+def _round_keys():
+    secret = settings.WALLET_NUMBER_KEY.encode('utf-8')
+    return [hashlib.blake2b(secret, digest_size=16, person=f'wallet{i}'.encode()).digest() for i in range(_ROUNDS)]
+
+
+_KEYS = None
+
+
+def _round_function(value, key):
+    digest = hashlib.blake2b(value.to_bytes(2, 'big'), key=key, digest_size=4).digest()
+    return int.from_bytes(digest, 'big') % _HALF
+
+
+def permute(index):
+    """Map ``index`` in ``[0, 10**6)`` to a wallet number, bijectively."""
+    global _KEYS
+    if _KEYS is None:
+        _KEYS = _round_keys()
+    left, right = divmod(index, _HALF)
+    for key in _KEYS:
+        left, right = right, (left + _round_function(right, key)) % _HALF
+    return left * _HALF + right
+
+
+def reserve_indexes(count, using='default'):
+    """Reserve ``count`` unused allocator indexes in one statement."""
+    connection = connections[using]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT nextval(%s) FROM generate_series(1, %s)', [SEQUENCE_NAME, count])
+            indexes = [row[0] for row in cursor.fetchall()]
+        else:
+            table = connection.ops.quote_name(WalletNumberCounter._meta.db_table)
+            cursor.execute(
+                f'UPDATE {table} SET next_value = next_value + %s WHERE id = 1 RETURNING next_value',
+                [count],
+            )
+            row = cursor.fetchone()
+            if row is None:
+                raise WalletNumberCounter.DoesNotExist('Wallet number counter row is missing; run migrations.')
+            indexes = list(range(row[0] - count, row[0]))
+    if indexes and indexes[-1] >= WALLET_NUMBER_SPACE:
+        raise WalletNumbersExhausted(f'All {WALLET_NUMBER_SPACE} wallet numbers have been allocated.')
+    return indexes
+
+
+def allocate_wallet_numbers(count, using='default'):
+    """
+    Return ``count`` fresh, distinct six-digit wallet numbers.
+
+    Numbers handed out before this allocator existed were random, so a
+    permuted index can land on one of them; those are filtered out with one
+    batched lookup per reservation and replaced from the next reservation.
+    """
+    numbers = []
+    while len(numbers) < count:
+        indexes = reserve_indexes(count - len(numbers), using=using)
+        candidates = [f'{permute(index):0{WALLET_NUMBER_DIGITS}d}' for index in indexes]
+        taken = set(
+            Wallet.objects.using(using)
+            .filter(wallet_number__in=candidates)
+            .values_list('wallet_number', flat=True)
+        )
+        numbers.extend(number for number in candidates if number not in taken)
+    return numbers
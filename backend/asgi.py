@@ -3,6 +3,11 @@ ASGI config for backend project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+The async chatbot endpoint (``chatbot/async/``) only pays off when served
+from here, e.g.::
+
+    gunicorn backend.asgi:application -k uvicorn.workers.UvicornWorker
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
 """
@@ -13,4 +18,22 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+
+async def application(scope, receive, send):
+    # Django doesn't speak the lifespan protocol; handle it here so the
+    # worker keeps one LLM connection pool and closes it cleanly on shutdown.
+    if scope['type'] == 'lifespan':
+        from accounts.llm import aclose_async_client, keep_async_client
+
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                keep_async_client()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await aclose_async_client()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+    return await django_application(scope, receive, send)
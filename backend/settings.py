@@ -43,11 +43,22 @@ INSTALLED_APPS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'accounts.authentication.CachedJWTAuthentication',
+    ),
+    # orjson-backed when installed, DRF's stdlib JSON otherwise (see accounts/renderers.py)
+    'DEFAULT_RENDERER_CLASSES': (
+        'accounts.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'accounts.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
     ),
 }
 
 MIDDLEWARE = [
+    'accounts.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -98,6 +109,28 @@ DATABASES = {
 
 
 
+# Per-process LRU cache by default; point CACHE_BACKEND/CACHE_LOCATION at a
+# shared backend (e.g. django.core.cache.backends.redis.RedisCache) in
+# production so every worker sees the same entries and invalidations.
+CACHE_BACKEND = config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache')
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': config('CACHE_LOCATION', default='afriflow'),
+    }
+}
+# Chatbot replies to first-turn questions (see accounts/reply_cache.py); kept
+# apart so large replies can't evict the small, hot entries in 'default'.
+CACHES['chat-replies'] = {
+    'BACKEND': CACHE_BACKEND,
+    'LOCATION': config('CHAT_REPLY_CACHE_LOCATION', default='afriflow-chat-replies'),
+}
+if CACHE_BACKEND.endswith('LocMemCache'):
+    CACHES['default']['OPTIONS'] = {'MAX_ENTRIES': config('CACHE_MAX_ENTRIES', default=10000, cast=int)}
+    CACHES['chat-replies']['OPTIONS'] = {'MAX_ENTRIES': config('CHAT_REPLY_CACHE_MAX_ENTRIES', default=1000, cast=int)}
+CHAT_REPLY_CACHE_ALIAS = 'chat-replies'
+CHAT_REPLY_CACHE_TIMEOUT = config('CHAT_REPLY_CACHE_TIMEOUT', default=24 * 60 * 60, cast=int)
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -160,3 +193,33 @@ EMAIL_HOST_USER = config('EMAIL')
 EMAIL_HOST_PASSWORD = config('EMAIL_PASS')  # Replace with your actual app password
 EMAIL_USE_TLS = True
 DEFAULT_FROM_EMAIL = 'Rehub Developers <rehubdevelopers@gmail.com>'
+
+# Chatbot context window (see accounts/chat_context.py)
+CHAT_CONTEXT_TOKEN_BUDGET = config('CHAT_CONTEXT_TOKEN_BUDGET', default=6000, cast=int)
+
+# Idempotency-Key replay window for money-moving endpoints (see accounts/idempotency.py)
+IDEMPOTENCY_KEY_TTL = config('IDEMPOTENCY_KEY_TTL', default=24 * 60 * 60, cast=int)
+
+# Seconds an authenticated user and wallet stay cached (see accounts/authentication.py)
+AUTH_USER_CACHE_TIMEOUT = config('AUTH_USER_CACHE_TIMEOUT', default=60, cast=int)
+# The cache is only used with a shared CACHE_BACKEND (e.g. Redis), since invalidations
+# must reach every worker; set this to use a per-process one when only one process serves requests.
+AUTH_USER_CACHE_SINGLE_PROCESS = config('AUTH_USER_CACHE_SINGLE_PROCESS', default=False, cast=bool)
+
+# Scrapers authenticate to /metrics with "Authorization: Bearer <METRICS_TOKEN>";
+# without a token only signed-in staff can read it (see accounts/views.py MetricsView)
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+
+# Processes hashing passwords in the provision_users command; 0 means one per CPU.
+# The bulk provisioning API always hashes in-process (see accounts/provisioning.py)
+PROVISIONING_WORKERS = config('PROVISIONING_WORKERS', default=0, cast=int) or None
+
+# Transactions older than this many days (from the start of that month) are
+# moved to compressed monthly archives by archive_transactions (see accounts/archive.py).
+# Statement exports and the archive endpoint read archived months too.
+TRANSACTION_ARCHIVE_AFTER_DAYS = config('TRANSACTION_ARCHIVE_AFTER_DAYS', default=400, cast=int)
+
+# Secret key of the permutation that turns the wallet number counter into numbers
+# (see accounts/wallet_numbers.py). Required, and kept apart from SECRET_KEY so that
+# rotating that can't change the numbers issued from then on and collide with old ones.
+WALLET_NUMBER_KEY = config('WALLET_NUMBER_KEY')